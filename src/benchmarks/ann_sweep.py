@@ -0,0 +1,383 @@
+"""Sweep the HNSW and quantization settings of the vector store and plot recall@k against p99 latency and memory."""
+import copy
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+import click
+import matplotlib
+import numpy as np
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient, models
+
+from src.benchmarks.compression_benchmark import build_local_store, get_configs, search_local_store
+from src.benchmarks.utils import exact_top_k, latency_summary, load_or_make_vectors, recall_at_k, save_results
+from src.common.logger import get_logger
+from src.indexer import DB_URL, get_vector_store, params
+from src.indexing.collection_schema import ensure_qdrant_collection
+from src.indexing.compression import get_qdrant_search_params
+from src.indexing.similar_recipes import iter_chunk_vectors
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+LOGGER = get_logger(__file__)
+# Number of points upserted into a Qdrant collection in a single call
+UPSERT_BATCH_SIZE = 1000
+# Maximum time waiting for Qdrant to build the HNSW graph of a collection
+INDEXING_TIMEOUT_SECONDS = 600
+# Size in kilobytes of vectors above which Qdrant builds the HNSW graph of a segment, low so the sweep never
+# measures a full scan of a small collection
+INDEXING_THRESHOLD_KB = 10
+
+
+def export_collection_vectors(
+    backend: str, collection_name: str, output_file: str, vector_name: Optional[str] = None
+) -> str:
+    """Save the chunk vectors of an indexed collection to a .npy file.
+
+    Args:
+        backend (str): vector store of the collection, qdrant or local
+        collection_name (str): name of the collection, e.g., recipies_db
+        output_file (str): .npy file of the (n, dim) vectors
+        vector_name (Optional[str], optional): vector exported from a collection with named vectors.
+            Defaults to None, i.e., the single unnamed vector.
+
+    Returns:
+        str: path of the .npy file
+    """
+    # The vectors are only read, the embeddings model of the vector store is never called
+    embeddings_model = DeterministicFakeEmbedding(size=1)
+    vector_store = get_vector_store(
+        backend=backend,
+        embeddings_model={vector_name: embeddings_model} if vector_name is not None else embeddings_model,
+        retriver_db_name=collection_name,
+        read_only=True,
+    )
+    vectors = np.concatenate([batch for _, batch in iter_chunk_vectors(vector_store, vector_name)])
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    np.save(output_file, vectors)
+    LOGGER.info("Exported the vectors of the collection", collection=collection_name, shape=vectors.shape)
+    return output_file
+
+
+def qdrant_bytes_per_vector(dim: int, m: int, compression: dict, on_disk_vectors: bool) -> float:
+    """Estimated RAM per point of a Qdrant collection: original and quantized vectors and level 0 HNSW links"""
+    quantization = compression.get("quantization", "none")
+    nbytes = 0 if on_disk_vectors and quantization != "none" else 4 * dim
+    if quantization == "scalar":
+        nbytes += dim
+    elif quantization == "product":
+        nbytes += 4 * dim / int(compression["product_compression"].lstrip("x"))
+    # A node has up to 2 * m neighbors of 4 bytes on level 0, the upper levels hold a vanishing fraction of the nodes
+    return nbytes + 8 * m
+
+
+def build_qdrant_collection(
+    client: QdrantClient, collection_name: str, corpus: np.ndarray, m: int, ef_construct: int, compression: dict
+) -> None:
+    """Create a Qdrant collection with the HNSW and quantization settings, upsert the corpus and wait for the graph"""
+    config = copy.deepcopy(params["vector_store"])
+    config["hnsw"].update({"m": m, "ef_construct": ef_construct})
+    config["compression"] = compression
+    config["payload_indexes"], config["payload_range_indexes"] = [], []
+    client.delete_collection(collection_name)
+    ensure_qdrant_collection(client, collection_name, vector_size=corpus.shape[1], config=config)
+    client.update_collection(
+        collection_name, optimizers_config=models.OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD_KB)
+    )
+    for start in range(0, len(corpus), UPSERT_BATCH_SIZE):
+        end = start + UPSERT_BATCH_SIZE
+        client.upsert(
+            collection_name,
+            points=models.Batch(ids=list(range(start, min(end, len(corpus)))), vectors=corpus[start:end].tolist()),
+            wait=True,
+        )
+    deadline = time.monotonic() + INDEXING_TIMEOUT_SECONDS
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Qdrant did not index the collection {collection_name} in {INDEXING_TIMEOUT_SECONDS}s")
+        time.sleep(0.5)
+
+
+def search_qdrant(client: QdrantClient, collection_name: str, queries: np.ndarray, k: int, compression: dict, ef: int):
+    """Corpus rows found by the Qdrant search of each query and the latency of each search"""
+    search_params = get_qdrant_search_params(compression, hnsw_ef=ef)
+    found, latencies_ms = [], []
+    for query in queries:
+        start = time.perf_counter()
+        points = client.search(collection_name, query_vector=query.tolist(), limit=k, search_params=search_params)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        found.append([int(point.id) for point in points])
+    return found, latencies_ms
+
+
+def sweep_local(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    k: int,
+    m_values: list[int],
+    ef_construct_values: list[int],
+    ef_values: list[int],
+    compressions: list[str],
+    oversampling: float,
+    directory: str,
+) -> list[dict]:
+    """Recall, latency and memory of the local vector store for every combination of the settings"""
+    configs = {config["name"]: config for config in get_configs(corpus.shape[1])}
+    results = []
+    for m, ef_construct, compression in itertools.product(m_values, ef_construct_values, compressions):
+        build_directory = tempfile.mkdtemp(dir=directory)
+        start = time.perf_counter()
+        store = build_local_store(configs[compression], corpus, oversampling, build_directory, m, ef_construct)
+        build_seconds = time.perf_counter() - start
+        bytes_per_vector = store.index_nbytes / max(store.count, 1)
+        for ef in ef_values:
+            found, latencies_ms = search_local_store(store, queries, k, ef=ef)
+            results.append(
+                {
+                    "m": m,
+                    "ef_construct": ef_construct,
+                    "ef": ef,
+                    "quantization": compression,
+                    "build_s": round(build_seconds, 2),
+                    "memory_mb_per_million": round(bytes_per_vector, 1),
+                    f"recall@{k}": recall_at_k(found, truth, k),
+                    **latency_summary(latencies_ms),
+                }
+            )
+        store.close()
+        shutil.rmtree(build_directory, ignore_errors=True)
+    return results
+
+
+def sweep_qdrant(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    k: int,
+    m_values: list[int],
+    ef_construct_values: list[int],
+    ef_values: list[int],
+    quantizations: list[str],
+) -> list[dict]:
+    """Recall, latency and estimated memory of temporary Qdrant collections for every combination of the settings"""
+    config = params["vector_store"]
+    client = QdrantClient(url=DB_URL, prefer_grpc=False)
+    collection_name = f"ann_sweep_{os.getpid()}"
+    results = []
+    try:
+        for m, ef_construct, quantization in itertools.product(m_values, ef_construct_values, quantizations):
+            compression = {**config["compression"], "quantization": quantization}
+            start = time.perf_counter()
+            build_qdrant_collection(client, collection_name, corpus, m, ef_construct, compression)
+            build_seconds = time.perf_counter() - start
+            bytes_per_vector = qdrant_bytes_per_vector(corpus.shape[1], m, compression, config["on_disk_vectors"])
+            for ef in ef_values:
+                found, latencies_ms = search_qdrant(client, collection_name, queries, k, compression, ef)
+                results.append(
+                    {
+                        "m": m,
+                        "ef_construct": ef_construct,
+                        "ef": ef,
+                        "quantization": quantization,
+                        "build_s": round(build_seconds, 2),
+                        "memory_mb_per_million": round(bytes_per_vector, 1),
+                        f"recall@{k}": recall_at_k(found, truth, k),
+                        **latency_summary(latencies_ms),
+                    }
+                )
+    finally:
+        client.delete_collection(collection_name)
+    return results
+
+
+def plot_sweep(results: list[dict], k: int, output_file: str) -> None:
+    """Recall@k against p99 latency and against memory, a row of plots per corpus size and a line per index build.
+
+    Args:
+        results (list[dict]): results of the sweep
+        k (int): number of neighbors of the recall
+        output_file (str): image file of the plots
+    """
+    corpus_sizes = sorted({result["num_vectors"] for result in results})
+    figure, axes = plt.subplots(len(corpus_sizes), 2, figsize=(14, 5 * len(corpus_sizes)), squeeze=False)
+    for row, corpus_size in enumerate(corpus_sizes):
+        builds: dict[tuple, list[dict]] = {}
+        for result in results:
+            if result["num_vectors"] == corpus_size:
+                builds.setdefault((result["m"], result["ef_construct"], result["quantization"]), []).append(result)
+        for (m, ef_construct, quantization), points in builds.items():
+            points.sort(key=lambda result: result["ef"])
+            recalls = [result[f"recall@{k}"] for result in points]
+            label = f"m={m} ef_construct={ef_construct} {quantization}"
+            axes[row, 0].plot([result["p99_ms"] for result in points], recalls, marker="o", label=label)
+            axes[row, 1].scatter([result["memory_mb_per_million"] for result in points], recalls, label=label)
+        axes[row, 0].set(xlabel="p99 latency (ms)", ylabel=f"recall@{k}", title=f"{corpus_size} vectors, ef increasing")
+        axes[row, 1].set(xlabel="memory (MB per million vectors)", ylabel=f"recall@{k}", title=f"{corpus_size} vectors")
+        axes[row, 0].legend(fontsize="x-small")
+    figure.tight_layout()
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    figure.savefig(output_file)
+    plt.close(figure)
+
+
+@click.command()
+@click.option("--vectors_file", default=None, type=str, help="Optional .npy file with (n, dim) chunk embeddings")
+@click.option(
+    "--from_collection",
+    default=None,
+    type=click.Choice(["qdrant", "local"]),
+    help="Export the vectors of the indexed collection from this backend first, instead of --vectors_file",
+)
+@click.option(
+    "--retriver_db_name",
+    default=params["embedding_model"]["retriver_db_name"],
+    show_default=True,
+    type=str,
+    help="Collection exported with --from_collection",
+)
+@click.option(
+    "--vector_name",
+    default=None,
+    type=str,
+    help="Named vector exported with --from_collection, for a collection indexed with --vector_names",
+)
+@click.option("--num_vectors", default=10_000, show_default=True, type=int, help="Number of synthetic vectors")
+@click.option("--dim", default=384, show_default=True, type=int, help="Dimension of the synthetic vectors")
+@click.option("--num_queries", default=200, show_default=True, type=int, help="Number of held-out query vectors")
+@click.option(
+    "--corpus_size",
+    default=[],
+    multiple=True,
+    type=int,
+    help="Number of corpus vectors indexed, repeat the option to sweep several sizes. Defaults to all of them",
+)
+@click.option("--k", default=10, show_default=True, type=int, help="Number of neighbors for recall@k")
+@click.option(
+    "--m", "m_values", default=[16, 32], multiple=True, show_default=True, type=int, help="HNSW m, repeat to sweep"
+)
+@click.option(
+    "--ef_construct",
+    "ef_construct_values",
+    default=[100, 200],
+    multiple=True,
+    show_default=True,
+    type=int,
+    help="HNSW ef_construct",
+)
+@click.option(
+    "--ef",
+    "ef_values",
+    default=[16, 32, 64, 128, 256],
+    multiple=True,
+    show_default=True,
+    type=int,
+    help="HNSW search ef, swept without rebuilding the index",
+)
+@click.option(
+    "--quantization",
+    "quantizations",
+    default=[],
+    multiple=True,
+    type=str,
+    help="Compression configs of the compression benchmark for the local target, e.g., int8+rescore, or none, scalar "
+    "and product for the qdrant target. Defaults to float32, float16 and int8+rescore, or none and scalar",
+)
+@click.option(
+    "--target",
+    default="local",
+    show_default=True,
+    type=click.Choice(["local", "qdrant"]),
+    help="local builds local vector stores, qdrant builds temporary collections on the Qdrant server of params.yaml",
+)
+@click.option("--oversampling", default=2.0, show_default=True, type=float, help="Extra candidates for rescoring")
+@click.option(
+    "--output_file",
+    default=os.path.join(os.getenv("LOGS_ROOT", "logs"), "benchmarks", "ann_sweep.json"),
+    show_default=True,
+    type=str,
+    help="Json file to save the results, the plots are saved next to it as a .png file",
+)
+def run_sweep(
+    vectors_file: Optional[str],
+    from_collection: Optional[str],
+    retriver_db_name: str,
+    vector_name: Optional[str],
+    num_vectors: int,
+    dim: int,
+    num_queries: int,
+    corpus_size: list[int],
+    k: int,
+    m_values: list[int],
+    ef_construct_values: list[int],
+    ef_values: list[int],
+    quantizations: list[str],
+    target: str,
+    oversampling: float,
+    output_file: str,
+):
+    """Sweep HNSW m, ef_construct, search ef and quantization against exact brute force top k of held-out queries,
+    to choose the index settings of each corpus size from recall@k, p99 latency and memory.
+
+    Args:
+        vectors_file (Optional[str]): Optional .npy file with (n, dim) chunk embeddings
+        from_collection (Optional[str]): Export the vectors of the indexed collection from this backend first
+        retriver_db_name (str): Collection exported with from_collection
+        vector_name (Optional[str]): Named vector exported with from_collection
+        num_vectors (int): Number of synthetic vectors
+        dim (int): Dimension of the synthetic vectors
+        num_queries (int): Number of held-out query vectors
+        corpus_size (list[int]): Numbers of corpus vectors indexed
+        k (int): Number of neighbors for recall@k
+        m_values (list[int]): HNSW m values
+        ef_construct_values (list[int]): HNSW ef_construct values
+        ef_values (list[int]): HNSW search ef values
+        quantizations (list[str]): Compression configs or Qdrant quantizations
+        target (str): Vector store built for each setting, local or qdrant
+        oversampling (float): Extra candidates for rescoring
+        output_file (str): Json file to save the results
+    """
+    if from_collection is not None:
+        vectors_file = export_collection_vectors(
+            from_collection,
+            retriver_db_name,
+            os.path.join(os.getenv("DATA_ROOT"), "benchmarks", "vectors.npy"),
+            vector_name=vector_name,
+        )
+    corpus, queries = load_or_make_vectors(vectors_file, num_vectors, dim, num_queries)
+    if target == "local":
+        quantizations = quantizations or ["float32", "float16", "int8+rescore"]
+        unknown = set(quantizations) - {config["name"] for config in get_configs(corpus.shape[1])}
+    else:
+        quantizations = quantizations or ["none", "scalar"]
+        unknown = set(quantizations) - {"none", "scalar", "product"}
+    if len(unknown) > 0:
+        raise click.BadParameter(f"Unknown quantization {sorted(unknown)} for the {target} target")
+    directory = tempfile.mkdtemp(prefix="ann_sweep_")
+    results = []
+    try:
+        for size in sorted(corpus_size or [len(corpus)]):
+            sub_corpus = corpus[:size]
+            truth = exact_top_k(sub_corpus, queries, k)
+            sweep_args = (sub_corpus, queries, truth, k, m_values, ef_construct_values, ef_values, quantizations)
+            if target == "local":
+                size_results = sweep_local(*sweep_args, oversampling, directory)
+            else:
+                size_results = sweep_qdrant(*sweep_args)
+            for result in size_results:
+                result = {"target": target, "num_vectors": len(sub_corpus), **result}
+                LOGGER.info("Benchmarked an index setting", **result)
+                results.append(result)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    save_results(results, output_file)
+    plot_sweep(results, k, os.path.splitext(output_file)[0] + ".png")
+
+
+if __name__ == "__main__":
+    run_sweep()
@@ -0,0 +1,170 @@
+"""Benchmark the memory, query latency and recall@k of the vector compression options of the local vector store."""
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+import click
+import numpy as np
+
+from src.benchmarks.utils import exact_top_k, latency_summary, load_or_make_vectors, recall_at_k, save_results
+from src.common.logger import get_logger
+from src.indexing.compression import VectorCodec, truncate
+from src.indexing.local_vector_store import LocalVectorStore
+
+LOGGER = get_logger(__file__)
+# Number of vectors added to the local vector store in a single call
+ADD_BATCH_SIZE = 1000
+
+
+def get_configs(dim: int) -> list[dict]:
+    """Compression configs compared against the uncompressed float32 baseline"""
+    return [
+        {"name": "float32", "dtype": "float32", "truncate_dim": None, "rescore": False},
+        {"name": "float16", "dtype": "float16", "truncate_dim": None, "rescore": False},
+        {"name": "int8", "dtype": "int8", "truncate_dim": None, "rescore": False},
+        {"name": "int8+rescore", "dtype": "int8", "truncate_dim": None, "rescore": True},
+        {"name": f"float16@{dim // 2}+rescore", "dtype": "float16", "truncate_dim": dim // 2, "rescore": True},
+        {"name": f"int8@{dim // 2}+rescore", "dtype": "int8", "truncate_dim": dim // 2, "rescore": True},
+        {"name": f"float16@{dim // 4}+rescore", "dtype": "float16", "truncate_dim": dim // 4, "rescore": True},
+    ]
+
+
+def search_exact(config: dict, corpus: np.ndarray, queries: np.ndarray, k: int, oversampling: float):
+    """Brute force search over the compressed vectors, isolating the effect of the compression from the ANN index"""
+    codec = VectorCodec(config["dtype"])
+    codes, scales = codec.encode(truncate(corpus, config["truncate_dim"]))
+    full_vectors = corpus.astype(np.float16) if config["rescore"] else None
+    limit = int(np.ceil(k * oversampling)) if config["rescore"] else k
+    found, latencies_ms = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = codec.decode(codes, scales) @ truncate(query, config["truncate_dim"])
+        candidates = np.argpartition(-scores, limit)[:limit]
+        if full_vectors is not None:
+            candidate_scores = np.asarray(full_vectors[candidates], dtype=np.float32) @ query
+        else:
+            candidate_scores = scores[candidates]
+        top = candidates[np.argsort(-candidate_scores)][:k]
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        found.append(top.tolist())
+    return found, latencies_ms, codec.bytes_per_vector(codes.shape[1])
+
+
+def build_local_store(
+    config: dict, corpus: np.ndarray, oversampling: float, directory: str, m: int = 16, ef_construct: int = 100
+) -> LocalVectorStore:
+    """Local vector store with the compression config and HNSW settings, holding the corpus with its rows as ids"""
+    store = LocalVectorStore(
+        path=directory,
+        collection_name=config["name"].replace("@", "_").replace("+", "_"),
+        read_only=False,
+        m=m,
+        ef_construct=ef_construct,
+        dtype=config["dtype"],
+        truncate_dim=config["truncate_dim"],
+        rescore=config["rescore"],
+        oversampling=oversampling,
+    )
+    for start in range(0, len(corpus), ADD_BATCH_SIZE):
+        end = start + ADD_BATCH_SIZE
+        batch = corpus[start:end]
+        store.add_vectors(
+            batch,
+            payloads=[{"page_content": "", "metadata": {}} for _ in batch],
+            ids=[str(idx) for idx in range(start, start + len(batch))],
+        )
+    return store
+
+
+def search_local_store(store: LocalVectorStore, queries: np.ndarray, k: int, ef: Optional[int] = None):
+    """Corpus rows found by the HNSW search of each query and the latency of each search"""
+    found, latencies_ms = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = store.search_by_vector(query, k=k, ef=ef)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        found.append([int(point_id) for point_id, _, _ in results])
+    return found, latencies_ms
+
+
+def search_hnsw(config: dict, corpus: np.ndarray, queries: np.ndarray, k: int, oversampling: float, directory: str):
+    """Build a local vector store with the config and search it through the HNSW graph"""
+    store = build_local_store(config, corpus, oversampling, directory)
+    found, latencies_ms = search_local_store(store, queries, k)
+    bytes_per_vector = store.index_nbytes / max(store.count, 1)
+    store.close()
+    return found, latencies_ms, bytes_per_vector
+
+
+@click.command()
+@click.option("--vectors_file", default=None, type=str, help="Optional .npy file with (n, dim) chunk embeddings")
+@click.option("--num_vectors", default=20_000, show_default=True, type=int, help="Number of synthetic vectors")
+@click.option("--dim", default=768, show_default=True, type=int, help="Dimension of the synthetic vectors")
+@click.option("--num_queries", default=200, show_default=True, type=int, help="Number of held-out query vectors")
+@click.option("--k", default=10, show_default=True, type=int, help="Number of neighbors for recall@k")
+@click.option("--oversampling", default=2.0, show_default=True, type=float, help="Extra candidates for rescoring")
+@click.option(
+    "--hnsw",
+    is_flag=True,
+    default=False,
+    help="Build a local vector store per config and search its HNSW graph instead of a brute force search",
+)
+@click.option(
+    "--output_file",
+    default=os.path.join(os.getenv("LOGS_ROOT", "logs"), "benchmarks", "compression.json"),
+    show_default=True,
+    type=str,
+    help="Json file to save the results",
+)
+def run_benchmark(
+    vectors_file: Optional[str],
+    num_vectors: int,
+    dim: int,
+    num_queries: int,
+    k: int,
+    oversampling: float,
+    hnsw: bool,
+    output_file: str,
+):
+    """Compare the compression configs on memory per million chunks, query latency and recall@k against float32.
+
+    Args:
+        vectors_file (Optional[str]): Optional .npy file with (n, dim) chunk embeddings
+        num_vectors (int): Number of synthetic vectors
+        dim (int): Dimension of the synthetic vectors
+        num_queries (int): Number of held-out query vectors
+        k (int): Number of neighbors for recall@k
+        oversampling (float): Extra candidates for rescoring
+        hnsw (bool): Search the HNSW graph of a local vector store instead of a brute force search
+        output_file (str): Json file to save the results
+    """
+    corpus, queries = load_or_make_vectors(vectors_file, num_vectors, dim, num_queries)
+    truth = exact_top_k(corpus, queries, k)
+    directory = tempfile.mkdtemp(prefix="compression_benchmark_")
+    results = []
+    try:
+        for config in get_configs(corpus.shape[1]):
+            if hnsw:
+                found, latencies_ms, bytes_per_vector = search_hnsw(config, corpus, queries, k, oversampling, directory)
+            else:
+                found, latencies_ms, bytes_per_vector = search_exact(config, corpus, queries, k, oversampling)
+            result = {
+                **config,
+                "search": "hnsw" if hnsw else "exact",
+                "num_vectors": len(corpus),
+                "memory_mb_per_million": round(bytes_per_vector, 1),
+                "rescore_disk_mb_per_million": round(2 * corpus.shape[1], 1) if config["rescore"] else 0,
+                f"recall@{k}": recall_at_k(found, truth, k),
+                **latency_summary(latencies_ms),
+            }
+            LOGGER.info("Benchmarked a compression config", **result)
+            results.append(result)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    save_results(results, output_file)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,285 @@
+"""Benchmark the indexer end to end on a synthetic recipe corpus with an in-process vector store."""
+import functools
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Optional
+
+import click
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import QdrantClient
+
+from src.benchmarks.utils import latency_summary, peak_rss_mb, save_results, write_synthetic_dataset
+from src.common.logger import get_logger
+from src.indexer import EMBEDDING_CACHE_SIZE, get_embedding_model, load_dataset, params
+from src.indexing.chunk_dedup import DeduplicatingEmbeddings
+from src.indexing.chunking import RecipeChunker
+from src.indexing.collection_schema import ensure_qdrant_collection
+from src.indexing.local_vector_store import LocalVectorStore
+
+LOGGER = get_logger(__file__)
+# Name of the collection created by the benchmark
+COLLECTION_NAME = "indexer_benchmark"
+
+
+class StageTimer:
+    """Accumulate the wall time and number of items of the stages of the indexer"""
+
+    def __init__(self):
+        self.seconds = {}
+        self.items = {}
+        self.calls_ms = {}
+
+    def wrap(self, function: Callable, stage: str, count: Optional[Callable] = None) -> Callable:
+        """Wrap a function to add its wall time and the number of items it returned to a stage.
+
+        Args:
+            function (Callable): function to time
+            stage (str): name of the stage
+            count (Optional[Callable], optional): number of items in the output of the function. Defaults to None.
+
+        Returns:
+            Callable: timed function
+        """
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            output = function(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+            self.calls_ms.setdefault(stage, []).append(elapsed * 1000)
+            if count is not None:
+                self.items[stage] = self.items.get(stage, 0) + count(output)
+            return output
+
+        return timed
+
+
+class TimedEmbeddings(Embeddings):
+    """Embeddings model recording the time of each batch of chunks sent to the wrapped model"""
+
+    def __init__(self, embeddings_model: Embeddings, timer: StageTimer):
+        self.embeddings_model = embeddings_model
+        self._embed_documents = timer.wrap(embeddings_model.embed_documents, "embed", count=len)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings_model.embed_query(text)
+
+
+def get_benchmark_vector_store(backend: str, embeddings_model: Embeddings, vector_size: int, directory: str):
+    """Qdrant in memory or a local vector store in directory, configured as in params.yaml"""
+    config = params["vector_store"]
+    if backend == "local":
+        compression = config["compression"]
+        return LocalVectorStore(
+            path=directory,
+            collection_name=COLLECTION_NAME,
+            embeddings=embeddings_model,
+            read_only=False,
+            dtype=compression["local_dtype"],
+            truncate_dim=compression["truncate_dim"],
+            rescore=compression["rescore"],
+            oversampling=compression["oversampling"],
+            m=config["hnsw"]["m"],
+            ef_construct=config["hnsw"]["ef_construct"],
+            ef_search=config["hnsw"]["ef_search"],
+            payload_indexes=config["payload_indexes"],
+            range_indexes=config["payload_range_indexes"],
+        )
+    client = QdrantClient(location=":memory:")
+    ensure_qdrant_collection(client, collection_name=COLLECTION_NAME, vector_size=vector_size, config=config)
+    return Qdrant(client=client, collection_name=COLLECTION_NAME, embeddings=embeddings_model)
+
+
+def count_points(vector_store: VectorStore) -> int:
+    """Number of chunks saved in the vector store"""
+    if isinstance(vector_store, LocalVectorStore):
+        return vector_store.count
+    return vector_store.client.count(COLLECTION_NAME).count
+
+
+def run_scale(
+    scraped_data_root: str,
+    num_recipes: int,
+    backend: str,
+    embeddings_model: Embeddings,
+    vector_size: int,
+    splitter,
+    seed: int,
+) -> dict:
+    """Index a synthetic dataset of num_recipes recipes and measure the throughput and memory of each stage.
+
+    Args:
+        scraped_data_root (str): directory used as SCRAPED_DATA_ROOT for the synthetic datasets
+        num_recipes (int): number of recipes in the synthetic dataset
+        backend (str): memory for Qdrant in memory or local for the local vector store
+        embeddings_model (Embeddings): model used to embed the chunks
+        vector_size (int): dimension of the embeddings
+        splitter (text_splitter): text splitter or RecipeChunker used to split the recipes into chunks
+        seed (int): random seed of the synthetic corpus
+
+    Returns:
+        dict: benchmark results of the scale
+    """
+    dataset_name = f"synthetic_{num_recipes}"
+    start = time.perf_counter()
+    write_synthetic_dataset(os.path.join(scraped_data_root, dataset_name, "recipes"), num_recipes, seed=seed)
+    generate_seconds = time.perf_counter() - start
+    rss_after_generate = peak_rss_mb()
+
+    timer = StageTimer()
+    # Mirror retriver_entrypoint, identical chunk texts are deduplicated before reaching the embeddings model
+    embeddings = DeduplicatingEmbeddings(TimedEmbeddings(embeddings_model, timer), EMBEDDING_CACHE_SIZE)
+    directory = tempfile.mkdtemp(prefix="indexer_benchmark_")
+    try:
+        vector_store = get_benchmark_vector_store(backend, embeddings, vector_size, directory)
+        vector_store.add_texts = timer.wrap(vector_store.add_texts, "add_texts")
+        splitter.split_documents = timer.wrap(splitter.split_documents, "chunk", count=len)
+        start = time.perf_counter()
+        load_dataset(dataset_name=dataset_name, vector_store=vector_store, splitter=splitter)
+        index_seconds = time.perf_counter() - start
+        del splitter.split_documents
+        num_points = count_points(vector_store)
+        if isinstance(vector_store, LocalVectorStore):
+            vector_store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    embed_seconds = timer.seconds.get("embed", 0.0)
+    chunk_seconds = timer.seconds.get("chunk", 0.0)
+    # The vector stores embed the chunks inside add_texts, the rest of add_texts is the upload
+    upload_seconds = timer.seconds.get("add_texts", 0.0) - embed_seconds
+    num_chunks = timer.items.get("chunk", 0)
+    return {
+        "num_recipes": num_recipes,
+        "backend": backend,
+        "num_chunks": num_chunks,
+        "num_points": num_points,
+        "num_embedded_chunks": timer.items.get("embed", 0),
+        "docs_per_sec": round(num_recipes / index_seconds, 1),
+        "chunks_per_sec": round(num_chunks / index_seconds, 1),
+        "embedding_batches": len(timer.calls_ms.get("embed", [])),
+        "ms_per_embedding_batch": round(float(np.mean(timer.calls_ms.get("embed", [0.0]))), 3),
+        "embedding_batch_latency": latency_summary(timer.calls_ms.get("embed", [0.0])),
+        "upload_ms": round(upload_seconds * 1000, 1),
+        "ms_per_upload_batch": round(upload_seconds * 1000 / max(len(timer.calls_ms.get("add_texts", [])), 1), 3),
+        "stage_seconds": {
+            "generate": round(generate_seconds, 3),
+            "index": round(index_seconds, 3),
+            "read_parse": round(index_seconds - chunk_seconds - embed_seconds - upload_seconds, 3),
+            "chunk": round(chunk_seconds, 3),
+            "embed": round(embed_seconds, 3),
+            "upload": round(upload_seconds, 3),
+        },
+        # The peak resident set size never decreases, so each value is the peak up to the end of the stage
+        "peak_rss_mb": {"generate": rss_after_generate, "index": peak_rss_mb()},
+    }
+
+
+@click.command()
+@click.option(
+    "--num_recipes",
+    default=[10_000],
+    show_default=True,
+    multiple=True,
+    type=int,
+    help="Number of synthetic recipes, repeat the option to benchmark several scales, e.g., 10000 to 1000000",
+)
+@click.option(
+    "--backend",
+    default="memory",
+    show_default=True,
+    type=click.Choice(["memory", "local"]),
+    help="memory indexes into Qdrant in memory mode, local into the embedded local vector store",
+)
+@click.option(
+    "--embedding_model_name",
+    default=None,
+    type=str,
+    help="Hugging face model used to embed the chunks. By default a deterministic hashing embedding isolates the "
+    "rest of the indexer from the model",
+)
+@click.option("--dim", default=768, show_default=True, type=int, help="Dimension of the hashing embeddings")
+@click.option(
+    "--corpus_dir",
+    default=None,
+    type=str,
+    help="Directory to keep the synthetic corpus and reuse it across runs. A temporary directory by default",
+)
+@click.option("--seed", default=0, show_default=True, type=int, help="Random seed of the synthetic corpus")
+@click.option(
+    "--output_file",
+    default=os.path.join(os.getenv("LOGS_ROOT", "logs"), "benchmarks", "indexer.json"),
+    show_default=True,
+    type=str,
+    help="Json file to save the results",
+)
+def run_benchmark(
+    num_recipes: list[int],
+    backend: str,
+    embedding_model_name: Optional[str],
+    dim: int,
+    corpus_dir: Optional[str],
+    seed: int,
+    output_file: str,
+):
+    """Index synthetic recipe corpora with load_dataset and report docs/sec, chunks/sec, ms per embedding batch,
+    upload ms and peak RSS per stage.
+
+    Args:
+        num_recipes (list[int]): Number of synthetic recipes of each benchmarked scale
+        backend (str): Vector store used for indexing, memory or local
+        embedding_model_name (Optional[str]): Hugging face model used to embed the chunks
+        dim (int): Dimension of the hashing embeddings
+        corpus_dir (Optional[str]): Directory to keep the synthetic corpus and reuse it across runs
+        seed (int): Random seed of the synthetic corpus
+        output_file (str): Json file to save the results
+    """
+    embedding_params = params["embedding_model"]
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=embedding_params["chunk_size"], chunk_overlap=embedding_params["chunk_overlap"]
+    )
+    if embedding_model_name is not None:
+        embeddings_model = get_embedding_model(embedding_model_name)
+        if embedding_params["chunking_strategy"] == "recipe_fields":
+            # The chunking summary of each dataset compares the chunks with the character based splitter
+            splitter = RecipeChunker.from_sentence_transformer(
+                embeddings_model.client, fallback_splitter=splitter, compare_splitter=True
+            )
+    else:
+        embeddings_model = DeterministicFakeEmbedding(size=dim)
+    vector_size = len(embeddings_model.embed_query(COLLECTION_NAME))
+
+    scraped_data_root = corpus_dir or tempfile.mkdtemp(prefix="indexer_benchmark_corpus_")
+    # load_dataset reads the datasets from SCRAPED_DATA_ROOT
+    previous_root = os.environ.get("SCRAPED_DATA_ROOT")
+    os.environ["SCRAPED_DATA_ROOT"] = scraped_data_root
+    results = []
+    try:
+        for scale in sorted(num_recipes):
+            result = run_scale(scraped_data_root, scale, backend, embeddings_model, vector_size, splitter, seed)
+            result["embedding_model"] = embedding_model_name or f"hashing_{dim}"
+            LOGGER.info("Benchmarked the indexer", **result)
+            results.append(result)
+    finally:
+        if previous_root is None:
+            os.environ.pop("SCRAPED_DATA_ROOT")
+        else:
+            os.environ["SCRAPED_DATA_ROOT"] = previous_root
+        if corpus_dir is None:
+            shutil.rmtree(scraped_data_root, ignore_errors=True)
+    save_results(results, output_file)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,383 @@
+"""Load test of the retrieval path: replay queries at an open-loop arrival rate or a fixed concurrency."""
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import click
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from src.benchmarks.indexer_benchmark import get_benchmark_vector_store
+from src.benchmarks.utils import latency_summary, make_synthetic_queries, save_results, write_synthetic_dataset
+from src.common.logger import get_logger
+from src.indexer import get_embedding_model, get_vector_store, load_dataset, params
+from src.indexing.local_vector_store import LocalVectorStore
+from src.retriever.cache import RetrieverCache
+from src.retriever.service import RetrievalService, get_search_kwargs
+
+LOGGER = get_logger(__file__)
+# Name of the synthetic dataset indexed for the load test
+DATASET_NAME = "load_test"
+# Maximum number of requests in flight in the open-loop mode, later arrivals queue and their latency grows
+MAX_IN_FLIGHT = 256
+
+
+def load_queries(query_file: Optional[str], num_queries: int, seed: int) -> list[dict]:
+    """Requests replayed by the load test.
+
+    Args:
+        query_file (Optional[str]): text file with a query per line, or jsonl file with query, k, filter and vector
+            per line
+        num_queries (int): number of synthetic queries when no file is given
+        seed (int): random seed of the synthetic queries
+
+    Returns:
+        list[dict]: requests with a query and optionally k, filter and vector
+    """
+    if query_file is None:
+        return [{"query": query} for query in make_synthetic_queries(num_queries, seed)]
+    with open(query_file, "r") as file:
+        lines = [line.strip() for line in file if len(line.strip()) > 0]
+    if query_file.endswith(".jsonl"):
+        return [json.loads(line) for line in lines]
+    return [{"query": line} for line in lines]
+
+
+class RequestTimer:
+    """Time spent embedding the query in the thread of each request, the rest of the request is the search"""
+
+    def __init__(self, embed_query: Callable[[str, Optional[str]], list[float]]):
+        self._embed_query = embed_query
+        self._local = threading.local()
+
+    def embed_query(self, query: str, vector: Optional[str] = None) -> list[float]:
+        start = time.perf_counter()
+        try:
+            return self._embed_query(query, vector)
+        finally:
+            self._local.embed_seconds = getattr(self._local, "embed_seconds", 0.0) + time.perf_counter() - start
+
+    def pop_embed_seconds(self) -> float:
+        """Embedding time of the current request, reset for the next request of the thread"""
+        seconds = getattr(self._local, "embed_seconds", 0.0)
+        self._local.embed_seconds = 0.0
+        return seconds
+
+
+class ServiceTarget:
+    """Send the requests to a retrieval service in the process, recording the embedding time of each request"""
+
+    def __init__(self, service: RetrievalService):
+        self.service = service
+        self.timer = RequestTimer(service.embed_query)
+        service.embed_query = self.timer.embed_query
+
+    def __call__(self, request: dict) -> Optional[float]:
+        """Run a request and return its embedding time in seconds"""
+        self.timer.pop_embed_seconds()
+        self.service.search(
+            request["query"], k=request.get("k"), filter=request.get("filter"), vector=request.get("vector")
+        )
+        return self.timer.pop_embed_seconds()
+
+
+class HTTPTarget:
+    """Send the requests to the /search endpoint of a running retrieval service"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url.rstrip("/") + "/search"
+        self.timeout = timeout
+
+    def __call__(self, request: dict) -> Optional[float]:
+        """Run a request, the embedding time is not visible from the client"""
+        http_request = urllib.request.Request(
+            self.url, data=json.dumps(request).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+            response.read()
+        return None
+
+
+def run_load(
+    target: Callable[[dict], Optional[float]],
+    requests: list[dict],
+    num_requests: int,
+    rate: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    seed: int = 0,
+) -> dict:
+    """Replay requests against a target and summarize the latencies.
+
+    In the open-loop mode requests arrive at exponential intervals of mean 1 / rate irrespective of the responses, and
+    the latency of a request starts at its scheduled arrival, so the time spent queuing behind slow requests counts.
+    In the closed-loop mode concurrency clients send their next request as soon as the previous one completes.
+
+    Args:
+        target (Callable[[dict], Optional[float]]): function running a request and returning its embedding time
+        requests (list[dict]): requests replayed in a loop
+        num_requests (int): number of requests sent
+        rate (Optional[float], optional): arrival rate in requests per second of the open-loop mode. Defaults to None.
+        concurrency (Optional[int], optional): number of clients of the closed-loop mode. Defaults to None.
+        seed (int, optional): random seed of the arrival times. Defaults to 0.
+
+    Returns:
+        dict: throughput, error rate and latency percentiles of the requests, of their embedding and of their search
+    """
+    latencies, embed_latencies, search_latencies = [], [], []
+    errors = []
+    lock = threading.Lock()
+
+    def send(request: dict, scheduled_at: float) -> None:
+        start = time.perf_counter()
+        try:
+            embed_seconds = target(request)
+        except Exception as error:
+            with lock:
+                errors.append(type(error).__name__)
+            return
+        end = time.perf_counter()
+        with lock:
+            latencies.append((end - scheduled_at) * 1000)
+            if embed_seconds is not None:
+                embed_latencies.append(embed_seconds * 1000)
+                search_latencies.append((end - start - embed_seconds) * 1000)
+
+    replayed = itertools.islice(itertools.cycle(requests), num_requests)
+    start = time.perf_counter()
+    if rate is not None:
+        arrivals = start + np.cumsum(np.random.default_rng(seed).exponential(1 / rate, num_requests))
+        with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as executor:
+            for request, arrival in zip(replayed, arrivals.tolist()):
+                time.sleep(max(arrival - time.perf_counter(), 0))
+                executor.submit(send, request, arrival)
+    else:
+        replayed_lock = threading.Lock()
+
+        def client() -> None:
+            while True:
+                with replayed_lock:
+                    request = next(replayed, None)
+                if request is None:
+                    return
+                send(request, time.perf_counter())
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(client)
+    duration = time.perf_counter() - start
+
+    result = {
+        "mode": "open_loop" if rate is not None else "closed_loop",
+        "target_rate": rate,
+        "concurrency": concurrency,
+        "num_requests": num_requests,
+        "num_errors": len(errors),
+        "error_rate": round(len(errors) / max(num_requests, 1), 4),
+        "errors": {name: errors.count(name) for name in sorted(set(errors))},
+        "duration_s": round(duration, 3),
+        "qps": round((num_requests - len(errors)) / duration, 2),
+        "latency": latency_summary(latencies) if len(latencies) > 0 else None,
+    }
+    if len(embed_latencies) > 0:
+        result["embed"] = latency_summary(embed_latencies)
+        result["search"] = latency_summary(search_latencies)
+        total = sum(embed_latencies) + sum(search_latencies)
+        result["embed_share"] = round(sum(embed_latencies) / max(total, 1e-9), 4)
+    return result
+
+
+def build_service(
+    backend: str,
+    use_indexed: bool,
+    embedding_model_name: Optional[str],
+    dim: int,
+    num_recipes: int,
+    cache: bool,
+    directory: str,
+) -> RetrievalService:
+    """Retrieval service over the indexed collection or over a synthetic corpus indexed for the load test"""
+    if embedding_model_name is not None:
+        embeddings_model = get_embedding_model(embedding_model_name)
+    else:
+        embeddings_model = DeterministicFakeEmbedding(size=dim)
+    retriever_params = params["retriever"]
+    if use_indexed:
+        vector_store = get_vector_store(
+            backend=backend,
+            embeddings_model=embeddings_model,
+            retriver_db_name=params["embedding_model"]["retriver_db_name"],
+            read_only=True,
+        )
+    else:
+        # Qdrant in memory stands in for the Qdrant server
+        vector_store = get_benchmark_vector_store(
+            "local" if backend == "local" else "memory",
+            embeddings_model,
+            len(embeddings_model.embed_query(DATASET_NAME)),
+            directory,
+        )
+        os.environ["SCRAPED_DATA_ROOT"] = directory
+        write_synthetic_dataset(os.path.join(directory, DATASET_NAME, "recipes"), num_recipes)
+        embedding_params = params["embedding_model"]
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=embedding_params["chunk_size"], chunk_overlap=embedding_params["chunk_overlap"]
+        )
+        load_dataset(dataset_name=DATASET_NAME, vector_store=vector_store, splitter=splitter)
+        if isinstance(vector_store, LocalVectorStore):
+            vector_store.flush()
+    cache_params = retriever_params["cache"]
+    return RetrievalService(
+        embeddings_model=embeddings_model,
+        vector_store=vector_store,
+        max_batch_size=retriever_params["max_batch_size"],
+        max_wait_ms=retriever_params["max_wait_ms"],
+        default_k=retriever_params["top_k"],
+        search_kwargs=get_search_kwargs("local" if backend == "local" else "qdrant"),
+        cache=(
+            RetrieverCache(
+                embedding_cache_size=cache_params["embedding_cache_size"],
+                result_cache_size=cache_params["result_cache_size"],
+                ttl_seconds=cache_params["ttl_seconds"],
+                bucket_bits=cache_params["bucket_bits"],
+            )
+            if cache
+            else None
+        ),
+    )
+
+
+@click.command()
+@click.option("--query_file", default=None, type=str, help="Text file with a query per line or jsonl file of requests")
+@click.option("--num_queries", default=1000, show_default=True, type=int, help="Number of synthetic queries")
+@click.option("--num_requests", default=2000, show_default=True, type=int, help="Number of requests of each run")
+@click.option(
+    "--rate",
+    default=[],
+    multiple=True,
+    type=float,
+    help="Open-loop arrival rate in requests per second, repeat the option to find where the latency degrades",
+)
+@click.option(
+    "--concurrency",
+    default=[],
+    multiple=True,
+    type=int,
+    help="Number of closed-loop clients, repeat the option to run several levels. 8 if no rate is given",
+)
+@click.option(
+    "--backend",
+    default="memory",
+    show_default=True,
+    type=click.Choice(["memory", "local", "qdrant"]),
+    help="memory for Qdrant in memory mode standing in for the server, local for the local vector store, qdrant for "
+    "the Qdrant server of params.yaml (requires --use_indexed)",
+)
+@click.option(
+    "--use_indexed",
+    is_flag=True,
+    default=False,
+    help="Search the collection built by the indexer instead of a synthetic corpus indexed for the load test",
+)
+@click.option("--num_recipes", default=5000, show_default=True, type=int, help="Number of synthetic recipes")
+@click.option(
+    "--embedding_model_name",
+    default=None,
+    type=str,
+    help="Hugging face model embedding the queries. By default a deterministic hashing embedding",
+)
+@click.option("--dim", default=768, show_default=True, type=int, help="Dimension of the hashing embeddings")
+@click.option("--cache", is_flag=True, default=False, help="Enable the embedding and result caches of the service")
+@click.option("--url", default=None, type=str, help="Url of a running retrieval service to load instead")
+@click.option("--seed", default=0, show_default=True, type=int, help="Random seed of the queries and arrivals")
+@click.option(
+    "--output_file",
+    default=os.path.join(os.getenv("LOGS_ROOT", "logs"), "benchmarks", "load_test.json"),
+    show_default=True,
+    type=str,
+    help="Json file to save the report",
+)
+def run_load_test(
+    query_file: Optional[str],
+    num_queries: int,
+    num_requests: int,
+    rate: list[float],
+    concurrency: list[int],
+    backend: str,
+    use_indexed: bool,
+    num_recipes: int,
+    embedding_model_name: Optional[str],
+    dim: int,
+    cache: bool,
+    url: Optional[str],
+    seed: int,
+    output_file: str,
+):
+    """Replay queries against the retrieval path and report p50/p95/p99 latency, QPS, error rate and the split
+    between embedding and search time for every arrival rate and concurrency.
+
+    Args:
+        query_file (Optional[str]): Text file with a query per line or jsonl file of requests
+        num_queries (int): Number of synthetic queries
+        num_requests (int): Number of requests of each run
+        rate (list[float]): Open-loop arrival rates in requests per second
+        concurrency (list[int]): Numbers of closed-loop clients
+        backend (str): Vector store searched, memory, local or qdrant
+        use_indexed (bool): Search the collection built by the indexer
+        num_recipes (int): Number of synthetic recipes
+        embedding_model_name (Optional[str]): Hugging face model embedding the queries
+        dim (int): Dimension of the hashing embeddings
+        cache (bool): Enable the embedding and result caches of the service
+        url (Optional[str]): Url of a running retrieval service to load instead
+        seed (int): Random seed of the queries and arrivals
+        output_file (str): Json file to save the report
+    """
+    if backend == "qdrant" and not use_indexed and url is None:
+        raise click.BadParameter("The qdrant backend searches the indexed collection, add --use_indexed")
+    requests = load_queries(query_file, num_queries, seed)
+    runs = [{"rate": value} for value in rate] + [{"concurrency": value} for value in concurrency]
+    runs = runs or [{"concurrency": 8}]
+    directory = tempfile.mkdtemp(prefix="load_test_")
+    previous_root = os.environ.get("SCRAPED_DATA_ROOT")
+    service = None
+    try:
+        if url is not None:
+            target = HTTPTarget(url)
+        else:
+            service = build_service(backend, use_indexed, embedding_model_name, dim, num_recipes, cache, directory)
+            target = ServiceTarget(service)
+        config = {
+            "target": url or backend,
+            "use_indexed": use_indexed,
+            "num_recipes": None if use_indexed or url is not None else num_recipes,
+            "embedding_model": embedding_model_name or f"hashing_{dim}",
+            "cache": cache,
+            "num_distinct_queries": len(requests),
+        }
+        results = []
+        for run in runs:
+            result = {**config, **run_load(target, requests, num_requests, seed=seed, **run)}
+            if service is not None:
+                result["service_metrics"] = service.metrics()
+            LOGGER.info("Completed a load test run", **{key: value for key, value in result.items() if key != "errors"})
+            results.append(result)
+    finally:
+        if service is not None:
+            service.close()
+        if previous_root is None:
+            os.environ.pop("SCRAPED_DATA_ROOT", None)
+        else:
+            os.environ["SCRAPED_DATA_ROOT"] = previous_root
+        shutil.rmtree(directory, ignore_errors=True)
+    save_results(results, output_file)
+
+
+if __name__ == "__main__":
+    run_load_test()
@@ -0,0 +1,91 @@
+"""Benchmark the overhead of a log call in the calling thread for the queue and callsite settings of the logger."""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from src.benchmarks.utils import latency_summary, save_results
+from src.common.logger import get_logger, stop_listener
+
+LOGGER = get_logger(__file__)
+# Logger settings compared, the synchronous one with the callsite is the pipeline before the queue was added
+CONFIGS = [
+    {"name": "sync+callsite", "LOG_QUEUE": "false", "LOG_CALLSITE": "true"},
+    {"name": "sync", "LOG_QUEUE": "false", "LOG_CALLSITE": "false"},
+    {"name": "queue+callsite", "LOG_QUEUE": "true", "LOG_CALLSITE": "true"},
+    {"name": "queue", "LOG_QUEUE": "true", "LOG_CALLSITE": "false"},
+]
+
+
+def measure_log_calls(num_calls: int) -> dict:
+    """Time log calls shaped like the scraper ones, then the time taken to write the entries still queued"""
+    logger = get_logger("logging_benchmark", log_file="benchmarks/logging_benchmark")
+    start = time.perf_counter()
+    for _ in range(num_calls // 10):
+        get_logger("logging_benchmark", log_file="benchmarks/logging_benchmark")
+    get_logger_us = (time.perf_counter() - start) * 1e6 / max(num_calls // 10, 1)
+    latencies_us = []
+    start = time.perf_counter()
+    for idx in range(num_calls):
+        call_start = time.perf_counter()
+        logger.info("Could not find recipe name", recipe_url=f"https://www.example.com/recipes/{idx}.html")
+        latencies_us.append((time.perf_counter() - call_start) * 1e6)
+    calls_seconds = time.perf_counter() - start
+    stop_listener()
+    drain_seconds = time.perf_counter() - start - calls_seconds
+    return {
+        "num_calls": num_calls,
+        "mean_call_us": round(sum(latencies_us) / num_calls, 3),
+        **{key.replace("_ms", "_us"): value for key, value in latency_summary(latencies_us).items()},
+        "calls_per_second": round(num_calls / calls_seconds, 1),
+        "drain_s": round(drain_seconds, 3),
+        "get_logger_us": round(get_logger_us, 3),
+    }
+
+
+@click.command()
+@click.option("--num_calls", default=50_000, show_default=True, type=int, help="Number of log calls per setting")
+@click.option("--worker_output", default=None, type=str, hidden=True, help="Measure this process into a json file")
+@click.option(
+    "--output_file",
+    default=os.path.join(os.getenv("LOGS_ROOT", "logs"), "benchmarks", "logging.json"),
+    show_default=True,
+    type=str,
+    help="Json file to save the results",
+)
+def run_benchmark(num_calls: int, worker_output: str, output_file: str):
+    """Compare the per call overhead of logging with and without the queue and the callsite parameters.
+
+    Logging is configured once per process, so every setting is measured in its own process writing to a temporary
+    LOGS_ROOT with the console output discarded.
+
+    Args:
+        num_calls (int): Number of log calls per setting
+        worker_output (str): Measure this process into a json file
+        output_file (str): Json file to save the results
+    """
+    if worker_output is not None:
+        with open(worker_output, "w") as file:
+            json.dump(measure_log_calls(num_calls), file)
+        return
+    results = []
+    with tempfile.TemporaryDirectory(prefix="logging_benchmark_") as directory:
+        for config in CONFIGS:
+            worker_output = os.path.join(directory, f"{config['name']}.json")
+            env = {**os.environ, "LOGS_ROOT": directory, "LOG_QUEUE": config["LOG_QUEUE"]}
+            env["LOG_CALLSITE"] = config["LOG_CALLSITE"]
+            command = [sys.executable, "-m", "src.benchmarks.logging_benchmark", "--num_calls", str(num_calls)]
+            subprocess.run(command + ["--worker_output", worker_output], env=env, stdout=subprocess.DEVNULL, check=True)
+            with open(worker_output, "r") as file:
+                result = {**config, **json.load(file)}
+            LOGGER.info("Benchmarked a logger setting", **result)
+            results.append(result)
+    save_results(results, output_file)
+
+
+if __name__ == "__main__":
+    run_benchmark()
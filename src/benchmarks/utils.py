@@ -0,0 +1,189 @@
+"""util functions common to different benchmarks"""
+import json
+import os
+import resource
+import sys
+from typing import Optional
+
+import numpy as np
+
+from src.indexing.compression import normalize
+
+
+def make_clustered_vectors(num_vectors: int, dim: int, num_clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Normalized random vectors grouped around cluster centers, closer to sentence embeddings than iid noise.
+
+    Args:
+        num_vectors (int): number of vectors
+        dim (int): dimension of the vectors
+        num_clusters (int, optional): number of cluster centers. Defaults to 100.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        np.ndarray: (num_vectors, dim) float32 normalized vectors
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, num_clusters, num_vectors)]
+    vectors += 0.7 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    return normalize(vectors)
+
+
+def load_or_make_vectors(vectors_file: Optional[str], num_vectors: int, dim: int, num_queries: int, seed: int = 0):
+    """Corpus and held-out query vectors from a .npy file of embeddings, or synthetic ones if no file is given.
+
+    Args:
+        vectors_file (Optional[str]): .npy file with (n, dim) embeddings, e.g., exported from the recipies_db collection
+        num_vectors (int): number of synthetic corpus vectors
+        dim (int): dimension of the synthetic vectors
+        num_queries (int): number of query vectors held out from the corpus
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: normalized corpus and query vectors
+    """
+    if vectors_file is not None:
+        vectors = normalize(np.load(vectors_file))
+    else:
+        vectors = make_clustered_vectors(num_vectors + num_queries, dim, seed=seed)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    return vectors[order[num_queries:]], vectors[order[:num_queries]]
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, block_size: int = 1024) -> np.ndarray:
+    """Exact top k rows of the corpus by cosine similarity for each query, computed in blocks of queries"""
+    results = []
+    for start in range(0, len(queries), block_size):
+        end = start + block_size
+        scores = queries[start:end] @ corpus.T
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        results.append(np.take_along_axis(top, order, axis=1))
+    return np.concatenate(results)
+
+
+def recall_at_k(found: list[list[int]], truth: np.ndarray, k: int) -> float:
+    """Average fraction of the true top k neighbors present in the found top k"""
+    hits = [len(set(row[:k]) & set(true_row[:k].tolist())) / k for row, true_row in zip(found, truth)]
+    return round(float(np.mean(hits)), 4)
+
+
+def latency_summary(latencies_ms: list[float]) -> dict:
+    """p50, p95 and p99 of latencies in milliseconds"""
+    latencies_ms = np.asarray(latencies_ms)
+    return {f"p{q}_ms": round(float(np.percentile(latencies_ms, q)), 3) for q in (50, 95, 99)}
+
+
+def save_results(results: dict | list, output_file: str) -> None:
+    """Save the benchmark results in a json file"""
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+# Vocabulary of the synthetic recipes, close to the scraped ones in length and field structure
+# fmt: off
+SYNTHETIC_INGREDIENTS = [
+    "salt", "onion", "tomato", "garlic", "ginger", "green chili", "cumin seeds", "turmeric powder", "red chili powder",
+    "garam masala", "coriander leaves", "potato", "paneer", "rice", "wheat flour", "ghee", "oil", "mustard seeds",
+    "curry leaves", "lemon juice", "sugar", "milk", "yogurt", "cauliflower", "peas", "spinach", "chickpeas", "lentils",
+    "coconut", "cardamom", "cinnamon", "cloves", "bay leaf", "vodka", "gin", "rum", "lime", "mint leaves", "soda",
+    "orange juice", "ice cubes", "bell pepper", "carrot", "beans", "cashews", "raisins", "saffron", "butter", "cream",
+]
+SYNTHETIC_WORDS = [
+    "easy", "quick", "spicy", "tangy", "creamy", "crispy", "healthy", "delicious", "traditional", "homemade", "north",
+    "south", "indian", "style", "curry", "gravy", "snack", "breakfast", "dinner", "party", "festive", "simple", "rich",
+    "flavorful", "made", "with", "and", "served", "hot", "cold", "fresh", "aromatic", "light", "classic", "recipe",
+]
+# fmt: on
+SYNTHETIC_CUSINES = ["Indian", "North Indian", "South Indian", "Punjabi", "Gujarati", "Bengali", "Continental", ""]
+SYNTHETIC_DIETS = ["Vegetarian", "Vegan", "Gluten Free", "Diabetic Friendly", ""]
+SYNTHETIC_DIFFICULTIES = ["Easy", "Moderate", "Difficult", ""]
+
+
+def make_synthetic_recipe(recipe_id: str, rng: np.random.Generator) -> dict:
+    """Random recipe with the fields and value types written by the scrapers.
+
+    Args:
+        recipe_id (str): unique identifier for the recipe
+        rng (np.random.Generator): random generator
+
+    Returns:
+        dict: recipe details as saved in the recipe json files
+    """
+
+    def sentence(num_words: int) -> str:
+        return " ".join(rng.choice(SYNTHETIC_WORDS, num_words)).capitalize() + "."
+
+    name = " ".join(rng.choice(SYNTHETIC_WORDS, rng.integers(2, 5))).title()
+    ingredients = rng.choice(SYNTHETIC_INGREDIENTS, rng.integers(4, 16), replace=False).tolist()
+    steps = [sentence(rng.integers(8, 30)) for _ in range(rng.integers(3, 12))]
+    return {
+        "recipe_id": recipe_id,
+        "name": name,
+        "description": " ".join(sentence(rng.integers(8, 25)) for _ in range(rng.integers(1, 6))),
+        "ingredients": ingredients,
+        "cusine": str(rng.choice(SYNTHETIC_CUSINES)),
+        "diet": str(rng.choice(SYNTHETIC_DIETS)),
+        "servings": str(rng.integers(1, 9)),
+        "difficulty": str(rng.choice(SYNTHETIC_DIFFICULTIES)),
+        "total_time": f"{rng.integers(1, 25) * 5} mins",
+        "ingredient_quantity": {"group_0": [f"{rng.integers(1, 5)} cup {item}" for item in ingredients]},
+        "recipe_steps": {"group_0": steps},
+        "source_image_url": f"https://example.com/images/{recipe_id}.jpg",
+        "source_recipe_url": f"https://example.com/recipes/{recipe_id}",
+        "image_avalable": False,
+    }
+
+
+def make_synthetic_queries(num_queries: int, seed: int = 0) -> list[str]:
+    """Random recipe searches mixing the words and ingredients of the synthetic recipes, e.g., "spicy paneer curry".
+
+    Args:
+        num_queries (int): number of queries
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        list[str]: query texts
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(num_queries):
+        words = rng.choice(SYNTHETIC_WORDS, rng.integers(1, 4)).tolist()
+        ingredients = rng.choice(SYNTHETIC_INGREDIENTS, rng.integers(1, 3), replace=False).tolist()
+        queries.append(" ".join(words[:1] + ingredients + words[1:]))
+    return queries
+
+
+def write_synthetic_dataset(directory: str, num_recipes: int, seed: int = 0) -> int:
+    """Write synthetic recipe json files into directory, keeping the files already written by an earlier call.
+
+    Args:
+        directory (str): directory of the recipe json files, e.g., SCRAPED_DATA_ROOT/<dataset_name>/recipes
+        num_recipes (int): number of recipes in the dataset
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        int: number of recipe json files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    num_written = 0
+    for idx in range(num_recipes):
+        json_file_path = os.path.join(directory, f"synthetic_{idx:07d}.json")
+        # Generate the recipe even when the file exists so that the corpus only depends on the seed
+        recipe = make_synthetic_recipe(f"synthetic_{idx:07d}", rng)
+        if os.path.exists(json_file_path):
+            continue
+        with open(json_file_path, "w") as file:
+            json.dump(recipe, file)
+        num_written += 1
+    return num_written
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
@@ -1,22 +1,54 @@
+import atexit
 import logging
-import logging.config
 import os
+import queue
 import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
 from pathlib import Path
 from typing import Optional
 
 import structlog
 
+# Lock of the one time configuration of the process and of the handlers added for new log files
+_LOCK = threading.Lock()
+# Handlers writing the log entries, fed by the listener thread or by the root logger if the queue is disabled
+_HANDLERS: dict[str, logging.Handler] = {}
+_FORMATTER: Optional[logging.Formatter] = None
+_LISTENER: Optional[QueueListener] = None
+_QUEUE: Optional[queue.SimpleQueue] = None
+_QUEUE_HANDLER: Optional[QueueHandler] = None
+
+
+def is_enabled(variable: str, default: bool = True) -> bool:
+    """Value of a boolean environment variable, e.g., LOG_CALLSITE=false"""
+    return os.getenv(variable, str(default)).strip().lower() not in {"0", "false", "no", "off"}
+
+
+class _QueueHandler(QueueHandler):
+    """Enqueue the records unchanged, the rendering of the event dicts happens in the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 
 def initialize_logging() -> None:
-    """Configure structlog to output log entries"""
-    if os.getenv("LOG_MODE", "JSON") == "LOCAL":
-        renderer = structlog.dev.ConsoleRenderer(colors=True)
-    else:
-        renderer = structlog.processors.JSONRenderer()
+    """Configure structlog to output log entries, once per process.
 
-    structlog.configure(
-        processors=[
+    The cheap processors run in the thread logging the entry. The rendering and the writes run in a listener thread
+    fed by a queue, unless LOG_QUEUE is false. The file, function and line of the callsite, which inspect the stack
+    on every entry, are only added if LOG_CALLSITE is not false.
+    """
+    global _FORMATTER, _QUEUE, _QUEUE_HANDLER
+    with _LOCK:
+        if _FORMATTER is not None:
+            return
+        if os.getenv("LOG_MODE", "JSON") == "LOCAL":
+            renderer = structlog.dev.ConsoleRenderer(colors=True)
+        else:
+            renderer = structlog.processors.JSONRenderer()
+
+        processors = [
             # If log level is too low, abort pipeline and throw away log entry.
             structlog.stdlib.filter_by_level,
             # Add the name of the logger to event dict.
@@ -33,22 +65,89 @@ def initialize_logging() -> None:
             # Replace an ``exc_info`` field with an ``exception`` string field using Python's
             # built-in traceback formatting.
             structlog.processors.dict_tracebacks,
+        ]
+        if is_enabled("LOG_CALLSITE"):
             # Add callsite parameters.
-            structlog.processors.CallsiteParameterAdder(
-                {
-                    structlog.processors.CallsiteParameter.FILENAME,
-                    structlog.processors.CallsiteParameter.FUNC_NAME,
-                    structlog.processors.CallsiteParameter.LINENO,
-                }
-            ),
-            # If some value is in bytes, decode it to a Unicode str.
-            structlog.processors.UnicodeDecoder(),
-            renderer,
-        ],
-        wrapper_class=structlog.stdlib.BoundLogger,
-        logger_factory=structlog.stdlib.LoggerFactory(),
-        cache_logger_on_first_use=True,
-    )
+            processors.append(
+                structlog.processors.CallsiteParameterAdder(
+                    {
+                        structlog.processors.CallsiteParameter.FILENAME,
+                        structlog.processors.CallsiteParameter.FUNC_NAME,
+                        structlog.processors.CallsiteParameter.LINENO,
+                    }
+                )
+            )
+        # Hand the event dict to the stdlib handlers, rendered by their formatter.
+        processors.append(structlog.stdlib.ProcessorFormatter.wrap_for_formatter)
+        structlog.configure(
+            processors=processors,
+            wrapper_class=structlog.stdlib.BoundLogger,
+            logger_factory=structlog.stdlib.LoggerFactory(),
+            cache_logger_on_first_use=True,
+        )
+
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        if is_enabled("LOG_QUEUE"):
+            _QUEUE = queue.SimpleQueue()
+            _QUEUE_HANDLER = _QueueHandler(_QUEUE)
+            root.addHandler(_QUEUE_HANDLER)
+            os.register_at_fork(after_in_child=_reset_listener_in_child)
+            atexit.register(stop_listener)
+        _FORMATTER = structlog.stdlib.ProcessorFormatter(
+            processors=[
+                # Remove the _record and _from_structlog keys added for the formatter.
+                structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                # If some value is in bytes, decode it to a Unicode str.
+                structlog.processors.UnicodeDecoder(),
+                renderer,
+            ],
+            # Entries of the standard library loggers, e.g., of the http clients, get the same fields
+            foreign_pre_chain=[
+                structlog.stdlib.add_logger_name,
+                structlog.processors.add_log_level,
+                structlog.processors.TimeStamper(fmt="iso"),
+            ],
+        )
+        _add_handler("console", logging.StreamHandler(sys.stdout))
+
+
+def _add_handler(name: str, handler: logging.Handler) -> None:
+    """Write the log entries to a new handler, restarting the listener thread so it includes it"""
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(_FORMATTER)
+    _HANDLERS[name] = handler
+    if _QUEUE is None:
+        logging.getLogger().addHandler(handler)
+    else:
+        _restart_listener()
+
+
+def stop_listener() -> None:
+    """Stop the listener thread after it writes the queued entries, e.g., before the process exits"""
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+
+
+def _restart_listener() -> None:
+    """Start a listener thread over the current handlers, after the previous one writes the queued entries"""
+    global _LISTENER
+    stop_listener()
+    _LISTENER = QueueListener(_QUEUE, *_HANDLERS.values(), respect_handler_level=True)
+    _LISTENER.start()
+
+
+def _reset_listener_in_child() -> None:
+    """Give a forked process its own queue and listener thread, the entries queued by the parent stay in the parent"""
+    global _LISTENER, _QUEUE
+    _QUEUE = queue.SimpleQueue()
+    _QUEUE_HANDLER.queue = _QUEUE
+    _LISTENER = None
+    _restart_listener()
 
 
 def get_logger(
@@ -57,6 +156,8 @@ def get_logger(
 ) -> structlog.BoundLogger:
     """Init logging and return logger with given name.
 
+    Logging is configured on the first call only, later calls with a new log file add a file handler.
+
     Args:
     logger_name (str): name of the logger
     log_file (Optional, optional): Optional .log file to save the logs Defaults to None.
@@ -64,42 +165,13 @@ def get_logger(
     Returns:
     structlog.BoundLogger: A structlog logger object
     """
-    # Create a StreamHandler for console output
     initialize_logging()
-    if log_file is None:
-        logging.basicConfig(
-            format="%(message)s",
-            stream=sys.stdout,
-            level=logging.INFO,
-        )
-    else:
+    if log_file is not None:
         log_file = Path(os.path.join(os.getenv("LOGS_ROOT", os.path.join(os.getcwd(), "logs")), log_file))
-        os.makedirs(log_file.parent, exist_ok=True)
-
-        logging.config.dictConfig(
-            {
-                "version": 1,
-                "disable_existing_loggers": False,
-                "handlers": {
-                    "default": {
-                        "level": "INFO",
-                        "class": "logging.StreamHandler",
-                    },
-                    "file": {
-                        "level": "INFO",
-                        "class": "logging.handlers.WatchedFileHandler",
-                        "filename": log_file,
-                    },
-                },
-                "loggers": {
-                    "": {
-                        "handlers": ["default", "file"],
-                        "level": "INFO",
-                        "propagate": True,
-                    },
-                },
-            }
-        )
+        with _LOCK:
+            if str(log_file) not in _HANDLERS:
+                os.makedirs(log_file.parent, exist_ok=True)
+                _add_handler(str(log_file), WatchedFileHandler(log_file))
 
     # Get a structlog logger
     logger = structlog.get_logger(logger_name)
@@ -0,0 +1,167 @@
+"""Profiling of a whole run of an entrypoint with a deterministic or a sampling profiler and tracemalloc snapshots."""
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from src.common.tracing import get_run_path
+
+# Profilers of the --profile option of the entrypoints
+PROFILERS = ["deterministic", "sampling"]
+# Number of hot functions printed at exit
+NUM_TOP_FUNCTIONS = 25
+# Maximum number of frames of a sampled stack
+MAX_STACK_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Sample the stacks of all the threads at a fixed interval from a background thread.
+
+    The overhead does not depend on the number of calls of the profiled code, only on the sampling interval. A function
+    is hot when it is often on the top of the stacks (self samples) or anywhere in them (total samples).
+    """
+
+    def __init__(self, interval_seconds: float = 0.005):
+        """
+        Args:
+            interval_seconds (float, optional): time between two samples. Defaults to 0.005.
+        """
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self.num_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+            self.num_samples += 1
+
+    def top_functions(self, n: int) -> list[tuple[str, int, int]]:
+        """Functions with the most self samples and their self and total samples"""
+        self_samples, total_samples = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack[-1]] += count
+            for function in set(stack):
+                total_samples[function] += count
+        return [(function, count, total_samples[function]) for function, count in self_samples.most_common(n)]
+
+    def write_collapsed(self, path: str) -> None:
+        """Save the stacks in the collapsed format of flamegraph.pl and speedscope, a line per stack"""
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{';'.join(stack)} {count}\n")
+
+
+class RunProfiler:
+    """Profile a run until the process exits, then save the results under LOGS_ROOT/profiles and print the hot spots.
+
+    The deterministic profiler is cProfile, it records every call of the main thread with a noticeable overhead. The
+    sampling profiler records all the threads with a low overhead. tracemalloc snapshots of the start and the end of
+    the run show the lines which allocated the most memory that is still held.
+    """
+
+    def __init__(self, name: str, profiler: Optional[str], memory: bool = False):
+        """
+        Args:
+            name (str): name of the run, e.g., indexer, prefix of the result files
+            profiler (Optional[str]): deterministic, sampling or None for memory profiling only
+            memory (bool, optional): take tracemalloc snapshots. Defaults to False.
+        """
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler}, expected one of {PROFILERS}")
+        self.path_prefix = os.path.splitext(get_run_path("profiles", name, "prof"))[0]
+        self.profiler = profiler
+        self.memory = memory
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.sampler: Optional[SamplingProfiler] = None
+        self.first_snapshot: Optional[tracemalloc.Snapshot] = None
+        self.start_time = time.perf_counter()
+
+    def start(self) -> None:
+        if self.memory:
+            tracemalloc.start()
+            self.first_snapshot = tracemalloc.take_snapshot()
+        if self.profiler == "deterministic":
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        elif self.profiler == "sampling":
+            self.sampler = SamplingProfiler()
+            self.sampler.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stop profiling, save the results and print the report"""
+        atexit.unregister(self.stop)
+        # The memory held at the end of the run, before the profilers allocate their reports
+        snapshot = tracemalloc.take_snapshot() if self.first_snapshot is not None else None
+        os.makedirs(os.path.dirname(self.path_prefix), exist_ok=True)
+        report = io.StringIO()
+        report.write(f"Profile of {os.path.basename(self.path_prefix)}: {time.perf_counter() - self.start_time:.1f}s\n")
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(f"{self.path_prefix}.prof")
+            stats = pstats.Stats(self.cprofile, stream=report)
+            report.write(f"Saved {self.path_prefix}.prof, open it with snakeviz or pstats\n")
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(NUM_TOP_FUNCTIONS)
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.write_collapsed(f"{self.path_prefix}.collapsed")
+            report.write(f"Saved {self.path_prefix}.collapsed, open it with speedscope or flamegraph.pl\n")
+            report.write(f"{'self %':>8} {'total %':>8}  function ({self.sampler.num_samples} samples)\n")
+            num_samples = max(sum(self.sampler.stacks.values()), 1)
+            for function, self_count, total_count in self.sampler.top_functions(NUM_TOP_FUNCTIONS):
+                report.write(
+                    f"{100 * self_count / num_samples:8.1f} {100 * total_count / num_samples:8.1f}  {function}\n"
+                )
+        if snapshot is not None:
+            tracemalloc.stop()
+            snapshot.dump(f"{self.path_prefix}.tracemalloc")
+            report.write(f"Saved {self.path_prefix}.tracemalloc, load it with tracemalloc.Snapshot.load\n")
+            report.write("Memory allocated during the run and still held, by line:\n")
+            for stat in snapshot.compare_to(self.first_snapshot, "lineno")[:NUM_TOP_FUNCTIONS]:
+                report.write(f"  {stat}\n")
+        with open(f"{self.path_prefix}.txt", "w") as file:
+            file.write(report.getvalue())
+        print(report.getvalue(), file=sys.stderr)
+
+
+def start_profiling(name: str, profiler: Optional[str], memory: bool = False) -> Optional[RunProfiler]:
+    """Profile the rest of the run when a profiler or memory profiling is requested, e.g., by --profile sampling.
+
+    Args:
+        name (str): name of the run, prefix of the result files under LOGS_ROOT/profiles
+        profiler (Optional[str]): deterministic, sampling or None
+        memory (bool, optional): take tracemalloc snapshots. Defaults to False.
+
+    Returns:
+        Optional[RunProfiler]: profiler stopped at exit, None if nothing is profiled
+    """
+    if profiler is None and not memory:
+        return None
+    run_profiler = RunProfiler(name, profiler, memory)
+    run_profiler.start()
+    return run_profiler
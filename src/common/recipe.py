@@ -0,0 +1,175 @@
+"""Typed recipe model shared by the scrapers, which build the recipes, and the indexer, which reads them."""
+import json
+import sys
+from typing import Any, Optional
+
+# Fields of a recipe in the order of the recipe json files and their key in the files. The files keep the historical
+# spelling of the cuisine and image availability keys, so the datasets scraped before the model stay readable
+FIELDS = {
+    "recipe_id": "recipe_id",
+    "name": "name",
+    "description": "description",
+    "ingredients": "ingredients",
+    "cuisine": "cusine",
+    "diet": "diet",
+    "servings": "servings",
+    "difficulty": "difficulty",
+    "total_time": "total_time",
+    "ingredient_quantity": "ingredient_quantity",
+    "recipe_steps": "recipe_steps",
+    "source_image_url": "source_image_url",
+    "source_recipe_url": "source_recipe_url",
+    "image_available": "image_avalable",
+}
+# Field of every json key and field name, a recipe is read from either spelling
+_ATTRIBUTES = {**{name: name for name in FIELDS}, **{key: name for name, key in FIELDS.items()}}
+# Fields with a small number of distinct values, interned so that the recipes share a single string per value
+INTERNED_FIELDS = ("cuisine", "diet", "servings", "difficulty")
+
+
+def get_field_name(key: str) -> str:
+    """Field of the recipe model for a key of the recipe json files, e.g., cusine -> cuisine"""
+    return _ATTRIBUTES[key]
+
+
+def _validate_text(field: str, value: Any) -> str:
+    """Text value of a field, numbers are converted, e.g., the servings of the cocktails"""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string, got {type(value).__name__}")
+    return value
+
+
+def _validate_text_list(field: str, value: Any) -> list[str]:
+    """List of texts of a field"""
+    if value is None:
+        return []
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{field} must be a list of strings")
+    return list(value)
+
+
+def _validate_groups(field: str, value: Any) -> dict[str, list[str]]:
+    """Texts of a field grouped under headings, e.g., the steps of the dough and of the filling.
+
+    The groups are a dictionary of lists, as in the json files, or a list of {"group": ..., "items": [...]}, as in the
+    columnar recipe tables.
+    """
+    if value is None:
+        return {}
+    if isinstance(value, list):
+        value = {item["group"]: item["items"] for item in value}
+    if not isinstance(value, dict):
+        raise ValueError(f"{field} must be a dictionary of lists of strings")
+    return {_validate_text(field, group): _validate_text_list(field, items) for group, items in value.items()}
+
+
+class Recipe:
+    """Recipe scraped from a website, validated on creation.
+
+    The fields are slots instead of the entries of a dictionary per recipe, which keeps large numbers of recipes
+    compact in memory. The recipes are saved with the keys of the existing json files by to_dict and read from them by
+    from_dict.
+    """
+
+    __slots__ = tuple(FIELDS)
+
+    def __init__(
+        self,
+        recipe_id: str,
+        name: str = "",
+        description: str = "",
+        ingredients: Optional[list[str]] = None,
+        cuisine: str = "",
+        diet: str = "",
+        servings: str = "",
+        difficulty: str = "",
+        total_time: str = "",
+        ingredient_quantity: Optional[dict[str, list[str]]] = None,
+        recipe_steps: Optional[dict[str, list[str]]] = None,
+        source_image_url: str = "",
+        source_recipe_url: str = "",
+        image_available: bool = False,
+    ):
+        """
+        Args:
+            recipe_id (str): unique identifier for the recipe
+            name (str, optional): name of the dish. Defaults to "".
+            description (str, optional): description of the dish. Defaults to "".
+            ingredients (Optional[list[str]], optional): names of the ingredients. Defaults to None.
+            cuisine (str, optional): cuisine of the dish. Defaults to "".
+            diet (str, optional): diet, e.g., vegetarian. Defaults to "".
+            servings (str, optional): number of servings of the ingredient quantities. Defaults to "".
+            difficulty (str, optional): difficulty level of the cooking. Defaults to "".
+            total_time (str, optional): total cooking time, e.g., 45 mins. Defaults to "".
+            ingredient_quantity (Optional[dict[str, list[str]]], optional): ingredients with their quantities
+                grouped under headings. Defaults to None.
+            recipe_steps (Optional[dict[str, list[str]]], optional): cooking steps grouped under headings.
+                Defaults to None.
+            source_image_url (str, optional): url of the image of the dish. Defaults to "".
+            source_recipe_url (str, optional): url of the recipe page. Defaults to "".
+            image_available (bool, optional): whether the image was downloaded. Defaults to False.
+
+        Raises:
+            ValueError: if the recipe id is empty or a field has the wrong type
+        """
+        self.recipe_id = _validate_text("recipe_id", recipe_id)
+        if len(self.recipe_id) == 0:
+            raise ValueError("recipe_id must not be empty")
+        self.name = _validate_text("name", name)
+        self.description = _validate_text("description", description)
+        self.ingredients = _validate_text_list("ingredients", ingredients)
+        self.cuisine = sys.intern(_validate_text("cuisine", cuisine))
+        self.diet = sys.intern(_validate_text("diet", diet))
+        self.servings = sys.intern(_validate_text("servings", servings))
+        self.difficulty = sys.intern(_validate_text("difficulty", difficulty))
+        self.total_time = _validate_text("total_time", total_time)
+        self.ingredient_quantity = _validate_groups("ingredient_quantity", ingredient_quantity)
+        self.recipe_steps = _validate_groups("recipe_steps", recipe_steps)
+        self.source_image_url = _validate_text("source_image_url", source_image_url)
+        self.source_recipe_url = _validate_text("source_recipe_url", source_recipe_url)
+        if not isinstance(image_available, bool):
+            raise ValueError(f"image_available must be a boolean, got {type(image_available).__name__}")
+        self.image_available = image_available
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Recipe":
+        """Recipe from a parsed recipe json file or a row of a recipe table, the unknown keys are ignored.
+
+        Args:
+            data (dict): recipe details keyed by the json keys or the field names
+
+        Returns:
+            Recipe: validated recipe
+        """
+        fields = {_ATTRIBUTES[key]: value for key, value in data.items() if key in _ATTRIBUTES}
+        if "recipe_id" not in fields:
+            raise ValueError("recipe_id is missing")
+        if fields.get("image_available") is None:
+            fields.pop("image_available", None)
+        return cls(**fields)
+
+    def to_dict(self) -> dict:
+        """Recipe details with the keys of the recipe json files"""
+        return {key: getattr(self, name) for name, key in FIELDS.items()}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value of a field from its json key or its name, e.g., cusine, like the get of the parsed json files"""
+        name = _ATTRIBUTES.get(key)
+        return default if name is None else getattr(self, name)
+
+    def save(self, json_file_path: str) -> None:
+        """Save the recipe as a json file read by the indexer"""
+        with open(json_file_path, "w") as outfile:
+            json.dump(self.to_dict(), outfile)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Recipe):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __repr__(self) -> str:
+        return f"Recipe(recipe_id={self.recipe_id!r}, name={self.name!r})"
@@ -0,0 +1,164 @@
+"""In-process span tracing exported as Chrome trace event JSON, viewable in chrome://tracing or ui.perfetto.dev."""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+# Spans are dropped beyond this number of events to bound the memory of long runs
+MAX_EVENTS = 2_000_000
+# Context manager returned by span when tracing is disabled, entering and exiting it does nothing
+_DISABLED_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """Record the spans of all the threads of the process as complete trace events, a track per thread."""
+
+    def __init__(self, max_events: int = MAX_EVENTS):
+        """
+        Args:
+            max_events (int, optional): maximum number of recorded spans. Defaults to MAX_EVENTS.
+        """
+        self.max_events = max_events
+        self.events: list[tuple] = []
+        self.num_dropped = 0
+        self.start_ns = time.perf_counter_ns()
+        self.thread_names: dict[int, str] = {}
+
+    def add(self, name: str, start_ns: int, end_ns: int, args: Optional[dict]) -> None:
+        """Record a span of the current thread"""
+        if len(self.events) >= self.max_events:
+            self.num_dropped += 1
+            return
+        thread = threading.current_thread()
+        if thread.ident not in self.thread_names:
+            self.thread_names[thread.ident] = thread.name
+        # list.append is atomic, the threads record their spans without a lock
+        self.events.append((name, thread.ident, start_ns, end_ns, args))
+
+    def to_chrome_trace(self) -> dict:
+        """Spans as complete ("X") events with microsecond timestamps and the thread names as metadata events"""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self.thread_names.items()
+        ]
+        for name, tid, start_ns, end_ns, args in self.events:
+            event = {
+                "name": name,
+                "ph": "X",
+                "pid": pid,
+                "tid": tid,
+                "ts": (start_ns - self.start_ns) / 1000,
+                "dur": (end_ns - start_ns) / 1000,
+            }
+            if args:
+                event["args"] = args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"num_dropped": self.num_dropped}}
+
+
+class _Span:
+    """Context manager recording the time between its entry and exit as a span"""
+
+    __slots__ = ("tracer", "name", "args", "start_ns")
+
+    def __init__(self, tracer: Tracer, name: str, args: Optional[dict]):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.tracer.add(self.name, self.start_ns, time.perf_counter_ns(), self.args)
+
+
+_TRACER: Optional[Tracer] = None
+
+
+def span(name: str, **args):
+    """Context manager tracing a block, e.g., `with span("requests.get", url=url):`, a no-op when tracing is off.
+
+    Args:
+        name (str): name of the span
+        **args: values shown with the span in the trace viewer
+
+    Returns:
+        context manager recording the span
+    """
+    tracer = _TRACER
+    if tracer is None:
+        return _DISABLED_SPAN
+    return _Span(tracer, name, args or None)
+
+
+def traced(function: Optional[Callable] = None, *, name: Optional[str] = None) -> Callable:
+    """Decorator tracing every call of a function as a span named after its module and qualified name.
+
+    Args:
+        function (Optional[Callable], optional): decorated function. Defaults to None when used as @traced(name=...).
+        name (Optional[str], optional): name of the span. Defaults to None, i.e., module.qualname.
+
+    Returns:
+        Callable: function recording a span per call when tracing is on
+    """
+    if function is None:
+        return functools.partial(traced, name=name)
+    span_name = name or f"{function.__module__.rsplit('.', 1)[-1]}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        tracer = _TRACER
+        if tracer is None:
+            return function(*args, **kwargs)
+        start_ns = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            tracer.add(span_name, start_ns, time.perf_counter_ns(), None)
+
+    return wrapper
+
+
+@functools.lru_cache(maxsize=1)
+def get_run_id() -> str:
+    """Identifier of the run shared by its traces and profiles: start time and process id"""
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+
+
+def get_run_path(directory: str, name: str, extension: str) -> str:
+    """File under LOGS_ROOT/directory named after a run, e.g., logs/traces/indexer_20240101-120000_1234.json"""
+    return os.path.join(
+        os.getenv("LOGS_ROOT", os.path.join(os.getcwd(), "logs")), directory, f"{name}_{get_run_id()}.{extension}"
+    )
+
+
+def start_tracing(trace_file: str, max_events: int = MAX_EVENTS) -> None:
+    """Record the spans of the process until stop_tracing, called at exit if not before.
+
+    Args:
+        trace_file (str): json file where the trace is exported
+        max_events (int, optional): maximum number of recorded spans. Defaults to MAX_EVENTS.
+    """
+    global _TRACER
+    _TRACER = Tracer(max_events)
+    atexit.register(stop_tracing, trace_file)
+
+
+def stop_tracing(trace_file: str) -> Optional[str]:
+    """Stop recording spans and export the trace, None if tracing was not started"""
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    if tracer is None:
+        return None
+    os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+    with open(trace_file, "w") as file:
+        json.dump(tracer.to_chrome_trace(), file, default=str)
+    return trace_file
@@ -1,15 +1,20 @@
 import html
+import json
+import os
 import re
 import unicodedata
 
 import yaml
 
+from src.common.tracing import traced
+
 # function to remove non-ascii characters from a string
 clean_non_ascii = (
     lambda string: unicodedata.normalize("NFKD", string).encode("ascii", "ignore").decode("utf-8").strip(" ")
 )
 
 
+@traced
 def clean_string(string: str) -> str:
     """Process a string to remove html text, extra spaces ad non-ascii characters
 
@@ -51,3 +56,10 @@ def load_yaml(file_path: str) -> dict:
     with open(file_path, "r") as file:
         data = yaml.safe_load(file)
     return data
+
+
+def write_json_atomic(data: dict, path: str) -> None:
+    """Write a json file through a temporary file so that readers never see a partially written file"""
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(data, file)
+    os.replace(f"{path}.tmp", path)
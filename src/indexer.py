@@ -1,21 +1,40 @@
 """Index the recipies and save them in the vector database."""
-import glob
+import functools
+import itertools
 import json
 import os
+from typing import Iterable, Iterator, Optional
 
 import click
-import numpy as np
 import torch
 from dotenv import load_dotenv
 from langchain import text_splitter
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import QdrantClient
 from sentence_transformers import SentenceTransformer
 
 from src.common.logger import get_logger
+from src.common.profiling import PROFILERS, start_profiling
+from src.common.recipe import Recipe, get_field_name
+from src.common.tracing import get_run_path, span, start_tracing, stop_tracing, traced
 from src.common.utils import load_yaml
+from src.indexing.attributes import normalize_recipe_attributes
+from src.indexing.bm25 import BM25SegmentWriter, get_sparse_index_path
+from src.indexing.checkpoint import IndexingCheckpoint, get_point_ids
+from src.indexing.chunk_dedup import DeduplicatingEmbeddings
+from src.indexing.chunking import FIELD_SEPARATOR, RecipeChunker
+from src.indexing.collection_schema import ensure_qdrant_collection
+from src.indexing.collection_version import bump_collection_version, get_version_path
+from src.indexing.ingestion import IngestionStats, iter_document_batches, iter_json_files
+from src.indexing.local_vector_store import LocalVectorStore
+from src.indexing.named_vectors import NamedVectorStore, get_named_collection_name
+from src.indexing.near_duplicates import NearDuplicates, get_near_duplicates_path
+from src.indexing.recipe_table import get_recipe_table_path, iter_table_recipes
 
 # load all the environment variables
 load_dotenv()
@@ -24,14 +43,24 @@ params = load_yaml("params.yaml")
 
 # Relevant keys from the recipe.json file to build document content
 CONTENT_KEYS = ["name", "description", "ingredients", "cusine", "diet", "difficulty", "total_time"]
+# Keys from the recipe.json file added to the document meta-data to filter the search results
+METADATA_KEYS = ["cusine", "diet"]
+# Columns of the recipe table read to build the documents, the steps, quantities and urls are not read
+TABLE_COLUMNS = list(dict.fromkeys(["recipe_id", "servings", *map(get_field_name, CONTENT_KEYS + METADATA_KEYS)]))
 # Indicator to normalize the document vector embeddings
 NORMALIZE_EMBEDDINGS = True
 # Url for the Qdrant db
-DB_URL = "http://localhost:6333"
+DB_URL = params["vector_store"]["url"]
 # Initialize logger
 LOGGER = get_logger(__file__)
 # Number of documents read and processed together
 DOC_CHUNK_SIZE = 200
+# Number of threads used to read and parse the recipe json files
+NUM_READER_THREADS = min(8, os.cpu_count() or 1)
+# Number of chunk embeddings kept in memory to skip embedding identical chunk texts again
+EMBEDDING_CACHE_SIZE = 50_000
+# Directory under DATA_ROOT with the checkpoints of the indexer
+CHECKPOINT_DIR = "checkpoints"
 
 
 def get_document_from_json(json_file_path: str, dataset_name: str) -> Document:
@@ -46,35 +75,169 @@ def get_document_from_json(json_file_path: str, dataset_name: str) -> Document:
     """
     with open(json_file_path, "r") as file:
         data = json.load(file)
-    content = "; \n".join([f"{key}: {value}" for key, value in data.items() if key in CONTENT_KEYS and len(value) > 0])
-    content = Document(page_content=content, metadata={"recipe_id": data["recipe_id"], "dataset_name": dataset_name})
+    return get_document_from_recipe(data=data, dataset_name=dataset_name)
+
+
+def get_document_from_recipe(data: dict | Recipe, dataset_name: str) -> Document:
+    """Convert a parsed recipe into langchain document with relevant content and meta-data.
+
+    Args:
+        data (dict | Recipe): recipe details parsed from the json file, validated by the recipe model
+        dataset_name (str): Name of the dataset
+
+    Returns:
+        Document: langchain document with relevant content and meta-data
+    """
+    recipe = data if isinstance(data, Recipe) else Recipe.from_dict(data)
+    content = FIELD_SEPARATOR.join([f"{key}: {value}" for key in CONTENT_KEYS if len(value := recipe.get(key)) > 0])
+    metadata = {"recipe_id": recipe.recipe_id, "dataset_name": dataset_name}
+    # Fields with payload indexes to filter the search results
+    metadata.update({key: recipe.get(key) for key in METADATA_KEYS})
+    # Total time, servings and difficulty parsed into integers and canonical levels for range and keyword filters
+    metadata.update(normalize_recipe_attributes(recipe))
+    content = Document(page_content=content, metadata=metadata)
     return content
 
 
+@traced
 def load_documents_to_db(
-    embeddings_model: HuggingFaceEmbeddings, contents: list[Document], retriver_db_name: str, splitter: text_splitter
-) -> None:
-    """Load document embeddings into a retrieval database using a given HuggingFace embeddings model.
+    vector_store: VectorStore,
+    contents: list[Document],
+    splitter: text_splitter,
+    sparse_index: Optional[BM25SegmentWriter] = None,
+) -> list[str]:
+    """Load document embeddings into a retrieval database using the embeddings model of the vector store.
 
     Args:
-        embeddings_model (HuggingFaceEmbeddings): The Hugging Face embeddings model used for encoding document contents.
+        vector_store (VectorStore): Qdrant or LocalVectorStore collection where the document embeddings will be stored.
         contents (list[Document]): List of Document objects containing textual content to be indexed.
-        retriver_db_name (str): Name of the retrieval database where the document embeddings will be stored.
-        splitter (text_splitter): An instance of a text splitter used to divide the documents into chunks.
+        splitter (text_splitter): An instance of a text splitter or a RecipeChunker used to divide the documents into
+            chunks.
+        sparse_index (Optional[BM25SegmentWriter], optional): BM25 segment receiving the same chunks.
+            Defaults to None.
+
+    Returns:
+        list[str]: Deterministic point ids of the chunks
     """
     # Split the documents into chunks for deriving the chunk embeddings
-    documents = splitter.split_documents(contents)
-    # Load the chunks into the vector db
-    _ = Qdrant.from_documents(
-        documents, embeddings_model, url=DB_URL, prefer_grpc=False, collection_name=retriver_db_name
-    )
+    with span("split_documents", num_documents=len(contents)):
+        documents = splitter.split_documents(contents)
+    if len(documents) == 0:
+        return []
+    # Load the chunks into the vector db, re-indexing a recipe overwrites its points
+    point_ids = get_point_ids(documents)
+    with span("vector_store.add_documents", num_chunks=len(documents)):
+        vector_store.add_documents(documents, ids=point_ids)
+    if sparse_index is not None:
+        with span("sparse_index.add_documents"):
+            sparse_index.add_documents(documents)
+    return point_ids
+
+
+def get_qdrant_client() -> QdrantClient:
+    """Client of the Qdrant server at DB_URL"""
+    client = QdrantClient(url=DB_URL, prefer_grpc=False)
+    # Trace the uploads apart from the embedding of the chunks, both run inside add_documents
+    client.upsert = traced(client.upsert, name="qdrant.upsert")
+    return client
 
 
-def get_embedding_model(embedding_model_name: str) -> HuggingFaceEmbeddings:
+def get_vector_store(
+    backend: str,
+    embeddings_model: Embeddings | dict[str, Embeddings],
+    retriver_db_name: str,
+    vector_size: Optional[int | dict[str, int]] = None,
+    read_only: bool = False,
+) -> VectorStore:
+    """Open the collection of the vector db where the chunk embeddings are saved, creating it if needed.
+
+    Args:
+        backend (str): qdrant for the Qdrant server at DB_URL or local for the embedded LocalVectorStore
+        embeddings_model (Embeddings | dict[str, Embeddings]): The embeddings model used for encoding document
+            contents, or the model of each vector name of a collection with named vectors.
+        retriver_db_name (str): Collections name for the embeddings db
+        vector_size (Optional[int | dict[str, int]], optional): Dimension of the embeddings, or of the embeddings of
+            each vector name, required to create the collection. Defaults to None.
+        read_only (bool, optional): Open an existing collection for search only. Defaults to False.
+
+    Returns:
+        VectorStore: langchain vector store for the collection, a NamedVectorStore for named vectors
+    """
+    if isinstance(embeddings_model, dict):
+        return get_named_vector_store(backend, embeddings_model, retriver_db_name, vector_size, read_only)
+    config = params["vector_store"]
+    compression = config["compression"]
+    if backend == "local":
+        return LocalVectorStore(
+            path=os.path.join(os.getenv("DATA_ROOT"), config["local_path"]),
+            collection_name=retriver_db_name,
+            embeddings=embeddings_model,
+            read_only=read_only,
+            dtype=compression["local_dtype"],
+            truncate_dim=compression["truncate_dim"],
+            rescore=compression["rescore"],
+            oversampling=compression["oversampling"],
+            m=config["hnsw"]["m"],
+            ef_construct=config["hnsw"]["ef_construct"],
+            ef_search=config["hnsw"]["ef_search"],
+            payload_indexes=config["payload_indexes"],
+            range_indexes=config["payload_range_indexes"],
+        )
+
+    # A single client is shared by all the chunks of all the datasets
+    client = get_qdrant_client()
+    if not read_only:
+        ensure_qdrant_collection(client, collection_name=retriver_db_name, vector_size=vector_size, config=config)
+    return Qdrant(client=client, collection_name=retriver_db_name, embeddings=embeddings_model)
+
+
+def get_named_vector_store(
+    backend: str,
+    embeddings_models: dict[str, Embeddings],
+    retriver_db_name: str,
+    vector_sizes: Optional[dict[str, int]] = None,
+    read_only: bool = False,
+) -> NamedVectorStore:
+    """Open a collection with a named vector per embedding model, creating it if needed.
+
+    Args:
+        backend (str): qdrant for the named vectors of the points of a Qdrant collection, local for a LocalVectorStore
+            collection per vector name
+        embeddings_models (dict[str, Embeddings]): embeddings model of each vector name, the first one is searched by
+            default
+        retriver_db_name (str): Collections name for the embeddings db
+        vector_sizes (Optional[dict[str, int]], optional): Dimension of the embeddings of each vector name, required
+            to create the Qdrant collection. Defaults to None.
+        read_only (bool, optional): Open an existing collection for search only. Defaults to False.
+
+    Returns:
+        NamedVectorStore: vector store writing all the vectors of a chunk together and searching one of them
+    """
+    if backend == "local":
+        stores = {
+            name: get_vector_store(
+                backend, embeddings_model, get_named_collection_name(retriver_db_name, name), read_only=read_only
+            )
+            for name, embeddings_model in embeddings_models.items()
+        }
+        return NamedVectorStore(stores)
+    client = get_qdrant_client()
+    if not read_only:
+        ensure_qdrant_collection(client, retriver_db_name, vector_size=vector_sizes, config=params["vector_store"])
+    stores = {
+        name: Qdrant(client=client, collection_name=retriver_db_name, embeddings=embeddings_model, vector_name=name)
+        for name, embeddings_model in embeddings_models.items()
+    }
+    return NamedVectorStore(stores)
+
+
+def get_embedding_model(embedding_model_name: str, batch_size: Optional[int] = None) -> HuggingFaceEmbeddings:
     """Instantiate and return a HuggingFaceEmbeddings model for a given embedding model name.
 
     Args:
         embedding_model_name (str): The name or identifier of the Hugging Face embedding model.
+        batch_size (Optional[int], optional): Number of texts encoded together by the model. Defaults to None, i.e.,
+            the default batch size of sentence transformers.
 
     Returns:
         HuggingFaceEmbeddings: An instance of the HuggingFaceEmbeddings class configured with the specified model.
@@ -86,52 +249,189 @@ def get_embedding_model(embedding_model_name: str) -> HuggingFaceEmbeddings:
         model = SentenceTransformer(embedding_model_name)
         model.save(model_path)
 
+    encode_kwargs = {"normalize_embeddings": NORMALIZE_EMBEDDINGS}
+    if batch_size is not None:
+        encode_kwargs["batch_size"] = batch_size
     embeddings_model = HuggingFaceEmbeddings(
         model_name=model_path,
         model_kwargs={"device": torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")},
-        encode_kwargs={"normalize_embeddings": NORMALIZE_EMBEDDINGS},
+        encode_kwargs=encode_kwargs,
     )
     return embeddings_model
 
 
-def get_documents_chunk(dataset_files: list[str], dataset_name: str) -> tuple[int, list[Document]]:
+def get_named_embedding_models(vector_names: Iterable[str]) -> dict[str, HuggingFaceEmbeddings]:
+    """Embeddings model of each vector name, with the model name and batch size of embedding_model.vectors.
+
+    Args:
+        vector_names (Iterable[str]): names of embedding_model.vectors in params.yaml
+
+    Returns:
+        dict[str, HuggingFaceEmbeddings]: embeddings model of each vector name, in the order of the names
+    """
+    vectors = {vector["name"]: vector for vector in params["embedding_model"]["vectors"]}
+    unknown = [name for name in vector_names if name not in vectors]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown vector names {unknown}, expected names of embedding_model.vectors {list(vectors)}")
+    return {
+        name: get_embedding_model(vectors[name]["model_name"], batch_size=vectors[name]["batch_size"])
+        for name in vector_names
+    }
+
+
+def get_documents_chunk(dataset_files: Iterable[str], dataset_name: str) -> Iterator[tuple[int, list[Document]]]:
     """Generate chunks of documents from a list of dataset files.
 
+    The files are read and parsed in a thread pool, a bounded number of chunks ahead of the consumer.
+
     Args:
-        dataset_files (list[str]): List of file paths containing dataset documents in JSON format.
+        dataset_files (Iterable[str]): File paths containing dataset documents in JSON format.
         dataset_name (str): Name or identifier for the dataset to add in the document meta data.
 
     Yields:
         tuple[int, list[Document]]: Chunk index and a list of Document objects extracted from each chunk of dataset
             files.
     """
-    dataset_files_chunks = np.split(dataset_files, range(DOC_CHUNK_SIZE, len(dataset_files), DOC_CHUNK_SIZE))
-    for idx, chunk in enumerate(dataset_files_chunks):
-        chunk_content = [get_document_from_json(json_file_path=file, dataset_name=dataset_name) for file in chunk]
-        yield idx, chunk_content
+    yield from iter_document_batches(
+        json_files=dataset_files,
+        document_builder=functools.partial(get_document_from_recipe, dataset_name=dataset_name),
+        batch_size=DOC_CHUNK_SIZE,
+        num_workers=NUM_READER_THREADS,
+    )
 
 
+def get_table_documents_chunk(
+    dataset_recipes: Iterable[Recipe], dataset_name: str
+) -> Iterator[tuple[int, list[Document]]]:
+    """Generate chunks of documents from the recipes of a dataset read from the recipe table.
+
+    Args:
+        dataset_recipes (Iterable[Recipe]): Recipes of the dataset.
+        dataset_name (str): Name or identifier for the dataset to add in the document meta data.
+
+    Yields:
+        tuple[int, list[Document]]: Chunk index and a list of Document objects of the recipes of the chunk.
+    """
+    dataset_recipes = iter(dataset_recipes)
+    for idx in itertools.count():
+        recipes = list(itertools.islice(dataset_recipes, DOC_CHUNK_SIZE))
+        if len(recipes) == 0:
+            return
+        yield idx, [get_document_from_recipe(recipe, dataset_name=dataset_name) for recipe in recipes]
+
+
+@traced
 def load_dataset(
-    dataset_name: str, embedding_model: HuggingFaceEmbeddings, splitter: text_splitter, retriver_db_name: str
+    dataset_name: str,
+    vector_store: VectorStore,
+    splitter: text_splitter,
+    checkpoint: Optional[IndexingCheckpoint] = None,
+    sparse_index_dir: Optional[str] = None,
+    near_duplicates: Optional[NearDuplicates] = None,
+    recipe_table: Optional[str] = None,
 ) -> None:
-    """Load a dataset into a retrieval database using the specified HuggingFace embeddings model.
+    """Load a dataset into a retrieval database using the embeddings model of the vector store.
 
     Args:
         dataset_name (str): Name or identifier for the dataset.
-        embedding_model (HuggingFaceEmbeddings): The Hugging Face embeddings model used for encoding document contents.
-        splitter (text_splitter): An instance of a text splitter used to divide the documents into chunks.
-        retriver_db_name (str): Name of the retrieval database where the document embeddings will be stored.
+        vector_store (VectorStore): Qdrant or LocalVectorStore collection where the document embeddings will be stored.
+        splitter (text_splitter): An instance of a text splitter or a RecipeChunker used to divide the documents into
+            chunks.
+        checkpoint (Optional[IndexingCheckpoint], optional): Checkpoint updated after every batch and used to skip
+            the files indexed by an interrupted run. Defaults to None.
+        sparse_index_dir (Optional[str], optional): Directory of the BM25 index where a segment with the chunks of
+            the dataset is saved. Defaults to None.
+        near_duplicates (Optional[NearDuplicates], optional): Near-duplicate recipes skipped in favor of their
+            canonical recipe. Defaults to None.
+        recipe_table (Optional[str], optional): Recipe table read instead of the json files of the dataset.
+            Defaults to None.
     """
-    LOGGER.info("Starting to load a dataset", dataset_name=dataset_name)
-    dataset_files = glob.glob(os.path.join(os.getenv("SCRAPED_DATA_ROOT"), dataset_name, "recipes", "*.json"))
-    for idx, chunk_content in get_documents_chunk(dataset_files=dataset_files, dataset_name=dataset_name):
-        load_documents_to_db(
-            embeddings_model=embedding_model,
-            contents=chunk_content,
-            retriver_db_name=retriver_db_name,
-            splitter=splitter,
+    if checkpoint is not None and checkpoint.is_completed(dataset_name):
+        LOGGER.info("Skipping a dataset completed before the checkpoint", dataset_name=dataset_name)
+        return
+    file_offset = checkpoint.get_file_offset(dataset_name) if checkpoint is not None else 0
+    LOGGER.info("Starting to load a dataset", dataset_name=dataset_name, file_offset=file_offset)
+    if recipe_table is None:
+        dataset_path = os.path.join(os.getenv("SCRAPED_DATA_ROOT"), dataset_name, "recipes")
+        read_dataset = functools.partial(iter_json_files, dataset_path)
+        if checkpoint is not None:
+            # A file offset refers to the manifest of the first run, the directory listing is streamed into it
+            # instead of sorted in memory and every pass reads the manifest line by line
+            if file_offset > 0 and not checkpoint.has_manifest(dataset_name):
+                LOGGER.warning(
+                    "Missing the manifest of the checkpoint, restarting the dataset", dataset_name=dataset_name
+                )
+                file_offset = 0
+            if file_offset == 0:
+                num_files = checkpoint.write_manifest(dataset_name, read_dataset())
+                LOGGER.info("Saved the manifest of a dataset", dataset_name=dataset_name, num_files=num_files)
+            read_dataset = functools.partial(checkpoint.iter_manifest, dataset_name)
+        get_chunks = get_documents_chunk
+    else:
+        # The table has a row per file in a fixed order, a file offset refers to the same recipes. Every pass
+        # scans the table again instead of holding the recipes in memory
+        read_dataset = functools.partial(
+            iter_table_recipes, recipe_table, columns=TABLE_COLUMNS, dataset_name=dataset_name
+        )
+        get_chunks = get_table_documents_chunk
+    dataset_files = itertools.islice(read_dataset(), file_offset, None)
+    sparse_index = None
+    if sparse_index_dir is not None:
+        sparse_index = BM25SegmentWriter(os.path.join(sparse_index_dir, dataset_name))
+        # The BM25 segment is saved once per dataset, chunk again the files indexed before the checkpoint
+        skipped_files = itertools.islice(read_dataset(), file_offset)
+        for _, chunk_content in get_chunks(skipped_files, dataset_name=dataset_name):
+            if near_duplicates is not None:
+                chunk_content = near_duplicates.filter_documents(chunk_content)
+            sparse_index.add_documents(splitter.split_documents(chunk_content))
+        if isinstance(splitter, RecipeChunker):
+            splitter.reset_stats()
+    stats = IngestionStats()
+    num_duplicates = 0
+    for idx, chunk_content in get_chunks(dataset_files, dataset_name=dataset_name):
+        num_files = len(chunk_content)
+        if near_duplicates is not None:
+            chunk_content = near_duplicates.filter_documents(chunk_content)
+            num_duplicates += num_files - len(chunk_content)
+        point_ids = load_documents_to_db(
+            vector_store=vector_store, contents=chunk_content, splitter=splitter, sparse_index=sparse_index
+        )
+        stats.update(num_files)
+        if checkpoint is not None:
+            # The batch must be durable in the vector db before the checkpoint moves past it
+            with span("checkpoint.commit_batch"):
+                if isinstance(vector_store, (LocalVectorStore, NamedVectorStore)):
+                    vector_store.flush()
+                checkpoint.commit_batch(dataset_name, file_offset=file_offset + stats.num_files, point_ids=point_ids)
+        LOGGER.info(
+            "Completed loading a chunk", dataset_name=dataset_name, chunk=idx, files_per_sec=stats.files_per_second
         )
-        LOGGER.info("Completed loading a chunk", dataset_name=dataset_name, chunk=idx)
+    LOGGER.info(
+        "Completed loading a dataset",
+        dataset_name=dataset_name,
+        num_files=stats.num_files,
+        num_duplicates=num_duplicates,
+        seconds=round(stats.elapsed_seconds, 2),
+        files_per_sec=stats.files_per_second,
+    )
+    if isinstance(splitter, RecipeChunker):
+        LOGGER.info("Chunking summary for a dataset", dataset_name=dataset_name, **splitter.reset_stats().as_dict())
+    named_embeddings = {None: vector_store.embeddings}
+    if isinstance(vector_store, NamedVectorStore):
+        named_embeddings = vector_store.named_embeddings
+    for vector_name, embeddings in named_embeddings.items():
+        if isinstance(embeddings, DeduplicatingEmbeddings):
+            LOGGER.info(
+                "Deduplication summary for a dataset",
+                dataset_name=dataset_name,
+                vector_name=vector_name,
+                **embeddings.reset_stats().as_dict(),
+            )
+    if sparse_index is not None:
+        sparse_index.close()
+        LOGGER.info("Saved the BM25 index of a dataset", dataset_name=dataset_name, num_chunks=sparse_index.num_docs)
+    if checkpoint is not None:
+        checkpoint.complete_dataset(dataset_name)
 
 
 @click.command()
@@ -150,6 +450,15 @@ def load_dataset(
     type=str,
     help="Model tag of hugging face model to get sentence embeddings",
 )
+@click.option(
+    "--vector_names",
+    default=[vector["name"] for vector in params["embedding_model"]["vectors"]],
+    show_default=True,
+    multiple=True,
+    type=str,
+    help="Names of embedding_model.vectors in params.yaml whose models are indexed in a single pass as named vectors "
+    "of the same points, embedding_model_name is ignored. None indexes embedding_model_name alone",
+)
 @click.option(
     "--retriver_db_name",
     default=params["embedding_model"]["retriver_db_name"],
@@ -172,23 +481,105 @@ def load_dataset(
     type=int,
     help="Number of characters overlap between consecutive chunks",
 )
+@click.option(
+    "--chunking_strategy",
+    default=params["embedding_model"]["chunking_strategy"],
+    show_default=True,
+    type=click.Choice(["recipe_fields", "character"]),
+    help="recipe_fields keeps recipes fitting into max_seq_length of the model as a single chunk and splits the rest "
+    "on recipe field boundaries. character splits every recipe based on chunk_size and chunk_overlap",
+)
+@click.option(
+    "--compare_splitter/--no_compare_splitter",
+    default=params["embedding_model"]["compare_splitter"],
+    show_default=True,
+    help="Also split the recipes with the character splitter to report the chunks saved by recipe_fields in the "
+    "chunking summary, which doubles the splitting work",
+)
+@click.option(
+    "--vector_store_backend",
+    default=params["vector_store"]["backend"],
+    show_default=True,
+    type=click.Choice(["qdrant", "local"]),
+    help="qdrant saves the embeddings in the Qdrant server, local in an embedded memory-mapped vector store",
+)
+@click.option(
+    "--recipe_table",
+    is_flag=True,
+    default=False,
+    help="Read the recipes from the table exported by src.indexing.recipe_table instead of the json files",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Continue an interrupted run from its checkpoint instead of indexing all the datasets from the start",
+)
+@click.option(
+    "--trace",
+    is_flag=True,
+    default=False,
+    help="Record the time spent reading, splitting, embedding and uploading as a Chrome trace under LOGS_ROOT/traces",
+)
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Choice(PROFILERS),
+    help="Profile the run, deterministic records every call of the main thread, sampling samples the stacks of all "
+    "the threads with a low overhead. The results are saved under LOGS_ROOT/profiles and the hot functions printed",
+)
+@click.option(
+    "--profile_memory",
+    is_flag=True,
+    default=False,
+    help="Save tracemalloc snapshots and print the lines allocating the memory held at the end of the run",
+)
 def retriver_entrypoint(
     scraped_datasets: list[str],
     embedding_model_name: str,
+    vector_names: list[str],
     retriver_db_name: str,
     chunk_size: int,
     chunk_overlap: int,
+    chunking_strategy: str,
+    compare_splitter: bool,
+    vector_store_backend: str,
+    recipe_table: bool,
+    resume: bool,
+    trace: bool,
+    profile: Optional[str],
+    profile_memory: bool,
 ):
     """Entrypoint to initialize the retriver.
 
     Args:
         scraped_datasets (list[str]): Names of the scraped datasets used to index in the retriver
         embedding_model_name (str): Model tag of hugging face model to get sentence embeddings
+        vector_names (list[str]): Names of the models of embedding_model.vectors indexed as named vectors
         retriver_db_name (str): Collections name for the embeddings db
         chunk_size (int): Number of characters in a single document chunk
         chunk_overlap (int): Number of characters overlap between consecutive chunks
+        chunking_strategy (str): Strategy to split the recipes into chunks, recipe_fields or character
+        compare_splitter (bool): Count the chunks of the character splitter in the chunking summary
+        vector_store_backend (str): Vector db to save the embeddings, qdrant or local
+        recipe_table (bool): Read the recipes from the exported recipe table instead of the json files
+        resume (bool): Continue an interrupted run from its checkpoint
+        trace (bool): Record the spans of the stages and export them as a Chrome trace under LOGS_ROOT/traces
+        profile (Optional[str]): Profile the run with the deterministic or the sampling profiler
+        profile_memory (bool): Take tracemalloc snapshots at the start and the end of the run
     """
-    embedding_model = get_embedding_model(embedding_model_name)
+    start_profiling("indexer", profile, memory=profile_memory)
+    trace_file = get_run_path("traces", "indexer", "json") if trace else None
+    if trace_file is not None:
+        start_tracing(trace_file)
+    embedding_models = None
+    if len(vector_names) > 0:
+        # The chunks are read and split once, then embedded by every model, the first model splits them
+        embedding_models = get_named_embedding_models(vector_names)
+        embedding_model = embedding_models[vector_names[0]]
+        embedding_model_name = embedding_model.model_name
+    else:
+        embedding_model = get_embedding_model(embedding_model_name)
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     # Make sure the chunk size is not super large in comparison to max sequence length for the model
     try:
@@ -202,13 +593,71 @@ def retriver_entrypoint(
     except Exception:
         LOGGER.info("Comparison between chunk size and max seq length supported by the model could not performed")
 
+    if chunking_strategy == "recipe_fields":
+        try:
+            splitter = RecipeChunker.from_sentence_transformer(
+                embedding_model.client, fallback_splitter=splitter, compare_splitter=compare_splitter
+            )
+        except AttributeError:
+            LOGGER.warning(
+                f"Tokenizer of {embedding_model_name} is not available, falling back to the character based splitter"
+            )
+
+    if embedding_models is not None:
+        vector_size = {name: len(model.embed_query(retriver_db_name)) for name, model in embedding_models.items()}
+        # Identical chunk texts within and across the datasets are embedded only once by each model
+        embedding_model = {
+            name: DeduplicatingEmbeddings(model, max_cached_texts=EMBEDDING_CACHE_SIZE)
+            for name, model in embedding_models.items()
+        }
+    else:
+        vector_size = len(embedding_model.embed_query(retriver_db_name))
+        # Identical chunk texts within and across the datasets are embedded only once
+        embedding_model = DeduplicatingEmbeddings(embedding_model, max_cached_texts=EMBEDDING_CACHE_SIZE)
+    vector_store = get_vector_store(
+        backend=vector_store_backend,
+        embeddings_model=embedding_model,
+        retriver_db_name=retriver_db_name,
+        vector_size=vector_size,
+    )
+    checkpoint = IndexingCheckpoint.load(
+        os.path.join(os.getenv("DATA_ROOT"), CHECKPOINT_DIR, f"{retriver_db_name}_{vector_store_backend}.json")
+    )
+    if resume:
+        LOGGER.info(
+            "Resuming from a checkpoint",
+            completed_datasets=checkpoint.completed_datasets,
+            dataset_name=checkpoint.dataset_name,
+            file_offset=checkpoint.file_offset,
+            last_point_id=checkpoint.last_point_id,
+        )
+    else:
+        checkpoint.clear()
+    # The retrieval service drops its cached results when the version of the collection changes
+    version_path = get_version_path(retriver_db_name, vector_store_backend)
+    sparse_index_dir = None
+    if params["vector_store"]["sparse_index"]["enabled"]:
+        sparse_index_dir = get_sparse_index_path(retriver_db_name, vector_store_backend)
+    near_duplicates = None
+    if params["near_duplicates"]["skip_duplicates"]:
+        near_duplicates = NearDuplicates.load(get_near_duplicates_path())
+        if near_duplicates is None:
+            LOGGER.warning("The near-duplicates stage did not run, indexing all the recipes")
     for dataset_name in scraped_datasets:
         load_dataset(
             dataset_name=dataset_name,
-            embedding_model=embedding_model,
+            vector_store=vector_store,
             splitter=splitter,
-            retriver_db_name=retriver_db_name,
+            checkpoint=checkpoint,
+            sparse_index_dir=sparse_index_dir,
+            near_duplicates=near_duplicates,
+            recipe_table=get_recipe_table_path() if recipe_table else None,
         )
+        bump_collection_version(version_path)
+    if isinstance(vector_store, (LocalVectorStore, NamedVectorStore)):
+        vector_store.close()
+    if trace_file is not None:
+        LOGGER.info("Saved the trace of the run", trace_file=stop_tracing(trace_file))
 
 
 if __name__ == "__main__":
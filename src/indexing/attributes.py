@@ -0,0 +1,89 @@
+"""Normalization of the free text recipe attributes into typed meta-data fields, and range conditions over them."""
+import re
+from typing import Any, Optional
+
+# Canonical difficulty levels and the words the scraped websites use for them
+DIFFICULTY_LEVELS = {
+    "easy": ("easy", "simple", "beginner", "basic", "not too tricky"),
+    "moderate": ("moderate", "medium", "intermediate", "average"),
+    "difficult": ("difficult", "hard", "advanced", "expert", "challenging", "a challenge"),
+}
+# Minutes per unit of the cooking times, e.g., "1 hour 30 minutes" or "45 mins"
+TIME_UNITS = {"d": 1440, "day": 1440, "h": 60, "hr": 60, "hour": 60, "m": 1, "min": 1, "minute": 1}
+# Operators of a range condition, {"gte": 10, "lt": 30}, named as in the Qdrant range filters
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+# Meta-data fields derived from the recipe attributes
+NUMERIC_FIELDS = ("total_time_minutes", "servings")
+
+
+def parse_total_time(total_time: Any) -> Optional[int]:
+    """Total cooking time in minutes, e.g., "1 hour 30 minutes" -> 90, None if it cannot be parsed.
+
+    Args:
+        total_time (Any): scraped total time, a number is taken as minutes
+
+    Returns:
+        Optional[int]: total time in minutes
+    """
+    if isinstance(total_time, (int, float)):
+        return int(total_time) if total_time > 0 else None
+    text = str(total_time or "").lower()
+    minutes = 0.0
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)\s*([a-z]*)", text):
+        unit = unit.rstrip("s") if len(unit) > 1 else unit or "min"
+        if unit not in TIME_UNITS:
+            continue
+        minutes += float(amount) * TIME_UNITS[unit]
+    return int(round(minutes)) if minutes > 0 else None
+
+
+def parse_servings(servings: Any) -> Optional[int]:
+    """Number of servings, the lower bound of a range like "4-6", None if it cannot be parsed"""
+    if isinstance(servings, (int, float)):
+        return int(servings) if servings > 0 else None
+    match = re.search(r"\d+", str(servings or ""))
+    return int(match.group()) if match is not None and int(match.group()) > 0 else None
+
+
+def normalize_difficulty(difficulty: Any) -> Optional[str]:
+    """Canonical difficulty level, easy, moderate or difficult, None if the text matches none of them"""
+    text = re.sub(r"\s+", " ", str(difficulty or "")).strip().lower()
+    if len(text) == 0:
+        return None
+    for level, synonyms in DIFFICULTY_LEVELS.items():
+        if any(synonym in text for synonym in synonyms):
+            return level
+    return None
+
+
+def normalize_recipe_attributes(data: dict) -> dict:
+    """Typed meta-data fields of a recipe filtered with range and keyword conditions.
+
+    Args:
+        data (dict): recipe details parsed from the json file
+
+    Returns:
+        dict: total_time_minutes and servings as integers and difficulty as a canonical level, None when missing
+    """
+    return {
+        "total_time_minutes": parse_total_time(data.get("total_time")),
+        "servings": parse_servings(data.get("servings")),
+        "difficulty": normalize_difficulty(data.get("difficulty")),
+    }
+
+
+def is_range_condition(condition: Any) -> bool:
+    """Whether a filter condition is a range, i.e., a dictionary of range operators"""
+    return isinstance(condition, dict) and len(condition) > 0 and all(key in RANGE_OPERATORS for key in condition)
+
+
+def match_range(value: Any, condition: dict) -> bool:
+    """Check if a numeric meta-data value satisfies a range condition, a missing value never does"""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    return (
+        ("gt" not in condition or value > condition["gt"])
+        and ("gte" not in condition or value >= condition["gte"])
+        and ("lt" not in condition or value < condition["lt"])
+        and ("lte" not in condition or value <= condition["lte"])
+    )
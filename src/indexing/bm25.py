@@ -0,0 +1,315 @@
+"""Compact BM25 inverted index over the chunks, built by the indexer next to the vectors."""
+import json
+import os
+import re
+import shutil
+from collections import Counter
+from typing import Any, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from src.common.utils import write_json_atomic
+from src.indexing.attributes import is_range_condition, match_range
+from src.indexing.local_vector_store import dump_json_bytes, load_json_bytes, match_filter
+
+# Directory under DATA_ROOT with the BM25 indexes of the collections
+BM25_DIR = "bm25"
+# Words too frequent in the recipes to help ranking, dropped to keep the postings compact. The field labels of the
+# chunks are dropped too, total_time is tokenized into total and time, which are also words of the queries
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it of on or the to with".split()
+    + "name description ingredients cusine diet difficulty".split()
+)
+# Code of a document without a value for a meta-data field
+NO_VALUE = -1
+
+
+def is_scalar(value: Any) -> bool:
+    """Whether a meta-data value can be stored in a meta-data column of a segment"""
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def get_sparse_index_path(retriver_db_name: str, backend: str) -> str:
+    """Directory of the BM25 index of a collection of a vector db backend"""
+    return os.path.join(os.getenv("DATA_ROOT"), BM25_DIR, f"{retriver_db_name}_{backend}")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase alphanumeric tokens of a text without the stopwords"""
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25SegmentWriter:
+    """Accumulate the postings of the chunks of a dataset and save them as a segment of the BM25 index.
+
+    A segment is a directory with
+        - vocab.json: terms of the segment, the position of a term is its id
+        - term_offsets.npy: (num_terms + 1) offsets of the postings of each term
+        - postings_docs.npy / postings_tf.npy: document ids and term frequencies of the postings sorted by term
+        - doc_lengths.npy: number of tokens of each document
+        - docs.jsonl / doc_offsets.npy: page content and meta-data of each document and their byte offsets
+        - metadata.json / metadata_<field>.npy: distinct values of each meta-data field with scalar values and the
+            code of the value of each document, loaded in memory to filter the documents without reading them
+        - segment.json: number of documents and total number of tokens
+    The segment is written into a temporary directory and moved in place, so readers never see a partial segment.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory (str): directory of the segment, an existing segment is replaced on close
+        """
+        self.directory = directory
+        self.tmp_directory = f"{directory}.tmp"
+        shutil.rmtree(self.tmp_directory, ignore_errors=True)
+        os.makedirs(self.tmp_directory)
+        self.vocab: dict[str, int] = {}
+        self.doc_lengths: list[int] = []
+        self.doc_offsets: list[int] = [0]
+        self._term_ids: list[np.ndarray] = []
+        self._doc_ids: list[np.ndarray] = []
+        self._tfs: list[np.ndarray] = []
+        # Codes of the value of each document per meta-data field, and the code of each distinct value
+        self._metadata_codes: dict[str, list[int]] = {}
+        self._metadata_values: dict[str, dict[Any, int]] = {}
+        self._non_scalar_fields: set[str] = set()
+        self._docs_file = open(os.path.join(self.tmp_directory, "docs.jsonl"), "wb")
+
+    @property
+    def num_docs(self) -> int:
+        """Number of documents added to the segment"""
+        return len(self.doc_lengths)
+
+    def add_documents(self, documents: list[Document]) -> None:
+        """Add the postings and payloads of a batch of chunks"""
+        term_ids, doc_ids, tfs = [], [], []
+        for document in documents:
+            tokens = tokenize(document.page_content)
+            counts = Counter(tokens)
+            term_ids.extend(self.vocab.setdefault(term, len(self.vocab)) for term in counts)
+            doc_ids.extend([self.num_docs] * len(counts))
+            tfs.extend(counts.values())
+            self._add_metadata(document.metadata)
+            self.doc_lengths.append(len(tokens))
+            line = dump_json_bytes({"page_content": document.page_content, "metadata": document.metadata}) + b"\n"
+            self._docs_file.write(line)
+            self.doc_offsets.append(self.doc_offsets[-1] + len(line))
+        self._term_ids.append(np.asarray(term_ids, dtype=np.int32))
+        self._doc_ids.append(np.asarray(doc_ids, dtype=np.int32))
+        self._tfs.append(np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16))
+
+    def _add_metadata(self, metadata: dict) -> None:
+        """Add the meta-data values of the next document to the meta-data columns"""
+        for field, value in metadata.items():
+            if field in self._non_scalar_fields:
+                continue
+            if not is_scalar(value):
+                # The field is filtered by reading the meta-data of the documents
+                self._non_scalar_fields.add(field)
+                self._metadata_codes.pop(field, None)
+                self._metadata_values.pop(field, None)
+                continue
+            # Fields first seen on a later document have no value for the previous ones
+            codes = self._metadata_codes.setdefault(field, [NO_VALUE] * self.num_docs)
+            values = self._metadata_values.setdefault(field, {})
+            codes.append(NO_VALUE if value is None else values.setdefault(value, len(values)))
+        for codes in self._metadata_codes.values():
+            if len(codes) == self.num_docs:
+                codes.append(NO_VALUE)
+
+    def close(self) -> None:
+        """Sort the postings by term, save the segment and move it in place"""
+        self._docs_file.close()
+        term_ids = np.concatenate(self._term_ids) if self._term_ids else np.zeros(0, dtype=np.int32)
+        doc_ids = np.concatenate(self._doc_ids) if self._doc_ids else np.zeros(0, dtype=np.int32)
+        tfs = np.concatenate(self._tfs) if self._tfs else np.zeros(0, dtype=np.uint16)
+        # Documents are added in order, a stable sort on the term keeps the postings of a term sorted by document
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocab)), out=term_offsets[1:])
+        np.save(os.path.join(self.tmp_directory, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(self.tmp_directory, "postings_docs.npy"), doc_ids[order])
+        np.save(os.path.join(self.tmp_directory, "postings_tf.npy"), tfs[order])
+        np.save(os.path.join(self.tmp_directory, "doc_lengths.npy"), np.asarray(self.doc_lengths, dtype=np.int32))
+        np.save(os.path.join(self.tmp_directory, "doc_offsets.npy"), np.asarray(self.doc_offsets, dtype=np.int64))
+        with open(os.path.join(self.tmp_directory, "vocab.json"), "w") as file:
+            json.dump(list(self.vocab), file)
+        for idx, (field, codes) in enumerate(self._metadata_codes.items()):
+            np.save(os.path.join(self.tmp_directory, f"metadata_{idx}.npy"), np.asarray(codes, dtype=np.int32))
+        with open(os.path.join(self.tmp_directory, "metadata.json"), "w") as file:
+            json.dump(
+                {
+                    "columns": [[field, list(self._metadata_values[field])] for field in self._metadata_codes],
+                    "non_scalar_fields": sorted(self._non_scalar_fields),
+                },
+                file,
+            )
+        write_json_atomic(
+            {"num_docs": self.num_docs, "num_tokens": int(sum(self.doc_lengths))},
+            os.path.join(self.tmp_directory, "segment.json"),
+        )
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(self.tmp_directory, self.directory)
+
+
+class BM25Segment:
+    """Read-only segment of the BM25 index with memory-mapped postings"""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "segment.json"), "r") as file:
+            meta = json.load(file)
+        with open(os.path.join(directory, "vocab.json"), "r") as file:
+            self.vocab = {term: term_id for term_id, term in enumerate(json.load(file))}
+        self.num_docs = meta["num_docs"]
+        self.num_tokens = meta["num_tokens"]
+        self.term_offsets = np.load(os.path.join(directory, "term_offsets.npy"), mmap_mode="r")
+        self.postings_docs = np.load(os.path.join(directory, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(directory, "postings_tf.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, "doc_lengths.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(directory, "doc_offsets.npy"), mmap_mode="r")
+        # Meta-data columns in memory, the segments written before them are filtered by reading the documents
+        self.has_metadata_columns = os.path.exists(os.path.join(directory, "metadata.json"))
+        self.metadata_values: dict[str, dict[Any, int]] = {}
+        self.metadata_codes: dict[str, np.ndarray] = {}
+        self.non_scalar_fields: set[str] = set()
+        if self.has_metadata_columns:
+            with open(os.path.join(directory, "metadata.json"), "r") as file:
+                metadata = json.load(file)
+            for idx, (field, values) in enumerate(metadata["columns"]):
+                self.metadata_values[field] = {value: code for code, value in enumerate(values)}
+                self.metadata_codes[field] = np.load(os.path.join(directory, f"metadata_{idx}.npy"))
+            self.non_scalar_fields = set(metadata["non_scalar_fields"])
+        self._docs_fd = os.open(os.path.join(directory, "docs.jsonl"), os.O_RDONLY)
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Document ids and term frequencies of a term, empty arrays for an unknown term"""
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        start, end = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+        return self.postings_docs[start:end], self.postings_tf[start:end]
+
+    def filter_mask(self, filter: dict) -> tuple[Optional[np.ndarray], dict]:
+        """Mask of the documents matching the conditions of a filter on the meta-data columns.
+
+        Args:
+            filter (dict): accepted meta-data values, see match_filter
+
+        Returns:
+            tuple[Optional[np.ndarray], dict]: boolean mask of the documents, None if no condition is on a column, and
+                the conditions on the other fields, checked on the meta-data of the documents
+        """
+        mask, remaining = None, {}
+        for field, condition in filter.items():
+            if not self.has_metadata_columns or field in self.non_scalar_fields:
+                remaining[field] = condition
+                continue
+            # A field without a column has no value in any document of the segment
+            values = self.metadata_values.get(field, {})
+            # Accepted codes, the last one is the code of the documents without a value
+            accepted = np.zeros(len(values) + 1, dtype=bool)
+            if is_range_condition(condition):
+                accepted[:-1] = [match_range(value, condition) for value in values]
+            else:
+                for value in condition if isinstance(condition, (list, tuple, set)) else [condition]:
+                    code = values.get(value) if is_scalar(value) else None
+                    if code is not None:
+                        accepted[code] = True
+            accepted[NO_VALUE] = match_filter({}, {field: condition})
+            codes = self.metadata_codes.get(field)
+            field_mask = accepted[codes] if codes is not None else np.full(self.num_docs, accepted[NO_VALUE])
+            mask = field_mask if mask is None else mask & field_mask
+        return mask, remaining
+
+    def read_doc(self, doc_id: int) -> dict:
+        """Page content and meta-data of a document"""
+        start, end = int(self.doc_offsets[doc_id]), int(self.doc_offsets[doc_id + 1])
+        return load_json_bytes(os.pread(self._docs_fd, end - start, start))
+
+    def close(self) -> None:
+        os.close(self._docs_fd)
+
+
+class BM25Index:
+    """BM25 index made of one segment per dataset, with the statistics of all the segments used for scoring"""
+
+    def __init__(self, directory: str, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            directory (str): directory with a sub-directory per segment
+            k1 (float, optional): term frequency saturation of BM25. Defaults to 1.2.
+            b (float, optional): document length normalization of BM25. Defaults to 0.75.
+        """
+        self.k1 = k1
+        self.b = b
+        self.segments = [
+            BM25Segment(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory) if os.path.isdir(directory) else [])
+            if not name.endswith(".tmp") and os.path.exists(os.path.join(directory, name, "segment.json"))
+        ]
+        self.num_docs = sum(segment.num_docs for segment in self.segments)
+        self.avg_doc_length = sum(segment.num_tokens for segment in self.segments) / max(self.num_docs, 1)
+
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term over all the segments"""
+        doc_freq = sum(len(segment.postings(term)[0]) for segment in self.segments)
+        return float(np.log(1 + (self.num_docs - doc_freq + 0.5) / (doc_freq + 0.5)))
+
+    def search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> list[tuple[Document, float, float]]:
+        """Documents with the highest BM25 score for a query.
+
+        Args:
+            query (str): query text
+            k (int, optional): number of documents. Defaults to 4.
+            filter (Optional[dict], optional): accepted meta-data values, {key: value or list of values}.
+                Defaults to None.
+
+        Returns:
+            list[tuple[Document, float, float]]: document, BM25 score and fraction of the query terms it contains
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if len(terms) == 0 or self.num_docs == 0:
+            return []
+        idfs = {term: self.idf(term) for term in terms}
+        candidates = []
+        for segment_id, segment in enumerate(self.segments):
+            mask, remaining = segment.filter_mask(filter) if filter is not None else (None, {})
+            doc_ids, weights = [], []
+            for term in terms:
+                docs, tfs = segment.postings(term)
+                if mask is not None:
+                    # Only the postings of the documents matching the filter are scored
+                    keep = mask[docs]
+                    docs, tfs = docs[keep], tfs[keep]
+                if len(docs) == 0:
+                    continue
+                tfs = np.asarray(tfs, dtype=np.float32)
+                norm = self.k1 * (1 - self.b + self.b * np.asarray(segment.doc_lengths[docs]) / self.avg_doc_length)
+                doc_ids.append(np.asarray(docs))
+                weights.append(idfs[term] * tfs * (self.k1 + 1) / (tfs + norm))
+            if len(doc_ids) == 0:
+                continue
+            # Sum the contributions of the terms per document, proportional to the postings and not the corpus size
+            docs, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weights))
+            matches = np.bincount(inverse)
+            # The conditions without a meta-data column are checked on the documents, all of them are candidates
+            limit = len(docs) if len(remaining) > 0 else min(k, len(docs))
+            top = np.argpartition(-scores, limit - 1)[:limit] if limit < len(docs) else np.arange(len(docs))
+            candidates.extend((scores[idx], segment_id, int(docs[idx]), matches[idx], remaining) for idx in top)
+
+        results = []
+        for score, segment_id, doc_id, num_matches, remaining in sorted(candidates, key=lambda item: -item[0]):
+            payload = self.segments[segment_id].read_doc(doc_id)
+            if len(remaining) > 0 and not match_filter(payload["metadata"], remaining):
+                continue
+            document = Document(page_content=payload["page_content"], metadata=payload["metadata"])
+            results.append((document, float(score), num_matches / len(terms)))
+            if len(results) == k:
+                break
+        return results
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
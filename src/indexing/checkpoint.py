@@ -0,0 +1,168 @@
+"""Checkpoints of the indexer and deterministic point ids, to resume an interrupted run without duplicate points."""
+import json
+import os
+import uuid
+from typing import Iterable, Iterator, Optional
+
+from langchain.schema import Document
+
+from src.common.utils import write_json_atomic
+
+# Namespace of the uuid5 point ids of the chunks
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "recipe-recommender/chunks")
+
+
+def get_point_ids(documents: list[Document]) -> list[str]:
+    """Deterministic point ids of chunks from their dataset, recipe and position within the recipe.
+
+    Re-indexing a recipe produces the same ids, so the vector db overwrites the points uploaded before an interruption
+    instead of duplicating them.
+
+    Args:
+        documents (list[Document]): chunks in the order returned by the splitter
+
+    Returns:
+        list[str]: uuid of each chunk
+    """
+    chunk_positions = {}
+    point_ids = []
+    for document in documents:
+        key = (document.metadata["dataset_name"], document.metadata["recipe_id"])
+        position = chunk_positions.get(key, 0)
+        chunk_positions[key] = position + 1
+        point_ids.append(str(uuid.uuid5(POINT_ID_NAMESPACE, f"{key[0]}/{key[1]}/{position}")))
+    return point_ids
+
+
+class IndexingCheckpoint:
+    """Progress of the indexer saved after every batch committed to the vector db.
+
+    The checkpoint holds the datasets completed so far and, for the dataset in progress, the number of recipe files
+    already indexed and the id of the last point uploaded. The file offset refers to a manifest of the dataset, the
+    listing of its files in the order of the first run, written line by line next to the checkpoint so the listing is
+    streamed instead of held in memory and a resumed run reads the files in the same order.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): json file of the checkpoint
+        """
+        self.path = path
+        self.completed_datasets: list[str] = []
+        self.dataset_name: Optional[str] = None
+        self.file_offset = 0
+        self.last_point_id: Optional[str] = None
+        self.num_points = 0
+
+    @classmethod
+    def load(cls, path: str) -> "IndexingCheckpoint":
+        """Checkpoint saved at path, an empty one if the file does not exist"""
+        checkpoint = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                state = json.load(file)
+            checkpoint.completed_datasets = state["completed_datasets"]
+            checkpoint.dataset_name = state["dataset_name"]
+            checkpoint.file_offset = state["file_offset"]
+            checkpoint.last_point_id = state["last_point_id"]
+            checkpoint.num_points = state["num_points"]
+        return checkpoint
+
+    def is_completed(self, dataset_name: str) -> bool:
+        """Whether all the files of a dataset are indexed"""
+        return dataset_name in self.completed_datasets
+
+    def get_file_offset(self, dataset_name: str) -> int:
+        """Number of files of a dataset indexed before the checkpoint"""
+        return self.file_offset if dataset_name == self.dataset_name else 0
+
+    def get_manifest_path(self, dataset_name: str) -> str:
+        """Path of the manifest with the listing of the files of a dataset"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), f"{dataset_name}.manifest")
+
+    def has_manifest(self, dataset_name: str) -> bool:
+        """Whether the listing of the files of a dataset was saved by an earlier run"""
+        return os.path.exists(self.get_manifest_path(dataset_name))
+
+    def write_manifest(self, dataset_name: str, files: Iterable[str]) -> int:
+        """Atomically write the listing of the files of a dataset, one path per line.
+
+        Args:
+            dataset_name (str): Name of the dataset
+            files (Iterable[str]): Paths of the files, consumed lazily
+
+        Returns:
+            int: Number of files in the manifest
+        """
+        path = self.get_manifest_path(dataset_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        num_files = 0
+        with open(tmp_path, "w") as file:
+            for file_path in files:
+                file.write(f"{file_path}\n")
+                num_files += 1
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        return num_files
+
+    def iter_manifest(self, dataset_name: str) -> Iterator[str]:
+        """Paths of the files of a dataset in the order of the manifest, read lazily"""
+        with open(self.get_manifest_path(dataset_name), "r") as file:
+            for line in file:
+                yield line.rstrip("\n")
+
+    def remove_manifest(self, dataset_name: str) -> None:
+        """Delete the manifest of a dataset"""
+        if self.has_manifest(dataset_name):
+            os.remove(self.get_manifest_path(dataset_name))
+
+    def save(self) -> None:
+        """Atomically write the checkpoint, so an interruption never leaves a partially written file"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        state = {
+            "completed_datasets": self.completed_datasets,
+            "dataset_name": self.dataset_name,
+            "file_offset": self.file_offset,
+            "last_point_id": self.last_point_id,
+            "num_points": self.num_points,
+        }
+        write_json_atomic(state, self.path)
+
+    def commit_batch(self, dataset_name: str, file_offset: int, point_ids: list[str]) -> None:
+        """Record a batch of files whose chunks are saved in the vector db.
+
+        Args:
+            dataset_name (str): Name of the dataset
+            file_offset (int): Number of files of the dataset indexed including the batch
+            point_ids (list[str]): ids of the chunks of the batch
+        """
+        self.dataset_name = dataset_name
+        self.file_offset = file_offset
+        if len(point_ids) > 0:
+            self.last_point_id = point_ids[-1]
+        self.num_points += len(point_ids)
+        self.save()
+
+    def complete_dataset(self, dataset_name: str) -> None:
+        """Mark a dataset as fully indexed"""
+        if dataset_name not in self.completed_datasets:
+            self.completed_datasets.append(dataset_name)
+        self.dataset_name = None
+        self.file_offset = 0
+        self.save()
+        self.remove_manifest(dataset_name)
+
+    def clear(self) -> None:
+        """Delete the checkpoint, e.g., at the start of a run that does not resume"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if self.dataset_name is not None:
+            self.remove_manifest(self.dataset_name)
+        self.completed_datasets = []
+        self.dataset_name = None
+        self.file_offset = 0
+        self.last_point_id = None
+        self.num_points = 0
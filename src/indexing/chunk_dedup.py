@@ -0,0 +1,92 @@
+"""Embed every distinct chunk text only once and fan the vector out to all the chunks sharing the text."""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+
+from src.common.tracing import span, traced
+
+
+def hash_text(text: str) -> bytes:
+    """128 bit digest of a chunk text used as the deduplication key"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class DedupStats:
+    """Number of chunk texts received and actually embedded."""
+
+    def __init__(self):
+        self.num_texts = 0
+        self.num_embedded = 0
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Fraction of the chunk texts served without running the embedding model"""
+        return round(1 - self.num_embedded / max(self.num_texts, 1), 4)
+
+    def as_dict(self) -> dict:
+        """Stats as a dictionary to add in the logs"""
+        return {"num_texts": self.num_texts, "num_embedded": self.num_embedded, "dedup_ratio": self.dedup_ratio}
+
+
+class DeduplicatingEmbeddings(Embeddings):
+    """Embeddings wrapper that skips the model for chunk texts seen before.
+
+    Texts are deduplicated within a call and, through a bounded LRU cache of vectors, across calls. Since the wrapper
+    returns one vector per input text, every recipe_id/dataset_name payload sharing a text receives the same vector.
+    """
+
+    def __init__(self, embeddings_model: Embeddings, max_cached_texts: int):
+        """
+        Args:
+            embeddings_model (Embeddings): The embeddings model used for the distinct texts
+            max_cached_texts (int): Maximum number of vectors kept in memory for deduplication across calls
+        """
+        self.embeddings_model = embeddings_model
+        self.max_cached_texts = max_cached_texts
+        self.cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self.stats = DedupStats()
+
+    def reset_stats(self) -> DedupStats:
+        """Reset the stats, e.g., at the start of a new dataset, and return the previous ones"""
+        stats, self.stats = self.stats, DedupStats()
+        return stats
+
+    @traced
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed the distinct texts not present in the cache and return a vector for each of the input texts.
+
+        Args:
+            texts (list[str]): chunk texts
+
+        Returns:
+            list[list[float]]: embedding vector for each text
+        """
+        keys = [hash_text(text) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                vectors[key] = self.cache[key]
+            else:
+                missing[key] = text
+
+        if len(missing) > 0:
+            with span("embeddings_model.embed_documents", num_texts=len(missing)):
+                embedded = self.embeddings_model.embed_documents(list(missing.values()))
+            for key, vector in zip(missing.keys(), embedded):
+                vectors[key] = self.cache[key] = np.asarray(vector, dtype=np.float32)
+            while len(self.cache) > self.max_cached_texts:
+                self.cache.popitem(last=False)
+
+        self.stats.num_texts += len(texts)
+        self.stats.num_embedded += len(missing)
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Queries are not deduplicated and are embedded by the wrapped model"""
+        return self.embeddings_model.embed_query(text)
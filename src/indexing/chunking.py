@@ -0,0 +1,147 @@
+"""Split recipe documents into chunks measured in the tokens of the embedding model."""
+from typing import Callable
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Separator between the "key: value" fields in the page content of a recipe document
+FIELD_SEPARATOR = "; \n"
+
+
+class ChunkingStats:
+    """Number of chunks produced for a dataset, optionally in comparison to a character based splitter."""
+
+    def __init__(self, compared: bool = False):
+        """
+        Args:
+            compared (bool, optional): whether the documents are also split with the character based splitter.
+                Defaults to False.
+        """
+        self.compared = compared
+        self.num_documents = 0
+        self.num_whole_documents = 0
+        self.num_chunks = 0
+        self.num_character_chunks = 0
+
+    @property
+    def chunks_saved(self) -> int:
+        """Number of chunks, hence embeddings, saved in comparison to the character based splitter"""
+        return self.num_character_chunks - self.num_chunks
+
+    def as_dict(self) -> dict:
+        """Stats as a dictionary to add in the logs"""
+        stats = {
+            "num_documents": self.num_documents,
+            "num_whole_documents": self.num_whole_documents,
+            "num_chunks": self.num_chunks,
+        }
+        if self.compared:
+            stats.update({"num_character_chunks": self.num_character_chunks, "chunks_saved": self.chunks_saved})
+        return stats
+
+
+class RecipeChunker:
+    """Token aware splitter for the recipe documents.
+
+    A document that fits into the sequence length of the embedding model is passed through as a single chunk. Longer
+    documents are split on the field boundaries of the recipe and the fields are greedily packed into chunks. Only a
+    single field longer than the model window is split further with the character based splitter.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[list[str]], list[int]],
+        max_tokens: int,
+        fallback_splitter: RecursiveCharacterTextSplitter,
+        compare_splitter: bool = False,
+    ):
+        """
+        Args:
+            count_tokens (Callable[[list[str]], list[int]]): Function returning the number of model tokens in texts
+            max_tokens (int): Maximum number of tokens in a chunk, i.e., the max_seq_length of the model
+            fallback_splitter (RecursiveCharacterTextSplitter): Splitter for fields longer than max_tokens
+            compare_splitter (bool, optional): Also split every document with the fallback splitter to count the
+                chunks the character based splitting would have produced, which doubles the splitting work.
+                Defaults to False.
+        """
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.fallback_splitter = fallback_splitter
+        self.compare_splitter = compare_splitter
+        self.stats = ChunkingStats(compare_splitter)
+
+    @classmethod
+    def from_sentence_transformer(
+        cls, model, fallback_splitter: RecursiveCharacterTextSplitter, compare_splitter: bool = False
+    ) -> "RecipeChunker":
+        """Create the chunker with the tokenizer and max_seq_length of a sentence transformer model.
+
+        Args:
+            model (SentenceTransformer): sentence transformer model used to compute the embeddings
+            fallback_splitter (RecursiveCharacterTextSplitter): Splitter for fields longer than the model window
+            compare_splitter (bool, optional): Count the chunks of the fallback splitter. Defaults to False.
+
+        Returns:
+            RecipeChunker: chunker measuring lengths in the tokens of the model
+        """
+        tokenizer = model.tokenizer
+
+        def count_tokens(texts: list[str]) -> list[int]:
+            return [len(ids) for ids in tokenizer(texts, add_special_tokens=True, truncation=False)["input_ids"]]
+
+        return cls(
+            count_tokens=count_tokens,
+            max_tokens=model.max_seq_length,
+            fallback_splitter=fallback_splitter,
+            compare_splitter=compare_splitter,
+        )
+
+    def reset_stats(self) -> ChunkingStats:
+        """Reset the stats, e.g., at the start of a new dataset, and return the previous ones"""
+        stats, self.stats = self.stats, ChunkingStats(self.compare_splitter)
+        return stats
+
+    def _pack_fields(self, document: Document) -> list[str]:
+        """Greedily pack the fields of a long document into chunks fitting the model window"""
+        fields = document.page_content.split(FIELD_SEPARATOR)
+        num_tokens = self.count_tokens(fields)
+        # Token count of a chunk is approximated by the sum of the token counts of its fields
+        chunks, current, current_tokens = [], [], 0
+        for field, field_tokens in zip(fields, num_tokens):
+            if len(current) > 0 and current_tokens + field_tokens > self.max_tokens:
+                chunks.append(FIELD_SEPARATOR.join(current))
+                current, current_tokens = [], 0
+            if field_tokens > self.max_tokens:
+                chunks.extend(self.fallback_splitter.split_text(field))
+                continue
+            current.append(field)
+            current_tokens += field_tokens
+        if len(current) > 0:
+            chunks.append(FIELD_SEPARATOR.join(current))
+        return chunks
+
+    def split_documents(self, documents: list[Document]) -> list[Document]:
+        """Split the documents into chunks, keeping whole documents when they fit into the model window.
+
+        Args:
+            documents (list[Document]): recipe documents
+
+        Returns:
+            list[Document]: chunks of the documents with the meta-data of the parent document
+        """
+        chunks = []
+        num_tokens = self.count_tokens([document.page_content for document in documents])
+        for document, document_tokens in zip(documents, num_tokens):
+            if document_tokens <= self.max_tokens:
+                chunks.append(document)
+                self.stats.num_whole_documents += 1
+            else:
+                chunks.extend(
+                    Document(page_content=text, metadata=dict(document.metadata))
+                    for text in self._pack_fields(document)
+                )
+        self.stats.num_documents += len(documents)
+        self.stats.num_chunks += len(chunks)
+        if self.compare_splitter:
+            self.stats.num_character_chunks += len(self.fallback_splitter.split_documents(documents))
+        return chunks
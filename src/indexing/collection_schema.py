@@ -0,0 +1,90 @@
+"""Explicit schema of the Qdrant collection: HNSW and on-disk settings, quantization and payload indexes."""
+from typing import Optional
+
+from qdrant_client import QdrantClient, models
+
+from src.indexing.attributes import is_range_condition
+from src.indexing.compression import get_qdrant_quantization_config
+
+
+def get_vectors_config(vector_size: int | dict[str, int], config: dict) -> models.VectorParams | dict:
+    """Vector parameters of the collection, a single unnamed vector or a vector per name for the named vectors"""
+    if isinstance(vector_size, dict):
+        return {name: get_vectors_config(size, config) for name, size in vector_size.items()}
+    return models.VectorParams(size=vector_size, distance=models.Distance.COSINE, on_disk=config["on_disk_vectors"])
+
+
+def ensure_qdrant_collection(
+    client: QdrantClient, collection_name: str, vector_size: int | dict[str, int], config: dict
+) -> None:
+    """Create the collection with the configured schema if it does not exist, and create the payload indexes.
+
+    Creating a payload index which already exists is a no-op in Qdrant, so indexes added to the config later are also
+    created for an existing collection. Keyword fields get a keyword index and numeric fields an integer index.
+
+    Args:
+        client (QdrantClient): client of the Qdrant server
+        collection_name (str): name of the collection
+        vector_size (int | dict[str, int]): dimension of the embeddings, or of the embeddings of each vector name for
+            a collection with named vectors
+        config (dict): vector_store parameters from params.yaml
+
+    Raises:
+        ValueError: if an existing collection does not have the requested vector names, named vectors cannot be added
+            to the points of an existing collection
+    """
+    if collection_name not in {collection.name for collection in client.get_collections().collections}:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=get_vectors_config(vector_size, config),
+            hnsw_config=models.HnswConfigDiff(
+                m=config["hnsw"]["m"], ef_construct=config["hnsw"]["ef_construct"], on_disk=config["hnsw"]["on_disk"]
+            ),
+            on_disk_payload=config["on_disk_payload"],
+            quantization_config=get_qdrant_quantization_config(config["compression"]),
+        )
+    elif isinstance(vector_size, dict):
+        vectors = client.get_collection(collection_name).config.params.vectors
+        missing = set(vector_size) - (set(vectors) if isinstance(vectors, dict) else set())
+        if len(missing) > 0:
+            raise ValueError(
+                f"Collection {collection_name} has no vectors named {sorted(missing)}, index into a new collection"
+            )
+    # langchain saves the meta-data of the chunks under the metadata key of the payload
+    for field in config["payload_indexes"]:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=f"metadata.{field}",
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+    # Integer indexes answer the range conditions on the numeric fields while traversing the HNSW graph
+    for field in config["payload_range_indexes"]:
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=f"metadata.{field}",
+            field_schema=models.PayloadSchemaType.INTEGER,
+        )
+
+
+def get_qdrant_filter(filter: Optional[dict]) -> Optional[models.Filter]:
+    """Qdrant filter of the meta-data conditions of a search.
+
+    Args:
+        filter (Optional[dict]): accepted meta-data values, {key: value, list of values or range}, a range being a
+            dictionary of gt, gte, lt and lte bounds
+
+    Returns:
+        Optional[models.Filter]: filter with a condition per key, resolved by the payload indexes of the fields
+    """
+    if filter is None:
+        return None
+    conditions = []
+    for key, value in filter.items():
+        if is_range_condition(value):
+            condition = models.FieldCondition(key=f"metadata.{key}", range=models.Range(**value))
+        elif isinstance(value, (list, tuple, set)):
+            condition = models.FieldCondition(key=f"metadata.{key}", match=models.MatchAny(any=list(value)))
+        else:
+            condition = models.FieldCondition(key=f"metadata.{key}", match=models.MatchValue(value=value))
+        conditions.append(condition)
+    return models.Filter(must=conditions)
@@ -0,0 +1,75 @@
+"""Version of a collection bumped by the indexer whenever it writes to the collection."""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+from src.common.utils import write_json_atomic
+
+# Directory under DATA_ROOT with the version files of the collections
+VERSION_DIR = "collection_versions"
+
+
+def get_version_path(retriver_db_name: str, backend: str) -> str:
+    """Version file of a collection of a vector db backend"""
+    return os.path.join(os.getenv("DATA_ROOT"), VERSION_DIR, f"{retriver_db_name}_{backend}.json")
+
+
+def bump_collection_version(path: str) -> str:
+    """Write a new random version of a collection, readers holding results of the previous version drop them.
+
+    Args:
+        path (str): version file of the collection
+
+    Returns:
+        str: new version
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    version = uuid.uuid4().hex
+    write_json_atomic({"version": version, "updated_at": time.time()}, path)
+    return version
+
+
+def read_collection_version(path: str) -> Optional[str]:
+    """Current version of a collection, None if the indexer never wrote it"""
+    try:
+        with open(path, "r") as file:
+            return json.load(file)["version"]
+    except FileNotFoundError:
+        return None
+
+
+class CollectionVersionWatcher:
+    """Detect the new versions of a collection written by the indexer while a reader serves it.
+
+    The version file is read at most once every check_seconds, so a check is usually a clock read, and a new version
+    is reported to a single caller, which refreshes what it read from the collection.
+    """
+
+    def __init__(self, path: str, check_seconds: float = 5.0):
+        """
+        Args:
+            path (str): version file of the collection
+            check_seconds (float, optional): minimum time between two reads of the version file. Defaults to 5.0.
+        """
+        self.path = path
+        self.check_seconds = check_seconds
+        self.version = read_collection_version(path)
+        self._next_check = time.monotonic() + check_seconds
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """Whether the indexer wrote a new version of the collection since the previous check"""
+        if time.monotonic() < self._next_check:
+            return False
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return False
+            self._next_check = time.monotonic() + self.check_seconds
+            version = read_collection_version(self.path)
+            if version == self.version:
+                return False
+            self.version = version
+            return True
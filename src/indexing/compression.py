@@ -0,0 +1,121 @@
+"""Compressed storage of the embedding vectors: float16, int8 scalar quantization and dimension truncation."""
+from typing import Optional
+
+import numpy as np
+from qdrant_client import models
+
+# Storage types supported by the local vector store with their file suffix
+DTYPES = {"float32": (np.float32, "f32"), "float16": (np.float16, "f16"), "int8": (np.int8, "i8")}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale the vectors, the last axis, to unit norm"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def truncate(vectors: np.ndarray, dim: Optional[int]) -> np.ndarray:
+    """Keep the first dim dimensions of normalized vectors and normalize them again"""
+    if dim is None or dim >= vectors.shape[-1]:
+        return vectors
+    return normalize(vectors[..., :dim])
+
+
+class VectorCodec:
+    """Encode normalized float32 vectors into the storage type and decode them back for scoring.
+
+    int8 uses symmetric scalar quantization with a scale per vector, so vectors can be encoded one batch at a time
+    without knowing the distribution of the full corpus.
+    """
+
+    def __init__(self, dtype: str):
+        """
+        Args:
+            dtype (str): storage type, float32, float16 or int8
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype}, expected one of {list(DTYPES)}")
+        self.dtype = dtype
+        self.numpy_dtype, self.suffix = DTYPES[dtype]
+
+    @property
+    def has_scales(self) -> bool:
+        """Whether the codec stores a float32 scale for each vector"""
+        return self.dtype == "int8"
+
+    @property
+    def is_lossy(self) -> bool:
+        """Whether the decoded vectors differ noticeably from the original ones"""
+        return self.dtype == "int8"
+
+    def bytes_per_vector(self, dim: int) -> int:
+        """Number of bytes needed to store a vector of the given dimension"""
+        return dim * np.dtype(self.numpy_dtype).itemsize + (4 if self.has_scales else 0)
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        """Encode float32 vectors.
+
+        Args:
+            vectors (np.ndarray): (n, dim) float32 vectors
+
+        Returns:
+            tuple[np.ndarray, Optional[np.ndarray]]: codes in the storage type and the per vector scales for int8
+        """
+        if not self.has_scales:
+            return vectors.astype(self.numpy_dtype), None
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def decode(self, codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decode the stored codes into float32 vectors"""
+        vectors = np.asarray(codes, dtype=np.float32)
+        if self.has_scales:
+            vectors *= np.asarray(scales, dtype=np.float32)[..., None]
+        return vectors
+
+
+def get_qdrant_quantization_config(compression: dict) -> Optional[models.QuantizationConfig]:
+    """Quantization config of a Qdrant collection from the compression parameters.
+
+    Args:
+        compression (dict): compression parameters from params.yaml
+
+    Returns:
+        Optional[models.QuantizationConfig]: scalar or product quantization config, None for no quantization
+    """
+    quantization = compression.get("quantization", "none")
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=compression.get("always_ram", True)
+            )
+        )
+    if quantization == "product":
+        return models.ProductQuantization(
+            product=models.ProductQuantizationConfig(
+                compression=models.CompressionRatio(compression.get("product_compression", "x16")),
+                always_ram=compression.get("always_ram", True),
+            )
+        )
+    return None
+
+
+def get_qdrant_search_params(compression: dict, hnsw_ef: Optional[int] = None) -> Optional[models.SearchParams]:
+    """Search params rescoring the quantized candidates of a Qdrant collection with the original vectors.
+
+    Args:
+        compression (dict): compression parameters from params.yaml
+        hnsw_ef (Optional[int], optional): size of the candidate list of the HNSW search. Defaults to None.
+
+    Returns:
+        Optional[models.SearchParams]: search params, None when the default ones are sufficient
+    """
+    if compression.get("quantization", "none") == "none":
+        return models.SearchParams(hnsw_ef=hnsw_ef) if hnsw_ef is not None else None
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=models.QuantizationSearchParams(
+            rescore=compression.get("rescore", True), oversampling=compression.get("oversampling", 2.0)
+        ),
+    )
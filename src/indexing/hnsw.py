@@ -0,0 +1,508 @@
+"""HNSW graphs of the local vector store: hnswlib, and a pure python graph over memory-mapped vectors persisted as
+flat arrays so that it can be opened without loading it."""
+import heapq
+import json
+import os
+import random
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from src.common.utils import write_json_atomic
+
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover - new collections fall back to the pure python graph
+    hnswlib = None
+
+# Marker for an empty slot in the neighbor lists
+NO_NEIGHBOR = -1
+
+
+class MappedArray:
+    """Memory-mapped array on disk which grows along the first axis."""
+
+    def __init__(self, path: str, dtype: np.dtype, row_shape: tuple, capacity: int, read_only: bool):
+        """
+        Args:
+            path (str): path of the raw binary file
+            dtype (np.dtype): data type of the array
+            row_shape (tuple): shape of a single row of the array
+            capacity (int): number of rows present in the file
+            read_only (bool): open the file in read only mode
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.read_only = read_only
+        self.capacity = 0
+        self._mmap = None
+        self.array = np.empty((0, *self.row_shape), dtype=self.dtype)
+        if capacity > 0:
+            self._map(capacity)
+
+    @property
+    def row_nbytes(self) -> int:
+        """Number of bytes in a single row"""
+        return int(np.prod(self.row_shape, dtype=np.int64)) * self.dtype.itemsize
+
+    def _map(self, capacity: int) -> None:
+        self._mmap = np.memmap(
+            self.path, dtype=self.dtype, mode="r" if self.read_only else "r+", shape=(capacity, *self.row_shape)
+        )
+        # Plain ndarray view of the mapping, indexing a np.memmap subclass is several times slower
+        self.array = self._mmap.view(np.ndarray)
+        self.capacity = capacity
+
+    def ensure_capacity(self, num_rows: int, fill_value: Optional[int] = None) -> None:
+        """Grow the file, doubling its size, so that it holds at least num_rows rows.
+
+        Args:
+            num_rows (int): required number of rows
+            fill_value (Optional[int], optional): value for the newly added rows. Defaults to None, i.e., zeros.
+        """
+        if num_rows <= self.capacity:
+            return
+        capacity = max(num_rows, 2 * self.capacity, 1024)
+        self.flush()
+        self._mmap = self.array = None
+        with open(self.path, "ab") as file:
+            file.truncate(capacity * self.row_nbytes)
+        previous_capacity = self.capacity
+        self._map(capacity)
+        if fill_value is not None:
+            self.array[previous_capacity:] = fill_value
+
+    def flush(self) -> None:
+        """Write the modified pages to the disk"""
+        if self._mmap is not None and not self.read_only:
+            self._mmap.flush()
+
+
+class HNSWGraph:
+    """Hierarchical navigable small world graph for approximate nearest neighbor search with cosine similarity.
+
+    Layer 0 holds all the nodes and is stored as a memory-mapped (capacity, 2 * m) int32 matrix of neighbors. The upper
+    layers hold a small fraction of the nodes, they are kept as dictionaries while writing and are persisted as sorted
+    node ids with a matching neighbor matrix per layer, which are memory-mapped for reading. Vectors are not owned by
+    the graph, they are read through a function passed by the vector store.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        get_vectors: Callable[[np.ndarray], np.ndarray],
+        m: int = 16,
+        ef_construct: int = 100,
+        read_only: bool = True,
+        seed: int = 42,
+    ):
+        """
+        Args:
+            directory (str): directory where the graph files are saved
+            get_vectors (Callable[[np.ndarray], np.ndarray]): function returning the normalized float32 vectors of the
+                given node ids
+            m (int, optional): number of neighbors per node on the upper layers, 2 * m on layer 0. Defaults to 16.
+            ef_construct (int, optional): size of the candidate list while inserting nodes. Defaults to 100.
+            read_only (bool, optional): open the graph for searching only. Defaults to True.
+            seed (int, optional): seed for drawing the layers of the nodes. Defaults to 42.
+        """
+        self.directory = directory
+        self.get_vectors = get_vectors
+        self.read_only = read_only
+        self.seed = seed
+        meta_path = os.path.join(directory, "graph.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+        else:
+            meta = {"m": m, "ef_construct": ef_construct, "count": 0, "entry_point": NO_NEIGHBOR, "max_level": -1}
+        self.m = meta["m"]
+        self.ef_construct = meta["ef_construct"]
+        self.count = meta["count"]
+        self.entry_point = meta["entry_point"]
+        self.max_level = meta["max_level"]
+        self.level_multiplier = 1 / np.log(self.m)
+
+        self.links = MappedArray(
+            os.path.join(directory, "graph_l0.i32"), np.int32, (2 * self.m,), meta.get("capacity", 0), read_only
+        )
+        self.levels = MappedArray(os.path.join(directory, "levels.i8"), np.int8, (), meta.get("capacity", 0), read_only)
+        # Upper layers: level -> node -> neighbors while writing, level -> (sorted nodes, neighbors) while reading
+        self.upper_layers = {}
+        for level in range(1, self.max_level + 1):
+            nodes = np.load(os.path.join(directory, f"graph_l{level}_nodes.npy"), mmap_mode="r")
+            links = np.load(os.path.join(directory, f"graph_l{level}_links.npy"), mmap_mode="r")
+            if read_only:
+                self.upper_layers[level] = (nodes, links)
+            else:
+                self.upper_layers[level] = {
+                    int(node): [int(n) for n in row if n != NO_NEIGHBOR] for node, row in zip(nodes, links)
+                }
+
+    @property
+    def stores_vectors(self) -> bool:
+        """Whether the graph holds its own copy of the vectors, the memory-mapped vectors are read instead"""
+        return False
+
+    @property
+    def nbytes_per_node(self) -> int:
+        """Number of bytes of the layer 0 links and level of a node"""
+        return self.links.row_nbytes + self.levels.row_nbytes
+
+    def neighbors(self, node: int, level: int) -> np.ndarray:
+        """Neighbors of a node on a given layer of the graph"""
+        if level == 0:
+            row = self.links.array[node]
+        elif self.read_only:
+            nodes, links = self.upper_layers[level]
+            row = links[np.searchsorted(nodes, node)]
+        else:
+            return np.asarray(self.upper_layers[level].get(node, []), dtype=np.int32)
+        return row[row != NO_NEIGHBOR]
+
+    def similarities(self, query: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        """Cosine similarities between a normalized query vector and the given nodes"""
+        return self.get_vectors(nodes) @ query
+
+    def _set_neighbors(self, node: int, level: int, neighbors: list[int]) -> None:
+        if level == 0:
+            self.links.array[node] = NO_NEIGHBOR
+            self.links.array[node, : len(neighbors)] = neighbors
+        else:
+            self.upper_layers[level][node] = list(neighbors)
+
+    def search_layer(
+        self, query: np.ndarray, entry_points: list[int], ef: int, level: int, allowed: Optional[np.ndarray] = None
+    ) -> list[tuple[float, int]]:
+        """Best first search on a single layer of the graph.
+
+        Args:
+            query (np.ndarray): normalized query vector
+            entry_points (list[int]): nodes to start the search from
+            ef (int): size of the dynamic candidate list
+            level (int): layer of the graph
+            allowed (Optional[np.ndarray], optional): boolean mask of the nodes allowed in the results. Other nodes are
+                still traversed to keep the graph connected. Defaults to None, i.e., all the nodes are allowed.
+
+        Returns:
+            list[tuple[float, int]]: (similarity, node) of the closest nodes sorted by decreasing similarity
+        """
+        visited = set(entry_points)
+        entry_points = np.asarray(entry_points, dtype=np.int64)
+        similarities = self.similarities(query, entry_points)
+        candidates = [(-s, int(node)) for s, node in zip(similarities, entry_points)]
+        heapq.heapify(candidates)
+        results = []
+        for s, node in zip(similarities, entry_points):
+            if allowed is None or allowed[node]:
+                heapq.heappush(results, (float(s), int(node)))
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while len(candidates) > 0:
+            negative_similarity, node = heapq.heappop(candidates)
+            if len(results) >= ef and -negative_similarity < results[0][0]:
+                break
+            neighbors = [n for n in self.neighbors(node, level).tolist() if n not in visited]
+            if len(neighbors) == 0:
+                continue
+            visited.update(neighbors)
+            neighbors = np.asarray(neighbors, dtype=np.int64)
+            for s, neighbor in zip(self.similarities(query, neighbors).tolist(), neighbors.tolist()):
+                if len(results) < ef or s > results[0][0]:
+                    heapq.heappush(candidates, (-s, neighbor))
+                    if allowed is None or allowed[neighbor]:
+                        heapq.heappush(results, (s, neighbor))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _select_neighbors(self, candidates: list[tuple[float, int]], m: int) -> list[int]:
+        """Heuristic neighbor selection keeping candidates closer to the node than to the already selected ones"""
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        nodes = np.asarray([node for _, node in candidates], dtype=np.int64)
+        candidate_vectors = self.get_vectors(nodes)
+        pairwise = candidate_vectors @ candidate_vectors.T
+        similarities = np.asarray([s for s, _ in candidates], dtype=np.float32)
+        # Bit j of the mask of a candidate is set if it is at least as close to candidate j as to the node, the
+        # candidate is discarded if any of these is selected. Only the better candidates are selected before it
+        packed = np.packbits(pairwise.T >= similarities[:, None], axis=1, bitorder="little")
+        data, width = packed.tobytes(), packed.shape[1]
+        selected, discarded = [], []
+        selected_mask = 0
+        for idx in range(len(candidates)):
+            start = idx * width
+            end = start + width
+            if int.from_bytes(data[start:end], "little") & selected_mask:
+                discarded.append(idx)
+                continue
+            selected.append(idx)
+            if len(selected) == m:
+                break
+            selected_mask |= 1 << idx
+        # Fill the remaining slots with the closest discarded candidates
+        selected.extend(discarded[: m - len(selected)])
+        return nodes[selected].tolist()
+
+    def _draw_level(self, node: int) -> int:
+        rng = random.Random(self.seed * 1_000_003 + node)
+        return min(int(-np.log(1.0 - rng.random()) * self.level_multiplier), 127)
+
+    def insert(self, node: int) -> None:
+        """Insert the next node of the vector store into the graph.
+
+        Args:
+            node (int): row of the node in the vector store, nodes are inserted in increasing order
+        """
+        level = self._draw_level(node)
+        self.links.ensure_capacity(node + 1, fill_value=NO_NEIGHBOR)
+        self.levels.ensure_capacity(node + 1)
+        self.levels.array[node] = level
+        self.links.array[node] = NO_NEIGHBOR
+        for upper_level in range(1, level + 1):
+            self.upper_layers.setdefault(upper_level, {})[node] = []
+        self.count = max(self.count, node + 1)
+
+        if self.entry_point == NO_NEIGHBOR:
+            self.entry_point, self.max_level = node, level
+            return
+
+        query = self.get_vectors(np.asarray([node]))[0]
+        entry_points = [self.entry_point]
+        for current_level in range(self.max_level, level, -1):
+            entry_points = [self.search_layer(query, entry_points, 1, current_level)[0][1]]
+
+        for current_level in range(min(level, self.max_level), -1, -1):
+            max_neighbors = 2 * self.m if current_level == 0 else self.m
+            candidates = self.search_layer(query, entry_points, self.ef_construct, current_level)
+            candidates = [(s, n) for s, n in candidates if n != node]
+            neighbors = self._select_neighbors(candidates, max_neighbors)
+            self._set_neighbors(node, current_level, neighbors)
+            for neighbor in neighbors:
+                neighbor_links = self.neighbors(neighbor, current_level).tolist()
+                if len(neighbor_links) < max_neighbors:
+                    self._set_neighbors(neighbor, current_level, neighbor_links + [node])
+                    continue
+                # Shrink the neighbor list of the neighbor with the same heuristic
+                links = np.asarray(neighbor_links + [node], dtype=np.int64)
+                link_similarities = self.similarities(self.get_vectors(np.asarray([neighbor]))[0], links)
+                ranked = sorted(zip(link_similarities.tolist(), links.tolist()), reverse=True)
+                self._set_neighbors(neighbor, current_level, self._select_neighbors(ranked, max_neighbors))
+            entry_points = [n for _, n in candidates] or entry_points
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def insert_batch(self, nodes: np.ndarray) -> None:
+        """Insert the new nodes of the vector store, the replaced nodes keep their links.
+
+        Args:
+            nodes (np.ndarray): rows of the new or replaced nodes in the vector store
+        """
+        for node in nodes.tolist():
+            if node >= self.count:
+                self.insert(node)
+
+    def search(
+        self, query: np.ndarray, k: int, ef: int, allowed: Optional[np.ndarray] = None
+    ) -> list[tuple[float, int]]:
+        """Approximate k nearest neighbors of a query vector.
+
+        Args:
+            query (np.ndarray): normalized query vector
+            k (int): number of neighbors
+            ef (int): size of the dynamic candidate list on layer 0, at least k
+            allowed (Optional[np.ndarray], optional): boolean mask of the nodes allowed in the results. Defaults to
+                None, i.e., all the nodes are allowed.
+
+        Returns:
+            list[tuple[float, int]]: (similarity, node) of the neighbors sorted by decreasing similarity
+        """
+        if self.entry_point == NO_NEIGHBOR:
+            return []
+        entry_points = [self.entry_point]
+        for level in range(self.max_level, 0, -1):
+            entry_points = [self.search_layer(query, entry_points, 1, level)[0][1]]
+        return self.search_layer(query, entry_points, max(ef, k), 0, allowed=allowed)[:k]
+
+    def flush(self) -> None:
+        """Persist the graph to the disk"""
+        self.links.flush()
+        self.levels.flush()
+        for level, layer in self.upper_layers.items():
+            nodes = np.asarray(sorted(layer), dtype=np.int32)
+            links = np.full((len(nodes), self.m), NO_NEIGHBOR, dtype=np.int32)
+            for row, node in enumerate(nodes.tolist()):
+                links[row, : len(layer[node])] = layer[node]
+            np.save(os.path.join(self.directory, f"graph_l{level}_nodes.npy"), nodes)
+            np.save(os.path.join(self.directory, f"graph_l{level}_links.npy"), links)
+        meta = {
+            "backend": "python",
+            "m": self.m,
+            "ef_construct": self.ef_construct,
+            "count": self.count,
+            "capacity": self.links.capacity,
+            "entry_point": self.entry_point,
+            "max_level": self.max_level,
+        }
+        with open(os.path.join(self.directory, "graph.json"), "w") as file:
+            json.dump(meta, file)
+
+
+class HnswlibGraph:
+    """HNSW graph of hnswlib with the interface of HNSWGraph, built in C++ with all the cores.
+
+    The graph keeps its own float32 copy of the index vectors, decoded from the vector store, and is loaded in memory
+    from graph.hnswlib when the collection is opened. Inserting an existing node refreshes its vector and links.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        get_vectors: Callable[[np.ndarray], np.ndarray],
+        m: int = 16,
+        ef_construct: int = 100,
+        read_only: bool = True,
+        seed: int = 42,
+        num_threads: int = -1,
+    ):
+        """
+        Args:
+            directory (str): directory where the graph files are saved
+            get_vectors (Callable[[np.ndarray], np.ndarray]): function returning the normalized float32 vectors of the
+                given node ids
+            m (int, optional): number of neighbors per node on the upper layers, 2 * m on layer 0. Defaults to 16.
+            ef_construct (int, optional): size of the candidate list while inserting nodes. Defaults to 100.
+            read_only (bool, optional): open the graph for searching only. Defaults to True.
+            seed (int, optional): seed for drawing the layers of the nodes. Defaults to 42.
+            num_threads (int, optional): number of threads inserting the nodes. Defaults to -1, i.e., all the cores.
+        """
+        self.directory = directory
+        self.get_vectors = get_vectors
+        self.read_only = read_only
+        self.seed = seed
+        self.num_threads = num_threads
+        self.index_path = os.path.join(directory, "graph.hnswlib")
+        meta_path = os.path.join(directory, "graph.json")
+        meta = {"m": m, "ef_construct": ef_construct, "count": 0, "dim": None}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+        self.m = meta["m"]
+        self.ef_construct = meta["ef_construct"]
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        self.index = None
+        if self.count > 0:
+            self.index = hnswlib.Index(space="ip", dim=self.dim)
+            self.index.load_index(self.index_path)
+            self.count = self.index.get_current_count()
+
+    @property
+    def stores_vectors(self) -> bool:
+        """Whether the graph holds its own copy of the vectors, the memory-mapped vectors are read instead"""
+        return True
+
+    @property
+    def nbytes_per_node(self) -> int:
+        """Number of bytes of the float32 vector, layer 0 links and label of a node"""
+        return 4 * (self.dim or 0) + 4 * (2 * self.m + 1) + 8
+
+    def insert_batch(self, nodes: np.ndarray) -> None:
+        """Insert new nodes of the vector store and refresh the vectors of the replaced ones.
+
+        Args:
+            nodes (np.ndarray): rows of the new or replaced nodes in the vector store
+        """
+        if len(nodes) == 0:
+            return
+        vectors = self.get_vectors(nodes)
+        if self.index is None:
+            self.dim = vectors.shape[1]
+            self.index = hnswlib.Index(space="ip", dim=self.dim)
+            self.index.init_index(max_elements=1024, ef_construction=self.ef_construct, M=self.m, random_seed=self.seed)
+        num_nodes = int(nodes.max()) + 1
+        if num_nodes > self.index.get_max_elements():
+            self.index.resize_index(max(num_nodes, 2 * self.index.get_max_elements()))
+        self.index.add_items(vectors, nodes, num_threads=self.num_threads)
+        self.count = self.index.get_current_count()
+
+    def insert(self, node: int) -> None:
+        """Insert the next node of the vector store into the graph"""
+        self.insert_batch(np.asarray([node], dtype=np.int64))
+
+    def search(
+        self, query: np.ndarray, k: int, ef: int, allowed: Optional[np.ndarray] = None
+    ) -> list[tuple[float, int]]:
+        """Approximate k nearest neighbors of a query vector.
+
+        Args:
+            query (np.ndarray): normalized query vector
+            k (int): number of neighbors
+            ef (int): size of the dynamic candidate list on layer 0, at least k
+            allowed (Optional[np.ndarray], optional): boolean mask of the nodes allowed in the results. Defaults to
+                None, i.e., all the nodes are allowed.
+
+        Returns:
+            list[tuple[float, int]]: (similarity, node) of the neighbors sorted by decreasing similarity
+        """
+        if self.index is None:
+            return []
+        k = min(k, self.count if allowed is None else int(allowed.sum()))
+        filter = None if allowed is None else lambda node: bool(allowed[node])
+        self.index.set_ef(max(ef, k))
+        while k > 0:
+            try:
+                nodes, distances = self.index.knn_query(query, k=k, num_threads=1, filter=filter)
+            except RuntimeError:
+                # Fewer than k allowed nodes are reachable by the filtered search
+                k //= 2
+                continue
+            # Inner product distance of hnswlib is 1 - similarity
+            return [(1.0 - float(distance), int(node)) for distance, node in zip(distances[0], nodes[0])]
+        return []
+
+    def flush(self) -> None:
+        """Persist the graph to the disk"""
+        if self.read_only or self.index is None:
+            return
+        self.index.save_index(f"{self.index_path}.tmp")
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+        meta = {"backend": "hnswlib", "m": self.m, "ef_construct": self.ef_construct, "count": self.count}
+        write_json_atomic({**meta, "dim": self.dim}, os.path.join(self.directory, "graph.json"))
+
+
+def open_graph(
+    directory: str,
+    get_vectors: Callable[[np.ndarray], np.ndarray],
+    m: int = 16,
+    ef_construct: int = 100,
+    read_only: bool = True,
+) -> Union[HNSWGraph, HnswlibGraph]:
+    """Open the HNSW graph of a collection with the backend it was built with, hnswlib for a new graph if installed.
+
+    Args:
+        directory (str): directory where the graph files are saved
+        get_vectors (Callable[[np.ndarray], np.ndarray]): function returning the normalized float32 vectors of the
+            given node ids
+        m (int, optional): number of neighbors per node of a new graph. Defaults to 16.
+        ef_construct (int, optional): size of the candidate list while building a new graph. Defaults to 100.
+        read_only (bool, optional): open the graph for searching only. Defaults to True.
+
+    Returns:
+        Union[HNSWGraph, HnswlibGraph]: graph of the collection
+    """
+    meta_path = os.path.join(directory, "graph.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as file:
+            # Graphs saved before the hnswlib backend have no backend
+            backend = json.load(file).get("backend", "python")
+    else:
+        backend = "hnswlib" if hnswlib is not None else "python"
+    if backend == "python":
+        return HNSWGraph(directory, get_vectors=get_vectors, m=m, ef_construct=ef_construct, read_only=read_only)
+    if hnswlib is None:
+        raise ImportError(f"The graph in {directory} was built with hnswlib, which is not installed")
+    return HnswlibGraph(directory, get_vectors=get_vectors, m=m, ef_construct=ef_construct, read_only=read_only)
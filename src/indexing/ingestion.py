@@ -0,0 +1,130 @@
+"""Stream recipe json files from disk and build langchain documents in parallel batches."""
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from langchain.schema import Document
+
+from src.common.tracing import traced
+
+try:
+    import orjson
+
+    def load_json_bytes(content: bytes) -> dict:
+        """Parse a json document using orjson"""
+        return orjson.loads(content)
+
+except ImportError:  # pragma: no cover - orjson is an optional speed up
+
+    def load_json_bytes(content: bytes) -> dict:
+        """Parse a json document using the standard library parser"""
+        return json.loads(content)
+
+
+def iter_json_files(directory: str) -> Iterator[str]:
+    """Lazily list the json files in a directory without materializing the full listing.
+
+    The files come in the arbitrary order of the directory, callers needing a stable order, e.g., to resume from a
+    file offset, save the listing to a manifest of the indexing checkpoint.
+
+    Args:
+        directory (str): Directory containing the recipe json files
+
+    Yields:
+        str: Path of a json file
+    """
+    if not os.path.isdir(directory):
+        return
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".json") and entry.is_file():
+                yield entry.path
+
+
+@traced
+def read_json_file(json_file_path: str) -> dict:
+    """Read and parse a json file in a single read call.
+
+    Args:
+        json_file_path (str): path to the json file
+
+    Returns:
+        dict: parsed json content
+    """
+    with open(json_file_path, "rb") as file:
+        return load_json_bytes(file.read())
+
+
+def iter_document_batches(
+    json_files: Iterable[str],
+    document_builder: Callable[[dict], Document],
+    batch_size: int,
+    num_workers: int,
+    prefetch_batches: int = 2,
+) -> Iterator[tuple[int, list[Document]]]:
+    """Read and parse json files in a thread pool and yield documents in batches.
+
+    File reads and json parsing run in worker threads while the caller consumes the previous batch. At most
+    `prefetch_batches` batches are in flight, so memory stays bounded irrespective of the number of files.
+
+    Args:
+        json_files (Iterable[str]): Paths of the json files, consumed lazily
+        document_builder (Callable[[dict], Document]): Function to convert parsed json into a langchain document
+        batch_size (int): Number of documents in a single batch
+        num_workers (int): Number of threads used to read and parse the files
+        prefetch_batches (int, optional): Number of batches read ahead of the consumer. Defaults to 2.
+
+    Yields:
+        tuple[int, list[Document]]: Batch index and the list of documents in the batch
+    """
+
+    @traced(name="ingestion.build_document")
+    def build(json_file_path: str) -> Document:
+        return document_builder(read_json_file(json_file_path))
+
+    json_files = iter(json_files)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+
+        def submit_next() -> bool:
+            paths = list(itertools.islice(json_files, batch_size))
+            if len(paths) == 0:
+                return False
+            pending.append([executor.submit(build, path) for path in paths])
+            return True
+
+        while len(pending) < prefetch_batches and submit_next():
+            pass
+
+        idx = 0
+        while len(pending) > 0:
+            futures = pending.popleft()
+            submit_next()
+            yield idx, [future.result() for future in futures]
+            idx += 1
+
+
+class IngestionStats:
+    """Track the throughput of reading files from the disk."""
+
+    def __init__(self):
+        self.num_files = 0
+        self.start_time = time.perf_counter()
+
+    def update(self, num_files: int) -> None:
+        """Add the number of files read in the latest batch"""
+        self.num_files += num_files
+
+    @property
+    def elapsed_seconds(self) -> float:
+        """Seconds since the start of the ingestion"""
+        return time.perf_counter() - self.start_time
+
+    @property
+    def files_per_second(self) -> float:
+        """Number of files read per second"""
+        return round(self.num_files / max(self.elapsed_seconds, 1e-9), 2)
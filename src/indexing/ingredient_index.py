@@ -0,0 +1,291 @@
+"""Bitset index of the recipe ingredients answering "what can I cook with X, Y, Z" without any vector search."""
+import json
+import os
+import re
+import shutil
+from typing import Iterable, Optional
+
+import click
+import numpy as np
+from dotenv import load_dotenv
+
+from src.common.logger import get_logger
+from src.common.utils import load_yaml, write_json_atomic
+from src.indexing.collection_version import VERSION_DIR, bump_collection_version
+from src.indexing.ingestion import iter_json_files, read_json_file
+
+# load all the environment variables
+load_dotenv()
+# Load all the modeling parameters
+params = load_yaml("params.yaml")
+# Initialize logger
+LOGGER = get_logger(__file__)
+
+# Number of missing ingredients of the recipes without any pantry ingredient
+NOT_MATCHED = np.iinfo(np.uint16).max
+# Preparation words, units and quantities dropped from the ingredient names
+INGREDIENT_STOPWORDS = frozenset(
+    """
+    chopped finely roughly fresh freshly sliced thinly diced grated minced crushed ground roasted boiled cooked soaked
+    peeled deseeded optional large small medium big cup cups tbsp tsp teaspoon teaspoons tablespoon tablespoons gram
+    grams g kg ml litre liter pinch few handful to taste as required needed for garnish garnishing or and of a an the
+    """.split()
+)
+
+
+def normalize_ingredient(ingredient: str) -> str:
+    """Canonical name of an ingredient, e.g., "Tomatoes (finely chopped)" -> "tomato".
+
+    Args:
+        ingredient (str): ingredient name as scraped or typed by the user
+
+    Returns:
+        str: lowercase name without quantities, preparation words and plural suffix, empty if nothing is left
+    """
+    ingredient = re.sub(r"\(.*?\)", " ", ingredient.lower())
+    # Keep the first alternative, e.g., "ghee or oil" -> "ghee"
+    ingredient = re.split(r",| or |/", ingredient)[0]
+    words = [word for word in re.findall(r"[a-z]+", ingredient) if word not in INGREDIENT_STOPWORDS]
+    if len(words) == 0:
+        return ""
+    last = words[-1]
+    if last.endswith("oes"):
+        last = last[:-2]
+    elif last.endswith("s") and not last.endswith(("ss", "us")) and len(last) > 3:
+        last = last[:-1]
+    return " ".join(words[:-1] + [last])
+
+
+def get_ingredient_index_path() -> str:
+    """Directory of the ingredient index"""
+    return os.path.join(os.getenv("DATA_ROOT"), params["pantry"]["path"])
+
+
+def get_ingredient_index_version_path() -> str:
+    """Version file of the ingredient index, a new version is written after every build"""
+    return os.path.join(os.getenv("DATA_ROOT"), VERSION_DIR, "ingredient_index.json")
+
+
+def build_ingredient_index(recipes: Iterable[tuple[str, dict]], directory: str) -> int:
+    """Build the ingredient index of the recipes and save it in a directory.
+
+    The index is made of
+        - vocab.json: normalized ingredient names, the position of a name is its id
+        - bitmaps.npy: (num_ingredients, num_words) uint64 bitsets, bit r of row i is set if recipe r uses ingredient i
+        - counts.npy: number of distinct ingredients of each recipe
+        - recipe_offsets.npy / recipe_ingredients.npy: ingredient ids of each recipe in CSR layout
+        - recipes.json: dataset name, recipe id and name of each recipe
+
+    Args:
+        recipes (Iterable[tuple[str, dict]]): dataset name and parsed json of each recipe
+        directory (str): directory of the index
+
+    Returns:
+        int: number of indexed recipes
+    """
+    vocab: dict[str, int] = {}
+    recipe_info, recipe_ingredients, recipe_offsets = [], [], [0]
+    for dataset_name, recipe in recipes:
+        ingredient_ids = {
+            vocab.setdefault(name, len(vocab))
+            for name in map(normalize_ingredient, recipe.get("ingredients") or [])
+            if len(name) > 0
+        }
+        recipe_ingredients.extend(sorted(ingredient_ids))
+        recipe_offsets.append(len(recipe_ingredients))
+        recipe_info.append([dataset_name, recipe["recipe_id"], recipe.get("name", "")])
+
+    num_recipes = len(recipe_info)
+    recipe_offsets = np.asarray(recipe_offsets, dtype=np.int64)
+    recipe_ingredients = np.asarray(recipe_ingredients, dtype=np.int32)
+    counts = np.diff(recipe_offsets).astype(np.uint16)
+    rows = np.repeat(np.arange(num_recipes, dtype=np.int64), counts)
+    bitmaps = np.zeros((len(vocab), (num_recipes + 63) // 64), dtype=np.uint64)
+    np.bitwise_or.at(
+        bitmaps, (recipe_ingredients, rows >> 6), np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64))
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "bitmaps.npy"), bitmaps)
+    np.save(os.path.join(directory, "counts.npy"), counts)
+    np.save(os.path.join(directory, "recipe_offsets.npy"), recipe_offsets)
+    np.save(os.path.join(directory, "recipe_ingredients.npy"), recipe_ingredients)
+    with open(os.path.join(directory, "recipes.json"), "w") as file:
+        json.dump(recipe_info, file)
+    # vocab.json is written last, an index is complete once it exists
+    write_json_atomic(list(vocab), os.path.join(directory, "vocab.json"))
+    return num_recipes
+
+
+class IngredientIndex:
+    """Rank recipes by how many of their ingredients are in a pantry with vectorized bitset operations.
+
+    The number of pantry ingredients used by every recipe is computed with a bit-sliced counter: the bitsets of the
+    pantry ingredients are added with carries into a few bit planes, each plane holding one bit of the count of every
+    recipe. The cost depends on the pantry size and num_recipes / 64 words, not on the number of recipe ingredients.
+    """
+
+    def __init__(self, directory: str, staples: Optional[list[str]] = None):
+        """
+        Args:
+            directory (str): directory of the index
+            staples (Optional[list[str]], optional): ingredients assumed to be in every pantry, e.g., salt and water.
+                Defaults to None.
+        """
+        with open(os.path.join(directory, "vocab.json"), "r") as file:
+            self.vocab = {name: ingredient_id for ingredient_id, name in enumerate(json.load(file))}
+        with open(os.path.join(directory, "recipes.json"), "r") as file:
+            self.recipes = json.load(file)
+        self.names = list(self.vocab)
+        self.bitmaps = np.load(os.path.join(directory, "bitmaps.npy"), mmap_mode="r")
+        self.counts = np.load(os.path.join(directory, "counts.npy"))
+        self.max_count = int(self.counts.max()) if len(self.counts) > 0 else 0
+        self.recipe_offsets = np.load(os.path.join(directory, "recipe_offsets.npy"), mmap_mode="r")
+        self.recipe_ingredients = np.load(os.path.join(directory, "recipe_ingredients.npy"), mmap_mode="r")
+        self.staples = {self.vocab[name] for name in map(normalize_ingredient, staples or []) if name in self.vocab}
+
+    @classmethod
+    def load(cls, directory: str, staples: Optional[list[str]] = None) -> Optional["IngredientIndex"]:
+        """Open the index of a directory, None if it was never built"""
+        if not os.path.exists(os.path.join(directory, "vocab.json")):
+            return None
+        return cls(directory, staples=staples)
+
+    @property
+    def num_recipes(self) -> int:
+        """Number of indexed recipes"""
+        return len(self.recipes)
+
+    def unpack(self, words: np.ndarray) -> np.ndarray:
+        """One boolean per recipe from a bitset"""
+        return np.unpackbits(words.view(np.uint8), bitorder="little", count=self.num_recipes).view(bool)
+
+    def count_matches(self, ingredient_ids: list[int]) -> np.ndarray:
+        """Number of the ingredients used by every recipe.
+
+        Args:
+            ingredient_ids (list[int]): ids of the pantry ingredients
+
+        Returns:
+            np.ndarray: (num_recipes,) number of matched ingredients of each recipe
+        """
+        num_planes = max(int(len(ingredient_ids)).bit_length(), 1)
+        planes = np.zeros((num_planes, self.bitmaps.shape[1]), dtype=np.uint64)
+        for ingredient_id in ingredient_ids:
+            carry = np.array(self.bitmaps[ingredient_id])
+            for plane in planes:
+                # Half adder of the carry into the plane, the new carry moves to the next plane
+                plane ^= carry
+                carry &= ~plane
+                if not carry.any():
+                    break
+        matched = np.zeros(self.num_recipes, dtype=np.uint16)
+        for bit, plane in enumerate(planes):
+            bits = self.unpack(plane).view(np.uint8).astype(np.uint16)
+            bits <<= bit
+            matched |= bits
+        return matched
+
+    @staticmethod
+    def missing_threshold(missing: np.ndarray, k: int, max_missing: int) -> int:
+        """Smallest number of missing ingredients reached by k recipes, found by a binary search over the counts.
+
+        No recipe missing more ingredients can be in the top k, so only the recipes up to the threshold are sorted.
+        """
+        low, high = 0, max_missing
+        while low < high:
+            middle = (low + high) // 2
+            if np.count_nonzero(missing <= middle) >= k:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def search(self, ingredients: list[str], k: int = 10, max_missing: Optional[int] = None) -> dict:
+        """Recipes that can be cooked with the ingredients of a pantry.
+
+        Recipes are ranked by the number of missing ingredients, then by the fraction of their ingredients in the
+        pantry, which for the same number of missing ingredients grows with the number of matched ones.
+
+        Args:
+            ingredients (list[str]): ingredients in the pantry
+            k (int, optional): number of recipes. Defaults to 10.
+            max_missing (Optional[int], optional): maximum number of missing ingredients. Defaults to None.
+
+        Returns:
+            dict: ranked recipes with their matched, missing and coverage, and the unknown pantry ingredients
+        """
+        normalized = {name: normalize_ingredient(name) for name in ingredients}
+        unknown = [name for name, normalized_name in normalized.items() if normalized_name not in self.vocab]
+        ingredient_ids = sorted({self.vocab[name] for name in normalized.values() if name in self.vocab} | self.staples)
+        if len(ingredient_ids) == 0:
+            return {"recipes": [], "unknown_ingredients": unknown}
+
+        matched = self.count_matches(ingredient_ids)
+        # Recipes without any pantry ingredient get the largest number of missing ingredients
+        missing = (self.counts - matched) | np.where(matched == 0, NOT_MATCHED, 0).astype(np.uint16)
+        max_missing = self.max_count if max_missing is None else min(max_missing, self.max_count)
+        threshold = self.missing_threshold(missing, k, max_missing)
+        candidates = np.flatnonzero(missing <= threshold)
+        order = np.lexsort((-matched[candidates].astype(np.int32), missing[candidates]))[:k]
+
+        pantry = set(ingredient_ids)
+        results = []
+        for recipe in candidates[order].tolist():
+            start, end = int(self.recipe_offsets[recipe]), int(self.recipe_offsets[recipe + 1])
+            dataset_name, recipe_id, name = self.recipes[recipe]
+            results.append(
+                {
+                    "dataset_name": dataset_name,
+                    "recipe_id": recipe_id,
+                    "name": name,
+                    "matched": int(matched[recipe]),
+                    "missing": int(missing[recipe]),
+                    "coverage": round(int(matched[recipe]) / max(int(self.counts[recipe]), 1), 4),
+                    "missing_ingredients": [
+                        self.names[ingredient_id]
+                        for ingredient_id in self.recipe_ingredients[start:end].tolist()
+                        if ingredient_id not in pantry
+                    ],
+                }
+            )
+        return {"recipes": results, "unknown_ingredients": unknown}
+
+
+def iter_recipes(scraped_datasets: list[str]) -> Iterable[tuple[str, dict]]:
+    """Dataset name and parsed json of every scraped recipe, in sorted file order"""
+    for dataset_name in scraped_datasets:
+        directory = os.path.join(os.getenv("SCRAPED_DATA_ROOT"), dataset_name, "recipes")
+        for json_file_path in sorted(iter_json_files(directory)):
+            yield dataset_name, read_json_file(json_file_path)
+
+
+@click.command()
+@click.option(
+    "--scraped_datasets",
+    default=params["scraped_datasets"],
+    show_default=True,
+    multiple=True,
+    type=str,
+    help="Names of the scraped datasets used to build the ingredient index",
+)
+def ingredient_index_entrypoint(scraped_datasets: list[str]):
+    """Build the ingredient index of the pantry search from the scraped recipes.
+
+    Args:
+        scraped_datasets (list[str]): Names of the scraped datasets used to build the ingredient index
+    """
+    directory = get_ingredient_index_path()
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    num_recipes = build_ingredient_index(iter_recipes(scraped_datasets), tmp_directory)
+    # Swap the directories so that the retrieval service never reads a partially written index, nor has the files
+    # it maps overwritten, and write a new version for it to load the new index
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    bump_collection_version(get_ingredient_index_version_path())
+    LOGGER.info("Built the ingredient index", num_recipes=num_recipes, directory=directory)
+
+
+if __name__ == "__main__":
+    ingredient_index_entrypoint()
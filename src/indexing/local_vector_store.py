@@ -0,0 +1,479 @@
+"""Embedded vector store with memory-mapped float16 vectors, a payload side table and a persisted HNSW graph."""
+import json
+import os
+import uuid
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.common.utils import write_json_atomic
+from src.indexing.attributes import is_range_condition, match_range
+from src.indexing.compression import VectorCodec, normalize, truncate
+from src.indexing.hnsw import MappedArray, open_graph
+from src.indexing.payload_index import KeywordIndex, RangeIndex
+
+try:
+    import orjson
+
+    dump_json_bytes = orjson.dumps
+    load_json_bytes = orjson.loads
+except ImportError:  # pragma: no cover - orjson is an optional speed up
+
+    def dump_json_bytes(data: dict) -> bytes:
+        """Serialize a payload using the standard library"""
+        return json.dumps(data).encode("utf-8")
+
+    load_json_bytes = json.loads
+
+# Factor by which the candidate list is enlarged when search results are post-filtered on the payload
+FILTER_OVERFETCH = 10
+# Filters matching at most this many rows through the payload indexes are answered by scoring all of them
+BRUTE_FORCE_ROWS = 4096
+
+
+def match_filter(metadata: dict, filter: Optional[dict]) -> bool:
+    """Check if the metadata of a point matches a filter of the form {key: value, list of accepted values or range},
+    a range being a dictionary of gt, gte, lt and lte bounds, e.g., {"total_time_minutes": {"lte": 30}}"""
+    if filter is None:
+        return True
+    for key, value in filter.items():
+        if is_range_condition(value):
+            if not match_range(metadata.get(key), value):
+                return False
+            continue
+        accepted = value if isinstance(value, (list, tuple, set)) else [value]
+        if metadata.get(key) not in accepted:
+            return False
+    return True
+
+
+class LocalVectorStore(VectorStore):
+    """Vector store saved in a local directory, a drop-in replacement for the Qdrant vector store of langchain.
+
+    Every collection is a directory with
+        - vectors.{f32,f16,i8}: normalized vectors, optionally truncated to the first truncate_dim dimensions, as a
+            memory-mapped (capacity, dim) matrix, with the per vector scales in scales.f32 for int8
+        - vectors_full.f16: full float16 vectors used to rescore the candidates when the vectors are int8 or truncated
+        - payloads.jsonl / payloads.idx: json lines with the point id, page content and meta-data, and their
+            (offset, length) in a memory-mapped int64 matrix
+        - keyword_<field>.*: keyword payload indexes of meta-data fields, see KeywordIndex
+        - range_<field>.npy: numeric payload indexes of meta-data fields, see RangeIndex
+        - graph*: HNSW graph over the vectors, see HnswlibGraph, or HNSWGraph without hnswlib
+        - collection.json: dimension, storage config and number of points
+    Opening a collection only maps the files, pages are read from the disk when a search touches them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        collection_name: str,
+        embeddings: Optional[Embeddings] = None,
+        read_only: bool = True,
+        m: int = 16,
+        ef_construct: int = 100,
+        ef_search: int = 64,
+        dtype: str = "float16",
+        truncate_dim: Optional[int] = None,
+        rescore: bool = True,
+        oversampling: float = 2.0,
+        payload_indexes: Optional[list[str]] = None,
+        range_indexes: Optional[list[str]] = None,
+    ):
+        """
+        Args:
+            path (str): directory with the collections
+            collection_name (str): name of the collection
+            embeddings (Optional[Embeddings], optional): model to embed the texts and queries. Defaults to None.
+            read_only (bool, optional): open the collection for searching only. Defaults to True.
+            m (int, optional): number of neighbors per node of a new HNSW graph. Defaults to 16.
+            ef_construct (int, optional): size of the candidate list while building the graph. Defaults to 100.
+            ef_search (int, optional): size of the candidate list while searching. Defaults to 64.
+            dtype (str, optional): storage type of the vectors of a new collection, float32, float16 or int8.
+                Defaults to "float16".
+            truncate_dim (Optional[int], optional): number of leading dimensions indexed by a new collection.
+                Defaults to None, i.e., all the dimensions.
+            rescore (bool, optional): keep full float16 vectors on the disk in a new collection with int8 or truncated
+                vectors, and rescore the candidates with them. Defaults to True.
+            oversampling (float, optional): factor of extra candidates fetched for rescoring. Defaults to 2.0.
+            payload_indexes (Optional[list[str]], optional): meta-data fields with a keyword index, filters on them
+                are resolved inside the index instead of post-filtering the results. Defaults to None.
+            range_indexes (Optional[list[str]], optional): numeric meta-data fields with a range index, range and value
+                filters on them are resolved inside the index. Defaults to None.
+        """
+        self.directory = os.path.join(path, collection_name)
+        self.collection_name = collection_name
+        self._embeddings = embeddings
+        self.read_only = read_only
+        self.ef_search = ef_search
+        self.oversampling = oversampling
+        self.meta_path = os.path.join(self.directory, "collection.json")
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as file:
+                meta = json.load(file)
+        elif read_only:
+            raise FileNotFoundError(f"Collection {collection_name} does not exist in {path}")
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            meta = {"dim": None, "count": 0, "capacity": 0}
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        # Storage config is fixed when the collection is created
+        self.codec = VectorCodec(meta.get("dtype", dtype))
+        self.truncate_dim = meta.get("truncate_dim", truncate_dim)
+        self.rescore = meta.get("rescore", rescore)
+        self.keyword_indexes = {
+            field: KeywordIndex(self.directory, field, read_only)
+            for field in meta.get("payload_indexes", payload_indexes or [])
+        }
+        self.range_indexes = {
+            field: RangeIndex(self.directory, field, read_only)
+            for field in meta.get("range_indexes", range_indexes or [])
+        }
+
+        self.vectors = self.scales = self.full_vectors = None
+        if self.dim is not None:
+            self._open_vectors(meta["capacity"])
+        self.payload_index = MappedArray(
+            os.path.join(self.directory, "payloads.idx"), np.int64, (2,), meta["capacity"], read_only
+        )
+        self.payload_path = os.path.join(self.directory, "payloads.jsonl")
+        self.graph = open_graph(
+            self.directory, get_vectors=self.get_vectors, m=m, ef_construct=ef_construct, read_only=read_only
+        )
+        self._id_to_row = None
+        self._payload_reader = open(self.payload_path, "rb") if os.path.exists(self.payload_path) else None
+        self._payload_writer = None
+        if not read_only:
+            self._payload_writer = open(self.payload_path, "ab")
+            # Drop payloads written after the last flush, e.g., by an interrupted run
+            self._payload_writer.truncate(self._payload_end())
+            self._payload_writer.seek(0, os.SEEK_END)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        """Embeddings model of the vector store"""
+        return self._embeddings
+
+    @property
+    def index_dim(self) -> int:
+        """Number of dimensions of the vectors in the index"""
+        return min(self.truncate_dim or self.dim, self.dim)
+
+    @property
+    def stores_full_vectors(self) -> bool:
+        """Whether full vectors are kept for rescoring the candidates"""
+        return self.rescore and (self.codec.is_lossy or self.index_dim < self.dim)
+
+    @property
+    def payload_indexes(self) -> dict:
+        """Keyword and range indexes of the meta-data fields"""
+        return {**self.keyword_indexes, **self.range_indexes}
+
+    def _open_vectors(self, capacity: int) -> None:
+        self.vectors = MappedArray(
+            os.path.join(self.directory, f"vectors.{self.codec.suffix}"),
+            self.codec.numpy_dtype,
+            (self.index_dim,),
+            capacity,
+            self.read_only,
+        )
+        if self.codec.has_scales:
+            self.scales = MappedArray(
+                os.path.join(self.directory, "scales.f32"), np.float32, (), capacity, self.read_only
+            )
+        if self.stores_full_vectors:
+            self.full_vectors = MappedArray(
+                os.path.join(self.directory, "vectors_full.f16"), np.float16, (self.dim,), capacity, self.read_only
+            )
+
+    def _payload_end(self) -> int:
+        if self.count == 0:
+            return 0
+        offsets = np.asarray(self.payload_index.array[: self.count])
+        return int((offsets[:, 0] + offsets[:, 1]).max())
+
+    def get_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Normalized float32 vectors of the given rows, as stored in the index"""
+        scales = self.scales.array[rows] if self.scales is not None else None
+        return self.codec.decode(self.vectors.array[rows], scales)
+
+    def get_full_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Full normalized float32 vectors of the given rows, the index vectors if full vectors are not stored"""
+        if self.full_vectors is None:
+            return self.get_vectors(rows)
+        return np.asarray(self.full_vectors.array[rows], dtype=np.float32)
+
+    @property
+    def index_nbytes(self) -> int:
+        """Number of bytes of the vectors and graph searched in memory, excluding the full vectors used to rescore"""
+        vector_nbytes = 0 if self.graph.stores_vectors else self.codec.bytes_per_vector(self.index_dim)
+        return self.count * (vector_nbytes + self.graph.nbytes_per_node)
+
+    def read_payload(self, row: int) -> dict:
+        """Read the payload, i.e., id, page content and meta-data, of a row"""
+        if self._payload_reader is None:
+            self._payload_reader = open(self.payload_path, "rb")
+        offset, length = self.payload_index.array[row]
+        return load_json_bytes(os.pread(self._payload_reader.fileno(), int(length), int(offset)))
+
+    @property
+    def id_to_row(self) -> dict:
+        """Mapping from point id to row, built on first use by scanning the payloads"""
+        if self._id_to_row is None:
+            self._id_to_row = {self.read_payload(row)["id"]: row for row in range(self.count)}
+        return self._id_to_row
+
+    def add_vectors(self, vectors: np.ndarray, payloads: list[dict], ids: Optional[list[str]] = None) -> list[str]:
+        """Upsert points with precomputed vectors.
+
+        An existing id gets its vector and payload replaced in place.
+
+        Args:
+            vectors (np.ndarray): (n, dim) embedding vectors
+            payloads (list[dict]): payload of each point with page_content and metadata
+            ids (Optional[list[str]], optional): ids of the points. Defaults to None, i.e., random uuids.
+
+        Returns:
+            list[str]: ids of the points
+        """
+        if self.read_only:
+            raise PermissionError(f"Collection {self.collection_name} is opened in read only mode")
+        vectors = normalize(vectors)
+        ids = [str(point_id) for point_id in ids] if ids is not None else [uuid.uuid4().hex for _ in payloads]
+        if self.vectors is None:
+            self.dim = vectors.shape[1]
+            self._open_vectors(0)
+        codes, scales = self.codec.encode(truncate(vectors, self.index_dim))
+
+        rows, records, pending_metadata = [], [], {}
+        for idx, (payload, point_id) in enumerate(zip(payloads, ids)):
+            row = self.id_to_row.get(point_id)
+            if row is not None and len(self.payload_indexes) > 0:
+                # Remove the replaced payload from the payload indexes
+                if row in pending_metadata:
+                    previous_metadata = pending_metadata[row]
+                else:
+                    previous_metadata = self.read_payload(row)["metadata"]
+                for field, index in self.payload_indexes.items():
+                    index.remove(row, previous_metadata.get(field))
+            if row is None:
+                row = self.count
+                self.count += 1
+                self.id_to_row[point_id] = row
+                for array in (self.vectors, self.scales, self.full_vectors, self.payload_index):
+                    if array is not None:
+                        array.ensure_capacity(self.count)
+            self.vectors.array[row] = codes[idx]
+            if self.scales is not None:
+                self.scales.array[row] = scales[idx]
+            if self.full_vectors is not None:
+                self.full_vectors.array[row] = vectors[idx]
+            for field, index in self.payload_indexes.items():
+                index.add(row, payload["metadata"].get(field))
+            pending_metadata[row] = payload["metadata"]
+            rows.append(row)
+            records.append(dump_json_bytes({"id": point_id, **payload}) + b"\n")
+
+        # The payloads are durable before their offsets, the memory-mapped offsets of a replaced row may reach the
+        # disk at any time and must never point past the end of the payload file
+        offset = self._payload_writer.tell()
+        self._payload_writer.write(b"".join(records))
+        self._payload_writer.flush()
+        os.fsync(self._payload_writer.fileno())
+        for row, record in zip(rows, records):
+            self.payload_index.array[row] = (offset, len(record))
+            offset += len(record)
+
+        self.graph.insert_batch(np.asarray(rows, dtype=np.int64))
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Embed and upsert texts with their meta-data.
+
+        Args:
+            texts (Iterable[str]): texts to add
+            metadatas (Optional[list[dict]], optional): meta-data of each text. Defaults to None.
+            ids (Optional[list[str]], optional): ids of the points. Defaults to None, i.e., random uuids.
+
+        Returns:
+            list[str]: ids of the points
+        """
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self._embeddings.embed_documents(texts)
+        payloads = [{"page_content": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+        return self.add_vectors(np.asarray(vectors), payloads, ids)
+
+    def search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, ef: Optional[int] = None
+    ) -> list[tuple[str, dict, float]]:
+        """Approximate nearest neighbors of a vector.
+
+        Args:
+            embedding (list[float]): query vector
+            k (int, optional): number of points to return. Defaults to 4.
+            filter (Optional[dict], optional): accepted meta-data values, {key: value, list of values or range}.
+                Defaults to None.
+            ef (Optional[int], optional): size of the candidate list. Defaults to None, i.e., ef_search.
+
+        Returns:
+            list[tuple[str, dict, float]]: id, payload and cosine similarity of the points
+        """
+        if self.count == 0:
+            return []
+        query = normalize(embedding)
+        ef = ef or self.ef_search
+        allowed_rows, filter = self.resolve_filter(filter)
+        limit = k if filter is None else k * FILTER_OVERFETCH
+
+        if allowed_rows is not None and len(allowed_rows) <= max(BRUTE_FORCE_ROWS, limit):
+            # Selective filter: exact scores of all the matching rows are cheaper than a graph traversal
+            scores = self.get_full_vectors(allowed_rows) @ query
+            top = np.argsort(-scores)[:limit]
+            candidates = list(zip(scores[top].tolist(), allowed_rows[top].tolist()))
+        else:
+            allowed = None
+            if allowed_rows is not None:
+                allowed = np.zeros(self.count, dtype=bool)
+                allowed[allowed_rows] = True
+            if self.stores_full_vectors:
+                limit = int(np.ceil(limit * self.oversampling))
+            candidates = self.graph.search(truncate(query, self.index_dim), limit, max(ef, limit), allowed=allowed)
+            if self.stores_full_vectors and len(candidates) > 0:
+                # Rescore the candidates of the compressed index with the full vectors
+                rows = np.asarray([row for _, row in candidates], dtype=np.int64)
+                scores = self.get_full_vectors(rows) @ query
+                candidates = sorted(zip(scores.tolist(), rows.tolist()), reverse=True)
+
+        results = []
+        for score, row in candidates:
+            payload = self.read_payload(row)
+            if match_filter(payload["metadata"], filter):
+                results.append((payload.pop("id"), payload, score))
+            if len(results) == k:
+                break
+        return results
+
+    def resolve_filter(self, filter: Optional[dict]) -> tuple[Optional[np.ndarray], Optional[dict]]:
+        """Resolve the conditions of a filter on the indexed fields into the matching rows.
+
+        Args:
+            filter (Optional[dict]): accepted meta-data values, {key: value, list of values or range}
+
+        Returns:
+            tuple[Optional[np.ndarray], Optional[dict]]: sorted rows matching the indexed conditions, None if no
+                condition is indexed, and the remaining conditions to check on the payloads, None if there are none
+        """
+        if filter is None:
+            return None, None
+        allowed_rows, remaining = None, {}
+        for key, value in filter.items():
+            if key in self.range_indexes:
+                rows = self.range_indexes[key].get_rows(value)
+            elif key in self.keyword_indexes and not is_range_condition(value):
+                rows = self.keyword_indexes[key].get_rows(value if isinstance(value, (list, tuple, set)) else [value])
+            else:
+                remaining[key] = value
+                continue
+            allowed_rows = rows if allowed_rows is None else np.intersect1d(allowed_rows, rows, assume_unique=True)
+        return allowed_rows, remaining or None
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        """Documents most similar to a query vector together with the cosine similarity"""
+        return [
+            (Document(page_content=payload["page_content"], metadata=payload["metadata"]), score)
+            for _, payload, score in self.search_by_vector(embedding, k=k, filter=filter, ef=kwargs.get("ef"))
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        """Documents most similar to a query text together with the cosine similarity"""
+        return self.similarity_search_with_score_by_vector(self._embeddings.embed_query(query), k, filter, **kwargs)
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[Document]:
+        """Documents most similar to a query vector"""
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, filter, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> list[Document]:
+        """Documents most similar to a query text"""
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are cosine similarities, same as the Qdrant vector store with the cosine distance
+        return lambda score: score
+
+    def flush(self) -> None:
+        """Persist the points added so far"""
+        if self.read_only:
+            return
+        self._payload_writer.flush()
+        os.fsync(self._payload_writer.fileno())
+        for array in (self.vectors, self.scales, self.full_vectors, self.payload_index):
+            if array is not None:
+                array.flush()
+        self.graph.flush()
+        for index in self.payload_indexes.values():
+            index.flush()
+        meta = {
+            "dim": self.dim,
+            "count": self.count,
+            "capacity": self.payload_index.capacity,
+            "dtype": self.codec.dtype,
+            "truncate_dim": self.truncate_dim,
+            "rescore": self.rescore,
+            "payload_indexes": list(self.keyword_indexes),
+            "range_indexes": list(self.range_indexes),
+        }
+        write_json_atomic(meta, self.meta_path)
+
+    def close(self) -> None:
+        """Flush and close the files of the collection"""
+        self.flush()
+        for file in (self._payload_reader, self._payload_writer):
+            if file is not None:
+                file.close()
+        self._payload_reader = self._payload_writer = None
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        path: Optional[str] = None,
+        collection_name: str = "recipies_db",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        """Open, or create, a collection for writing and add the texts to it.
+
+        Args:
+            texts (list[str]): texts to add
+            embedding (Embeddings): model to embed the texts
+            metadatas (Optional[list[dict]], optional): meta-data of each text. Defaults to None.
+            ids (Optional[list[str]], optional): ids of the points. Defaults to None, i.e., random uuids.
+            path (Optional[str], optional): directory with the collections. Defaults to None, i.e.,
+                DATA_ROOT/local_vector_store.
+            collection_name (str, optional): name of the collection. Defaults to "recipies_db".
+
+        Returns:
+            LocalVectorStore: vector store opened for writing
+        """
+        path = path or os.path.join(os.getenv("DATA_ROOT"), "local_vector_store")
+        store = cls(path=path, collection_name=collection_name, embeddings=embedding, read_only=False, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,177 @@
+"""Points with a named vector per embedding model, written in a single pass over the chunks and searched by name."""
+import os
+import uuid
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain_community.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import models
+
+from src.common.tracing import span
+from src.indexing.local_vector_store import LocalVectorStore
+
+# Number of points uploaded by a single Qdrant request, as in the langchain Qdrant vector store
+UPSERT_BATCH_SIZE = 64
+
+
+def get_named_collection_name(collection_name: str, vector_name: str) -> str:
+    """Name of the LocalVectorStore collection with the vectors of a vector name, e.g., recipies_db.mpnet"""
+    return f"{collection_name}.{vector_name}"
+
+
+class NamedVectorStore(VectorStore):
+    """Collection whose points have a vector per embedding model, e.g., to compare models on the same chunks.
+
+    Every chunk is embedded by all the models and written once with all its vectors: as the named vectors of a single
+    Qdrant point, or as points with the same id in a LocalVectorStore collection per vector name. A search goes to the
+    vectors of a single name, the first one unless another name is given.
+    """
+
+    def __init__(self, stores: dict[str, VectorStore]):
+        """
+        Args:
+            stores (dict[str, VectorStore]): store searching each vector name with the model of the name, langchain
+                Qdrant stores of the same collection with their vector_name or LocalVectorStore collections
+        """
+        if len(stores) == 0:
+            raise ValueError("A named vector store needs at least one vector name")
+        self.stores = stores
+        self.default_vector = next(iter(stores))
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        """Embeddings model of the default vector name"""
+        return self.stores[self.default_vector].embeddings
+
+    @property
+    def named_embeddings(self) -> dict[str, Embeddings]:
+        """Embeddings model of each vector name"""
+        return {name: store.embeddings for name, store in self.stores.items()}
+
+    def get_store(self, vector_name: Optional[str] = None) -> VectorStore:
+        """Store searching the vectors of a name, the default one if the name is None"""
+        vector_name = vector_name or self.default_vector
+        if vector_name not in self.stores:
+            raise ValueError(f"Unknown vector {vector_name}, expected one of {list(self.stores)}")
+        return self.stores[vector_name]
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Embed texts with every model and upsert them with their meta-data, all the vectors of a point together.
+
+        Args:
+            texts (Iterable[str]): texts to add
+            metadatas (Optional[list[dict]], optional): meta-data of each text. Defaults to None.
+            ids (Optional[list[str]], optional): ids of the points. Defaults to None, i.e., random uuids.
+
+        Returns:
+            list[str]: ids of the points
+        """
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [str(point_id) for point_id in ids] if ids is not None else [uuid.uuid4().hex for _ in texts]
+        vectors = {}
+        for name, embeddings in self.named_embeddings.items():
+            with span("named_vectors.embed_documents", vector_name=name):
+                vectors[name] = embeddings.embed_documents(texts)
+        payloads = [{"page_content": text, "metadata": metadata} for text, metadata in zip(texts, metadatas)]
+        store = self.stores[self.default_vector]
+        if isinstance(store, Qdrant):
+            points = [
+                models.PointStruct(
+                    id=point_id, vector={name: vectors[name][idx] for name in vectors}, payload=payloads[idx]
+                )
+                for idx, point_id in enumerate(ids)
+            ]
+            for start in range(0, len(points), UPSERT_BATCH_SIZE):
+                end = start + UPSERT_BATCH_SIZE
+                store.client.upsert(collection_name=store.collection_name, points=points[start:end])
+        else:
+            for name, store in self.stores.items():
+                store.add_vectors(np.asarray(vectors[name], dtype=np.float32), payloads, ids)
+        return ids
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[Any] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        """Documents most similar to a query vector of the vector name given by the vector_name keyword argument"""
+        store = self.get_store(kwargs.pop("vector_name", None))
+        return store.similarity_search_with_score_by_vector(embedding, k=k, filter=filter, **kwargs)
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Any] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        """Documents most similar to a query text embedded by the model of the vector name"""
+        store = self.get_store(kwargs.pop("vector_name", None))
+        return store.similarity_search_with_score(query, k=k, filter=filter, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Any] = None, **kwargs: Any) -> list[Document]:
+        """Documents most similar to a query text embedded by the model of the vector name"""
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def flush(self) -> None:
+        """Persist the points added to the LocalVectorStore collections, Qdrant persists every upsert"""
+        for store in self.stores.values():
+            if isinstance(store, LocalVectorStore):
+                store.flush()
+
+    def close(self) -> None:
+        """Close the LocalVectorStore collections"""
+        for store in self.stores.values():
+            if isinstance(store, LocalVectorStore):
+                store.close()
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        named_embeddings: Optional[dict[str, Embeddings]] = None,
+        path: Optional[str] = None,
+        collection_name: str = "recipies_db",
+        **kwargs: Any,
+    ) -> "NamedVectorStore":
+        """Open, or create, a LocalVectorStore collection per vector name for writing and add the texts to them.
+
+        The Qdrant collections with named vectors are created by get_vector_store of the indexer, which sizes the
+        named vectors of the collection.
+
+        Args:
+            texts (list[str]): texts to add
+            embedding (Embeddings): model of a single vector named default, when named_embeddings is not given
+            metadatas (Optional[list[dict]], optional): meta-data of each text. Defaults to None.
+            ids (Optional[list[str]], optional): ids of the points. Defaults to None, i.e., random uuids.
+            named_embeddings (Optional[dict[str, Embeddings]], optional): model of each vector name. Defaults to None.
+            path (Optional[str], optional): directory with the collections. Defaults to None, i.e.,
+                DATA_ROOT/local_vector_store.
+            collection_name (str, optional): name of the collection, suffixed by the vector names.
+                Defaults to "recipies_db".
+
+        Returns:
+            NamedVectorStore: vector store opened for writing
+        """
+        path = path or os.path.join(os.getenv("DATA_ROOT"), "local_vector_store")
+        named_embeddings = named_embeddings or {"default": embedding}
+        stores = {
+            name: LocalVectorStore(
+                path=path,
+                collection_name=get_named_collection_name(collection_name, name),
+                embeddings=embeddings,
+                read_only=False,
+                **kwargs,
+            )
+            for name, embeddings in named_embeddings.items()
+        }
+        store = cls(stores)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,249 @@
+"""Near-duplicate recipes found with MinHash signatures and LSH banding, before the recipes are indexed."""
+import itertools
+import json
+import os
+import re
+import zlib
+from typing import Iterable, Optional
+
+import click
+import numpy as np
+from dotenv import load_dotenv
+from langchain.schema import Document
+
+from src.common.logger import get_logger
+from src.common.utils import load_yaml, write_json_atomic
+from src.indexing.ingredient_index import iter_recipes, normalize_ingredient
+
+# load all the environment variables
+load_dotenv()
+# Load all the modeling parameters
+params = load_yaml("params.yaml")
+# Initialize logger
+LOGGER = get_logger(__file__)
+
+# Number of recipes whose signatures are computed together
+SIGNATURE_BATCH_SIZE = 1024
+# Signature value of a recipe without any shingle, never equal to the value of a real shingle
+EMPTY_SIGNATURE = np.iinfo(np.uint32).max
+
+
+def get_near_duplicates_path() -> str:
+    """Json file with the near-duplicate clusters of the scraped recipes"""
+    return os.path.join(os.getenv("DATA_ROOT"), params["near_duplicates"]["path"])
+
+
+def get_shingles(recipe: dict) -> set[int]:
+    """Hashed shingles of a recipe: the pairs of consecutive words of its name and its normalized ingredients.
+
+    Args:
+        recipe (dict): parsed json of a recipe
+
+    Returns:
+        set[int]: 32 bit hashes of the shingles
+    """
+    words = re.findall(r"[a-z0-9]+", str(recipe.get("name", "")).lower())
+    shingles = {" ".join(pair) for pair in zip(words, words[1:])} or set(words)
+    shingles.update(
+        f"ingredient:{name}" for name in map(normalize_ingredient, recipe.get("ingredients") or []) if len(name) > 0
+    )
+    return {zlib.crc32(shingle.encode("utf-8")) for shingle in shingles}
+
+
+class MinHasher:
+    """MinHash signatures of sets of 32 bit hashes with multiply-shift hash functions, computed in batches.
+
+    The probability that two signatures agree on a position is the Jaccard similarity of the two sets.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 0):
+        """
+        Args:
+            num_perm (int, optional): number of hash functions, i.e., length of the signatures. Defaults to 128.
+            seed (int, optional): random seed of the hash functions. Defaults to 0.
+        """
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # Odd multipliers make (a * x + b) mod 2^64 a permutation of the 64 bit integers, the high 32 bits are kept
+        self.a = rng.integers(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self.b = rng.integers(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True)
+
+    def signatures(self, shingle_sets: list[set[int]]) -> np.ndarray:
+        """MinHash signatures of a batch of shingle sets.
+
+        Args:
+            shingle_sets (list[set[int]]): hashed shingles of each recipe
+
+        Returns:
+            np.ndarray: (num_sets, num_perm) uint32 signatures
+        """
+        lengths = np.fromiter(map(len, shingle_sets), dtype=np.int64, count=len(shingle_sets))
+        signatures = np.full((len(shingle_sets), self.num_perm), EMPTY_SIGNATURE, dtype=np.uint32)
+        non_empty = np.flatnonzero(lengths > 0)
+        if len(non_empty) == 0:
+            return signatures
+        shingles = np.fromiter(itertools.chain.from_iterable(shingle_sets), dtype=np.uint64, count=int(lengths.sum()))
+        # All the hash functions of all the shingles of the batch in one (num_shingles, num_perm) product
+        with np.errstate(over="ignore"):
+            hashes = ((shingles[:, None] * self.a + self.b) >> np.uint64(32)).astype(np.uint32)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        signatures[non_empty] = np.minimum.reduceat(hashes, offsets[non_empty], axis=0)
+        return signatures
+
+
+class UnionFind:
+    """Disjoint sets of integers with path halving"""
+
+    def __init__(self, size: int):
+        self.parents = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parents[item] != item:
+            self.parents[item] = self.parents[self.parents[item]]
+            item = self.parents[item]
+        return item
+
+    def union(self, first: int, second: int) -> None:
+        # The smaller item stays the root, so the canonical recipe of a cluster is its first recipe
+        first, second = sorted((self.find(first), self.find(second)))
+        if first != second:
+            self.parents[second] = first
+
+
+def find_clusters(signatures: np.ndarray, bands: int, threshold: float) -> list[list[int]]:
+    """Clusters of near-duplicate signatures with LSH banding.
+
+    Signatures are split into bands, two recipes sharing a bucket in any band are candidates. Every candidate is only
+    compared with the first recipe of its bucket, so the number of comparisons is linear in the number of recipes, and
+    kept if the fraction of equal signature positions reaches the threshold.
+
+    Args:
+        signatures (np.ndarray): (num_recipes, num_perm) MinHash signatures
+        bands (int): number of bands, a divisor of num_perm. More bands find pairs with a lower similarity.
+        threshold (float): minimum estimated Jaccard similarity of near-duplicates
+
+    Returns:
+        list[list[int]]: rows of the recipes of each cluster of at least two recipes, sorted
+    """
+    num_recipes, num_perm = signatures.shape
+    if num_perm % bands != 0:
+        raise ValueError(f"The number of bands {bands} must divide the signature length {num_perm}")
+    rows_per_band = num_perm // bands
+    clusters = UnionFind(num_recipes)
+    rows = np.flatnonzero(signatures[:, 0] != EMPTY_SIGNATURE)
+    # Random odd multipliers combine the positions of a band into a single 64 bit bucket key
+    mixers = np.random.default_rng(0).integers(0, 2**63, rows_per_band, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    for band in range(bands):
+        start = band * rows_per_band
+        end = start + rows_per_band
+        with np.errstate(over="ignore"):
+            bucket_keys = (signatures[rows, start:end].astype(np.uint64) * mixers).sum(axis=1, dtype=np.uint64)
+        _, first_index, inverse = np.unique(bucket_keys, return_index=True, return_inverse=True)
+        firsts = rows[first_index[inverse]]
+        for first, row in zip(firsts[firsts != rows].tolist(), rows[firsts != rows].tolist()):
+            if (
+                clusters.find(first) != clusters.find(row)
+                and np.mean(signatures[first] == signatures[row]) >= threshold
+            ):
+                clusters.union(first, row)
+    groups: dict[int, list[int]] = {}
+    for row in range(num_recipes):
+        groups.setdefault(clusters.find(row), []).append(row)
+    return [rows for rows in groups.values() if len(rows) > 1]
+
+
+def build_near_duplicates(recipes: Iterable[tuple[str, dict]], num_perm: int, bands: int, threshold: float) -> dict:
+    """Near-duplicate clusters of recipes, the first recipe of a cluster being its canonical recipe.
+
+    Args:
+        recipes (Iterable[tuple[str, dict]]): dataset name and parsed json of each recipe, the earlier recipes are
+            preferred as canonical recipes
+        num_perm (int): length of the MinHash signatures
+        bands (int): number of LSH bands
+        threshold (float): minimum estimated Jaccard similarity of near-duplicates
+
+    Returns:
+        dict: number of recipes and clusters as lists of [dataset name, recipe id], canonical recipe first
+    """
+    hasher = MinHasher(num_perm)
+    keys, signatures = [], []
+    recipes = iter(recipes)
+    while True:
+        batch = list(itertools.islice(recipes, SIGNATURE_BATCH_SIZE))
+        if len(batch) == 0:
+            break
+        keys.extend([dataset_name, recipe["recipe_id"]] for dataset_name, recipe in batch)
+        signatures.append(hasher.signatures([get_shingles(recipe) for _, recipe in batch]))
+    if len(keys) == 0:
+        return {"num_recipes": 0, "clusters": []}
+    clusters = find_clusters(np.concatenate(signatures), bands, threshold)
+    return {"num_recipes": len(keys), "clusters": [[keys[row] for row in rows] for rows in clusters]}
+
+
+class NearDuplicates:
+    """Canonical recipe of every near-duplicate recipe, used by the indexer to skip the duplicates"""
+
+    def __init__(self, clusters: list[list[list[str]]]):
+        """
+        Args:
+            clusters (list[list[list[str]]]): [dataset name, recipe id] of the recipes of each cluster, canonical first
+        """
+        self.canonical = {tuple(duplicate): tuple(cluster[0]) for cluster in clusters for duplicate in cluster[1:]}
+
+    @classmethod
+    def load(cls, path: str) -> Optional["NearDuplicates"]:
+        """Clusters saved by the near-duplicates stage, None if the stage never ran"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as file:
+            return cls(json.load(file)["clusters"])
+
+    def get_canonical(self, dataset_name: str, recipe_id: str) -> Optional[tuple[str, str]]:
+        """Dataset name and recipe id of the canonical recipe of a duplicate, None for a canonical or unique recipe"""
+        return self.canonical.get((dataset_name, recipe_id))
+
+    def filter_documents(self, documents: list[Document]) -> list[Document]:
+        """Drop the recipe documents of the near-duplicates of another recipe"""
+        return [
+            document
+            for document in documents
+            if (document.metadata.get("dataset_name"), document.metadata.get("recipe_id")) not in self.canonical
+        ]
+
+
+@click.command()
+@click.option(
+    "--scraped_datasets",
+    default=params["scraped_datasets"],
+    show_default=True,
+    multiple=True,
+    type=str,
+    help="Names of the scraped datasets searched for near-duplicates, earlier datasets hold the canonical recipes",
+)
+def near_duplicates_entrypoint(scraped_datasets: list[str]):
+    """Find the near-duplicate recipes of the scraped datasets and save their clusters for the indexer.
+
+    Args:
+        scraped_datasets (list[str]): Names of the scraped datasets searched for near-duplicates
+    """
+    config = params["near_duplicates"]
+    result = build_near_duplicates(
+        iter_recipes(scraped_datasets),
+        num_perm=config["num_perm"],
+        bands=config["bands"],
+        threshold=config["threshold"],
+    )
+    path = get_near_duplicates_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json_atomic(result, path)
+    LOGGER.info(
+        "Saved the near-duplicate recipes",
+        path=path,
+        num_recipes=result["num_recipes"],
+        num_clusters=len(result["clusters"]),
+        num_duplicates=sum(len(cluster) - 1 for cluster in result["clusters"]),
+    )
+
+
+if __name__ == "__main__":
+    near_duplicates_entrypoint()
@@ -0,0 +1,161 @@
+"""Payload indexes of the local vector store, mapping the values of a meta-data field to the rows."""
+import json
+import os
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from src.indexing.attributes import is_range_condition
+
+
+def as_keywords(value: Any) -> list[str]:
+    """Keywords of a meta-data value, a list value contributes each of its elements"""
+    if value is None:
+        return []
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return [str(item) for item in values if item != ""]
+
+
+class KeywordIndex:
+    """Inverted index from the keyword values of a meta-data field to the sorted rows holding them.
+
+    It is persisted as keyword_<field>.npy with the rows of all the values concatenated and keyword_<field>.json with
+    the (start, end) slice of each value, so that a reader only maps the rows of the values it queries.
+    """
+
+    def __init__(self, directory: str, field: str, read_only: bool):
+        """
+        Args:
+            directory (str): directory of the collection
+            field (str): meta-data field
+            read_only (bool): open the index for reading only
+        """
+        self.field = field
+        self.read_only = read_only
+        self.rows_path = os.path.join(directory, f"keyword_{field}.npy")
+        self.slices_path = os.path.join(directory, f"keyword_{field}.json")
+        self.slices, self.rows = {}, np.empty(0, dtype=np.int32)
+        if os.path.exists(self.slices_path):
+            with open(self.slices_path, "r") as file:
+                self.slices = json.load(file)
+            self.rows = np.load(self.rows_path, mmap_mode="r")
+        # Postings are only materialized as sets while writing
+        self.postings = None
+        if not read_only:
+            self.postings = {value: set(self.rows[start:end].tolist()) for value, (start, end) in self.slices.items()}
+
+    def add(self, row: int, value: Any) -> None:
+        """Add a row for the keywords of a meta-data value"""
+        for keyword in as_keywords(value):
+            self.postings.setdefault(keyword, set()).add(row)
+
+    def remove(self, row: int, value: Any) -> None:
+        """Remove a row from the keywords of a meta-data value"""
+        for keyword in as_keywords(value):
+            self.postings.get(keyword, set()).discard(row)
+
+    def get_rows(self, values: Iterable[Any]) -> np.ndarray:
+        """Sorted rows holding any of the values"""
+        keywords = [keyword for value in values for keyword in as_keywords(value)]
+        if self.postings is not None:
+            rows = set().union(*(self.postings.get(keyword, set()) for keyword in keywords))
+            return np.asarray(sorted(rows), dtype=np.int64)
+        slices = [self.slices[keyword] for keyword in keywords if keyword in self.slices]
+        if len(slices) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.rows[start:end] for start, end in slices]).astype(np.int64))
+
+    def flush(self) -> None:
+        """Persist the index to the disk"""
+        if self.read_only:
+            return
+        slices, rows, start = {}, [], 0
+        for keyword, keyword_rows in self.postings.items():
+            if len(keyword_rows) == 0:
+                continue
+            rows.append(np.asarray(sorted(keyword_rows), dtype=np.int32))
+            slices[keyword] = (start, start + len(keyword_rows))
+            start += len(keyword_rows)
+        np.save(self.rows_path, np.concatenate(rows) if len(rows) > 0 else np.empty(0, dtype=np.int32))
+        with open(f"{self.slices_path}.tmp", "w") as file:
+            json.dump(slices, file)
+        os.replace(f"{self.slices_path}.tmp", self.slices_path)
+
+
+def as_number(value: Any) -> Optional[float]:
+    """Numeric meta-data value, None for missing and non numeric values"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+class RangeIndex:
+    """Numeric index of a meta-data field answering range conditions with a binary search.
+
+    It is persisted as range_<field>.npy with a (2, n) float64 matrix of the values in increasing order and their rows,
+    so that a reader finds the rows of a range with two binary searches over the memory-mapped values.
+    """
+
+    def __init__(self, directory: str, field: str, read_only: bool):
+        """
+        Args:
+            directory (str): directory of the collection
+            field (str): meta-data field
+            read_only (bool): open the index for reading only
+        """
+        self.field = field
+        self.read_only = read_only
+        self.path = os.path.join(directory, f"range_{field}.npy")
+        self.sorted = np.empty((2, 0), dtype=np.float64)
+        if os.path.exists(self.path):
+            self.sorted = np.load(self.path, mmap_mode="r")
+        # Values are only materialized as a dictionary while writing
+        self.values = None
+        if not read_only:
+            self.values = dict(zip(self.sorted[1].astype(np.int64).tolist(), self.sorted[0].tolist()))
+
+    def add(self, row: int, value: Any) -> None:
+        """Set the value of a row, a non numeric value leaves the row out of the index"""
+        value = as_number(value)
+        if value is not None:
+            self.values[row] = value
+
+    def remove(self, row: int, value: Any) -> None:
+        """Remove a row from the index"""
+        self.values.pop(row, None)
+
+    def get_rows(self, condition: Any) -> np.ndarray:
+        """Sorted rows matching a range condition, or equal to any of a list of values"""
+        if self.values is not None:
+            self.flush_arrays()
+        if is_range_condition(condition):
+            values = self.sorted[0]
+            start = 0
+            if "gte" in condition or "gt" in condition:
+                side = "left" if "gte" in condition else "right"
+                start = int(np.searchsorted(values, condition.get("gte", condition.get("gt")), side=side))
+            end = len(values)
+            if "lte" in condition or "lt" in condition:
+                side = "right" if "lte" in condition else "left"
+                end = int(np.searchsorted(values, condition.get("lte", condition.get("lt")), side=side))
+            rows = self.sorted[1, start:end] if start < end else np.empty(0)
+            return np.sort(rows.astype(np.int64))
+        values = condition if isinstance(condition, (list, tuple, set)) else [condition]
+        ranges = [self.get_rows({"gte": value, "lte": value}) for value in map(as_number, values) if value is not None]
+        return np.unique(np.concatenate(ranges)) if len(ranges) > 0 else np.empty(0, dtype=np.int64)
+
+    def flush_arrays(self) -> None:
+        """Sort the values written so far into the searched arrays"""
+        rows = np.fromiter(self.values.keys(), dtype=np.float64, count=len(self.values))
+        values = np.fromiter(self.values.values(), dtype=np.float64, count=len(self.values))
+        order = np.argsort(values, kind="stable")
+        self.sorted = np.stack([values[order], rows[order]])
+
+    def flush(self) -> None:
+        """Persist the index to the disk"""
+        if self.read_only:
+            return
+        self.flush_arrays()
+        with open(f"{self.path}.tmp", "wb") as file:
+            np.save(file, self.sorted)
+        os.replace(f"{self.path}.tmp", self.path)
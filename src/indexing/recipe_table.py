@@ -0,0 +1,230 @@
+"""Columnar export of the scraped recipes to Parquet or Arrow files, read memory-mapped and projected on columns."""
+import itertools
+import os
+import time
+from typing import Iterable, Iterator, Optional
+
+import click
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from src.common.logger import get_logger
+from src.common.recipe import Recipe
+from src.common.utils import load_yaml
+from src.indexing.ingredient_index import iter_recipes
+
+# load all the environment variables
+load_dotenv()
+# Load all the modeling parameters
+params = load_yaml("params.yaml")
+# Initialize logger
+LOGGER = get_logger(__file__)
+
+# Texts grouped under headings, a list of {"group": heading, "items": texts} per recipe
+GROUPS_TYPE = pa.list_(pa.struct([("group", pa.string()), ("items", pa.list_(pa.string()))]))
+# Columns of the recipe tables, a row per recipe with the fields of the recipe model and the name of its dataset
+RECIPE_SCHEMA = pa.schema(
+    [
+        ("dataset_name", pa.string()),
+        ("recipe_id", pa.string()),
+        ("name", pa.string()),
+        ("description", pa.string()),
+        ("ingredients", pa.list_(pa.string())),
+        ("cuisine", pa.string()),
+        ("diet", pa.string()),
+        ("servings", pa.string()),
+        ("difficulty", pa.string()),
+        ("total_time", pa.string()),
+        ("ingredient_quantity", GROUPS_TYPE),
+        ("recipe_steps", GROUPS_TYPE),
+        ("source_image_url", pa.string()),
+        ("source_recipe_url", pa.string()),
+        ("image_available", pa.bool_()),
+    ]
+)
+# Format of the recipe tables from their file extension
+TABLE_FORMATS = {".parquet": "parquet", ".arrow": "arrow"}
+
+
+def get_recipe_table_path() -> str:
+    """Path of the recipe table"""
+    return os.path.join(os.getenv("DATA_ROOT"), params["recipe_table"]["path"])
+
+
+def get_table_format(path: str) -> str:
+    """Format of a recipe table, parquet or arrow, from the extension of its file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in TABLE_FORMATS:
+        raise ValueError(f"Unknown recipe table extension {extension}, expected one of {list(TABLE_FORMATS)}")
+    return TABLE_FORMATS[extension]
+
+
+def recipes_to_record_batch(dataset_names: list[str], recipes: list[Recipe]) -> pa.RecordBatch:
+    """Record batch with a row per recipe, the columns are filled directly from the fields of the recipes.
+
+    Args:
+        dataset_names (list[str]): name of the dataset of every recipe
+        recipes (list[Recipe]): recipes of the batch
+
+    Returns:
+        pa.RecordBatch: rows of the recipes with the RECIPE_SCHEMA columns
+    """
+    columns = {"dataset_name": dataset_names}
+    for name in RECIPE_SCHEMA.names[1:]:
+        if RECIPE_SCHEMA.field(name).type == GROUPS_TYPE:
+            columns[name] = [
+                [{"group": group, "items": items} for group, items in getattr(recipe, name).items()]
+                for recipe in recipes
+            ]
+        else:
+            columns[name] = [getattr(recipe, name) for recipe in recipes]
+    return pa.RecordBatch.from_pydict(columns, schema=RECIPE_SCHEMA)
+
+
+def write_recipe_table(
+    recipes: Iterable[tuple[str, Recipe]], path: str, batch_size: int = 10_000, compression: str = "zstd"
+) -> int:
+    """Write recipes to a Parquet or an Arrow IPC file, a record batch at a time to bound the memory.
+
+    Parquet files are compressed with a row group per batch, the filters on the dataset name skip the row groups of
+    the other datasets. Arrow files are not compressed so that their columns are read from the memory-mapped file
+    without any copy.
+
+    Args:
+        recipes (Iterable[tuple[str, Recipe]]): dataset name and recipe, grouped by dataset
+        path (str): .parquet or .arrow file of the table, replaced once it is complete
+        batch_size (int, optional): number of recipes per record batch. Defaults to 10_000.
+        compression (str, optional): compression codec of the Parquet files. Defaults to "zstd".
+
+    Returns:
+        int: number of recipes written
+    """
+    table_format = get_table_format(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if table_format == "parquet":
+        writer = pq.ParquetWriter(tmp_path, RECIPE_SCHEMA, compression=compression)
+    else:
+        writer = pa.ipc.new_file(tmp_path, RECIPE_SCHEMA)
+    num_recipes = 0
+    recipes = iter(recipes)
+    with writer:
+        while True:
+            batch = list(itertools.islice(recipes, batch_size))
+            if len(batch) == 0:
+                break
+            dataset_names, batch_recipes = map(list, zip(*batch))
+            record_batch = recipes_to_record_batch(dataset_names, batch_recipes)
+            if table_format == "parquet":
+                writer.write_batch(record_batch, row_group_size=batch_size)
+            else:
+                writer.write_batch(record_batch)
+            num_recipes += len(batch)
+    os.replace(tmp_path, path)
+    return num_recipes
+
+
+def read_recipe_table(path: str, columns: Optional[list[str]] = None, dataset_name: Optional[str] = None) -> pa.Table:
+    """Read the columns of a recipe table from its memory-mapped file, only the requested columns are read.
+
+    Args:
+        path (str): .parquet or .arrow file of the table
+        columns (Optional[list[str]], optional): columns to read. Defaults to None, i.e., all the columns.
+        dataset_name (Optional[str], optional): only read the recipes of a dataset. Defaults to None.
+
+    Returns:
+        pa.Table: recipes of the table
+    """
+    if get_table_format(path) == "parquet":
+        filters = [("dataset_name", "=", dataset_name)] if dataset_name is not None else None
+        return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+    # The columns of the table point into the memory map, which stays open as long as they are referenced
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    if dataset_name is not None:
+        table = table.filter(pc.equal(table["dataset_name"], dataset_name))
+    return table.select(columns) if columns is not None else table
+
+
+def iter_table_recipes(
+    path: str, columns: Optional[list[str]] = None, dataset_name: Optional[str] = None, batch_size: int = 10_000
+) -> Iterator[Recipe]:
+    """Recipes of a recipe table, the fields missing from the projected columns get their default values.
+
+    The table is scanned a record batch at a time, so the memory stays bounded by the batch size, and the Parquet row
+    groups of the other datasets are skipped from their statistics.
+
+    Args:
+        path (str): .parquet or .arrow file of the table
+        columns (Optional[list[str]], optional): fields to read, the recipe id is always read. Defaults to None.
+        dataset_name (Optional[str], optional): only read the recipes of a dataset. Defaults to None.
+        batch_size (int, optional): number of rows converted to python objects at a time. Defaults to 10_000.
+
+    Yields:
+        Recipe: recipes in the order of the table
+    """
+    if columns is not None and "recipe_id" not in columns:
+        columns = ["recipe_id", *columns]
+    table_format = "ipc" if get_table_format(path) == "arrow" else "parquet"
+    scan_filter = pc.field("dataset_name") == dataset_name if dataset_name is not None else None
+    dataset = ds.dataset(path, format=table_format)
+    for record_batch in dataset.to_batches(columns=columns, filter=scan_filter, batch_size=batch_size):
+        for row in record_batch.to_pylist():
+            yield Recipe.from_dict(row)
+
+
+@click.command()
+@click.option(
+    "--scraped_datasets",
+    default=params["scraped_datasets"],
+    show_default=True,
+    multiple=True,
+    type=str,
+    help="Names of the scraped datasets exported to the recipe table",
+)
+@click.option(
+    "--output_file",
+    default=None,
+    type=str,
+    help="Parquet (.parquet) or Arrow (.arrow) file of the recipe table. Defaults to recipe_table.path under DATA_ROOT",
+)
+@click.option(
+    "--batch_size",
+    default=params["recipe_table"]["batch_size"],
+    show_default=True,
+    type=int,
+    help="Number of recipes per record batch and per Parquet row group",
+)
+@click.option(
+    "--compression",
+    default=params["recipe_table"]["compression"],
+    show_default=True,
+    type=str,
+    help="Compression codec of the Parquet files, e.g., zstd, snappy or none",
+)
+def recipe_table_entrypoint(scraped_datasets: list[str], output_file: Optional[str], batch_size: int, compression: str):
+    """Export the scraped recipes to a columnar table for the analytics and the indexer.
+
+    Args:
+        scraped_datasets (list[str]): Names of the scraped datasets exported to the recipe table
+        output_file (Optional[str]): Parquet or Arrow file of the recipe table
+        batch_size (int): Number of recipes per record batch and per Parquet row group
+        compression (str): Compression codec of the Parquet files
+    """
+    output_file = output_file or get_recipe_table_path()
+    start = time.perf_counter()
+    recipes = ((dataset_name, Recipe.from_dict(data)) for dataset_name, data in iter_recipes(scraped_datasets))
+    num_recipes = write_recipe_table(recipes, output_file, batch_size=batch_size, compression=compression)
+    LOGGER.info(
+        "Exported the recipe table",
+        num_recipes=num_recipes,
+        output_file=output_file,
+        size_mb=round(os.path.getsize(output_file) / 2**20, 2),
+        seconds=round(time.perf_counter() - start, 2),
+    )
+
+
+if __name__ == "__main__":
+    recipe_table_entrypoint()
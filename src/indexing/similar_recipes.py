@@ -0,0 +1,388 @@
+"""Precomputed "more like this" graph: the k most similar recipes of every recipe, from the indexed chunk vectors."""
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+import click
+import numpy as np
+from dotenv import load_dotenv
+from langchain_community.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
+
+from src.common.logger import get_logger
+from src.common.utils import load_yaml, write_json_atomic
+from src.indexer import get_embedding_model, get_named_embedding_models, get_vector_store
+from src.indexing.collection_version import bump_collection_version, get_version_path
+from src.indexing.compression import normalize
+from src.indexing.local_vector_store import LocalVectorStore
+from src.indexing.named_vectors import NamedVectorStore
+
+# load all the environment variables
+load_dotenv()
+# Load all the modeling parameters
+params = load_yaml("params.yaml")
+# Initialize logger
+LOGGER = get_logger(__file__)
+
+# Number of chunk vectors read from the vector store together
+SCROLL_BATCH_SIZE = 1024
+# Recipe vectors closer than this are considered unchanged between two runs
+VECTOR_TOLERANCE = 1e-4
+
+
+def get_similar_recipes_path(retriver_db_name: str, backend: str) -> str:
+    """Directory of the similar recipes graph of a collection of a vector db backend"""
+    return os.path.join(os.getenv("DATA_ROOT"), params["similar_recipes"]["path"], f"{retriver_db_name}_{backend}")
+
+
+def iter_chunk_vectors(
+    vector_store: VectorStore, vector_name: Optional[str] = None
+) -> Iterator[tuple[list[dict], np.ndarray]]:
+    """Meta-data and normalized vectors of all the chunks of a collection, in batches.
+
+    Args:
+        vector_store (VectorStore): Qdrant, LocalVectorStore or NamedVectorStore collection
+        vector_name (Optional[str], optional): vector read from a collection with named vectors. Defaults to None,
+            i.e., the default vector of a NamedVectorStore or the vector_name of a Qdrant store.
+
+    Yields:
+        tuple[list[dict], np.ndarray]: meta-data of the chunks of a batch and their (n, dim) vectors
+    """
+    if isinstance(vector_store, NamedVectorStore):
+        vector_store = vector_store.get_store(vector_name)
+    elif vector_name is not None and not isinstance(vector_store, Qdrant):
+        raise ValueError(f"The {type(vector_store).__name__} collection has a single unnamed vector")
+    if isinstance(vector_store, LocalVectorStore):
+        for start in range(0, vector_store.count, SCROLL_BATCH_SIZE):
+            rows = np.arange(start, min(start + SCROLL_BATCH_SIZE, vector_store.count))
+            metadatas = [vector_store.read_payload(row)["metadata"] for row in rows.tolist()]
+            yield metadatas, vector_store.get_full_vectors(rows)
+        return
+    if not isinstance(vector_store, Qdrant):
+        raise ValueError(f"Reading the vectors of a {type(vector_store).__name__} is not supported")
+    # The points of a collection with named vectors hold a dictionary of vectors, only the named one is read
+    vector_name = vector_name or vector_store.vector_name
+    offset = None
+    while True:
+        points, offset = vector_store.client.scroll(
+            collection_name=vector_store.collection_name,
+            limit=SCROLL_BATCH_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=[vector_name] if vector_name is not None else True,
+        )
+        if len(points) > 0:
+            metadatas = [point.payload.get("metadata", {}) for point in points]
+            vectors = [point.vector[vector_name] if vector_name is not None else point.vector for point in points]
+            yield metadatas, normalize(np.asarray(vectors, dtype=np.float32))
+        if offset is None:
+            return
+
+
+def get_recipe_vectors(
+    vector_store: VectorStore, vector_name: Optional[str] = None
+) -> tuple[list[list[str]], np.ndarray]:
+    """Vector of every recipe as the normalized mean of the vectors of its chunks.
+
+    Args:
+        vector_store (VectorStore): Qdrant, LocalVectorStore or NamedVectorStore collection
+        vector_name (Optional[str], optional): vector read from a collection with named vectors. Defaults to None.
+
+    Returns:
+        tuple[list[list[str]], np.ndarray]: [dataset name, recipe id] of each recipe and their (n, dim) vectors
+    """
+    keys: dict[tuple[str, str], int] = {}
+    sums = None
+    for metadatas, vectors in iter_chunk_vectors(vector_store, vector_name):
+        rows = [keys.setdefault((item.get("dataset_name"), item.get("recipe_id")), len(keys)) for item in metadatas]
+        if sums is None:
+            sums = np.zeros((0, vectors.shape[1]), dtype=np.float64)
+        if len(keys) > len(sums):
+            # Grow the sums geometrically, the chunks of the recipes are read in a single pass
+            grown = np.zeros((max(len(keys), 2 * len(sums)), vectors.shape[1]), dtype=np.float64)
+            grown[: len(sums)] = sums
+            sums = grown
+        np.add.at(sums, rows, vectors)
+    if len(keys) == 0:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return [list(key) for key in keys], normalize(sums[: len(keys)].astype(np.float32))
+
+
+def top_k_neighbors(
+    queries: np.ndarray, vectors: np.ndarray, query_rows: np.ndarray, k: int, block_size: int, num_workers: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Exact k most similar vectors of each query, computed by blocks of queries in a thread pool.
+
+    Each block is a single matrix multiplication followed by a partial sort, numpy releases the GIL in both, so the
+    blocks run in parallel on the cores while the memory stays bounded by block_size * num_vectors scores per worker.
+
+    Args:
+        queries (np.ndarray): (q, dim) normalized query vectors
+        vectors (np.ndarray): (n, dim) normalized vectors
+        query_rows (np.ndarray): (q,) rows of the queries in vectors, excluded from their own neighbors, -1 for
+            queries which are not in vectors
+        k (int): number of neighbors
+        block_size (int): number of queries multiplied together
+        num_workers (int): number of threads
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (q, k) rows of the neighbors, best first and -1 padded, and their similarities
+    """
+    k = min(k, max(len(vectors) - int((query_rows >= 0).any()), 0))
+    neighbors = np.full((len(queries), k), -1, dtype=np.int32)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    if k == 0:
+        return neighbors, scores
+
+    def process(start: int) -> None:
+        end = min(start + block_size, len(queries))
+        similarities = queries[start:end] @ vectors.T
+        own_rows = np.flatnonzero(query_rows[start:end] >= 0)
+        similarities[own_rows, query_rows[start:end][own_rows]] = -np.inf
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(process, range(0, len(queries), block_size)))
+    return neighbors, scores
+
+
+def merge_neighbors(
+    neighbors: np.ndarray, scores: np.ndarray, new_neighbors: np.ndarray, new_scores: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Keep the k best of two neighbor lists of the same rows, both sorted best first"""
+    k = neighbors.shape[1]
+    all_neighbors = np.concatenate([neighbors, new_neighbors], axis=1)
+    all_scores = np.concatenate([np.where(neighbors >= 0, scores, -np.inf), new_scores], axis=1)
+    order = np.argsort(-all_scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(all_neighbors, order, axis=1), np.take_along_axis(all_scores, order, axis=1)
+
+
+def build_similar_recipes(
+    vector_store: VectorStore,
+    directory: str,
+    k: int,
+    block_size: int,
+    num_workers: int,
+    full: bool = False,
+    vector_name: Optional[str] = None,
+) -> dict:
+    """Compute the k most similar recipes of every recipe and save them in a directory.
+
+    The graph is saved as
+        - recipes.json: dataset name and recipe id of each recipe, the position of a recipe is its row
+        - vectors.npy: (num_recipes, dim) recipe vectors, used to find the recipes changed by the next run
+        - neighbors.npy / scores.npy: (num_recipes, k) rows of the neighbors of each recipe and their similarities
+        - graph.json: k and number of recipes, written last
+    A run on an existing graph keeps the rows of the recipes and only recomputes the neighbors of the new or changed
+    recipes and of the recipes which had them as neighbors, the other rows merge their lists with the changed recipes.
+
+    Args:
+        vector_store (VectorStore): Qdrant, LocalVectorStore or NamedVectorStore collection
+        directory (str): directory of the graph
+        k (int): number of neighbors of each recipe
+        block_size (int): number of recipes multiplied together
+        num_workers (int): number of threads
+        full (bool, optional): recompute all the rows even if a previous graph exists. Defaults to False.
+        vector_name (Optional[str], optional): vector read from a collection with named vectors. Defaults to None.
+
+    Returns:
+        dict: number of recipes and number of recomputed and merged rows
+    """
+    recipes, vectors = get_recipe_vectors(vector_store, vector_name)
+    previous = None if full else SimilarRecipes.load(directory)
+    if previous is not None and (previous.k != k or not set(map(tuple, previous.recipes)) <= set(map(tuple, recipes))):
+        # Removed recipes or another k shift all the rows, rebuild from scratch
+        previous = None
+
+    if previous is None:
+        neighbors, scores = top_k_neighbors(vectors, vectors, np.arange(len(vectors)), k, block_size, num_workers)
+        stats = {"num_recipes": len(recipes), "num_recomputed": len(recipes), "num_merged": 0}
+    else:
+        # Keep the previous rows and append the new recipes after them
+        positions = {tuple(key): row for row, key in enumerate(recipes)}
+        order = [positions[tuple(key)] for key in previous.recipes]
+        new_rows = sorted(set(range(len(recipes))) - set(order))
+        recipes = [recipes[row] for row in order + new_rows]
+        vectors = vectors[order + new_rows]
+        num_previous = len(previous.recipes)
+        unchanged = np.abs(vectors[:num_previous] - previous.vectors).max(axis=1) <= VECTOR_TOLERANCE
+        changed = np.concatenate([np.flatnonzero(~unchanged), np.arange(num_previous, len(recipes))])
+
+        neighbors = np.full((len(recipes), min(k, max(len(recipes) - 1, 0))), -1, dtype=np.int32)
+        scores = np.zeros(neighbors.shape, dtype=np.float32)
+        previous_width = previous.neighbors.shape[1]
+        neighbors[:num_previous, :previous_width] = previous.neighbors
+        scores[:num_previous, :previous_width] = previous.scores
+        # Lists holding a changed recipe have stale scores, and lists with free slots may gain a new recipe
+        stale = np.isin(neighbors[:num_previous], changed).any(axis=1) | (neighbors[:num_previous] < 0).any(axis=1)
+        recompute = np.union1d(changed, np.flatnonzero(stale)).astype(np.int64)
+        merge = np.setdiff1d(np.arange(len(recipes)), recompute)
+        if len(recompute) > 0:
+            neighbors[recompute], scores[recompute] = top_k_neighbors(
+                vectors[recompute], vectors, recompute, k, block_size, num_workers
+            )
+        if len(merge) > 0 and len(changed) > 0:
+            # The other recipes only need their similarity to the changed recipes
+            changed_neighbors, changed_scores = top_k_neighbors(
+                vectors[merge], vectors[changed], np.full(len(merge), -1), k, block_size, num_workers
+            )
+            changed_neighbors = np.where(changed_neighbors >= 0, changed[changed_neighbors], -1)
+            neighbors[merge], scores[merge] = merge_neighbors(
+                neighbors[merge], scores[merge], changed_neighbors, changed_scores
+            )
+        stats = {"num_recipes": len(recipes), "num_recomputed": len(recompute), "num_merged": len(merge)}
+        # Release the memory maps of the previous graph before its files are overwritten
+        previous = None
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "recipes.json"), "w") as file:
+        json.dump(recipes, file)
+    np.save(os.path.join(directory, "vectors.npy"), vectors)
+    np.save(os.path.join(directory, "neighbors.npy"), neighbors)
+    np.save(os.path.join(directory, "scores.npy"), scores.astype(np.float32))
+    write_json_atomic({"k": k, "num_recipes": len(recipes)}, os.path.join(directory, "graph.json"))
+    return stats
+
+
+class SimilarRecipes:
+    """Read-only similar recipes graph answering a recipe page with a dictionary lookup and a row of the arrays"""
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory (str): directory of the graph
+        """
+        with open(os.path.join(directory, "graph.json"), "r") as file:
+            self.k = json.load(file)["k"]
+        with open(os.path.join(directory, "recipes.json"), "r") as file:
+            self.recipes = json.load(file)
+        self.rows = {tuple(key): row for row, key in enumerate(self.recipes)}
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.neighbors = np.load(os.path.join(directory, "neighbors.npy"), mmap_mode="r")
+        self.scores = np.load(os.path.join(directory, "scores.npy"), mmap_mode="r")
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["SimilarRecipes"]:
+        """Open the graph of a directory, None if it was never built"""
+        if not os.path.exists(os.path.join(directory, "graph.json")):
+            return None
+        return cls(directory)
+
+    def similar(self, dataset_name: str, recipe_id: str, k: Optional[int] = None) -> list[dict]:
+        """Most similar recipes of a recipe.
+
+        Args:
+            dataset_name (str): dataset of the recipe
+            recipe_id (str): id of the recipe
+            k (Optional[int], optional): number of recipes, at most the k of the graph. Defaults to None, i.e., all.
+
+        Returns:
+            list[dict]: dataset name, recipe id and cosine similarity of the similar recipes, best first
+        """
+        row = self.rows.get((dataset_name, recipe_id))
+        if row is None:
+            raise ValueError(f"Recipe {recipe_id} of {dataset_name} is not in the similar recipes graph")
+        neighbors, scores = self.neighbors[row, :k].tolist(), self.scores[row, :k].tolist()
+        return [
+            {"dataset_name": self.recipes[neighbor][0], "recipe_id": self.recipes[neighbor][1], "score": score}
+            for neighbor, score in zip(neighbors, scores)
+            if neighbor >= 0
+        ]
+
+
+@click.command()
+@click.option(
+    "--embedding_model_name",
+    default=params["embedding_model"]["model_name"],
+    show_default=True,
+    type=str,
+    help="Model tag of hugging face model to get sentence embeddings",
+)
+@click.option(
+    "--retriver_db_name",
+    default=params["embedding_model"]["retriver_db_name"],
+    show_default=True,
+    type=str,
+    help="Collections name for the embeddings db",
+)
+@click.option(
+    "--vector_store_backend",
+    default=params["vector_store"]["backend"],
+    show_default=True,
+    type=click.Choice(["qdrant", "local"]),
+    help="Vector db with the embeddings, qdrant or local",
+)
+@click.option(
+    "--vector_name",
+    default=None,
+    type=str,
+    help="Name of embedding_model.vectors whose named vectors give the recipe vectors, for a collection indexed "
+    "with --vector_names",
+)
+@click.option(
+    "--k", default=params["similar_recipes"]["top_k"], show_default=True, type=int, help="Neighbors of each recipe"
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="Recompute the neighbors of all the recipes instead of the ones affected by newly indexed recipes",
+)
+def similar_recipes_entrypoint(
+    embedding_model_name: str,
+    retriver_db_name: str,
+    vector_store_backend: str,
+    vector_name: Optional[str],
+    k: int,
+    full: bool,
+):
+    """Build or update the similar recipes graph of an indexed collection.
+
+    Args:
+        embedding_model_name (str): Model tag of hugging face model to get sentence embeddings
+        retriver_db_name (str): Collections name for the embeddings db
+        vector_store_backend (str): Vector db with the embeddings, qdrant or local
+        vector_name (Optional[str]): Name of the named vectors giving the recipe vectors
+        k (int): Number of neighbors of each recipe
+        full (bool): Recompute the neighbors of all the recipes
+    """
+    if vector_name is not None:
+        embedding_model = get_named_embedding_models([vector_name])
+    else:
+        embedding_model = get_embedding_model(embedding_model_name)
+    vector_store = get_vector_store(
+        backend=vector_store_backend,
+        embeddings_model=embedding_model,
+        retriver_db_name=retriver_db_name,
+        read_only=True,
+    )
+    directory = get_similar_recipes_path(retriver_db_name, vector_store_backend)
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    if os.path.exists(directory):
+        shutil.copytree(directory, tmp_directory)
+    stats = build_similar_recipes(
+        vector_store,
+        tmp_directory,
+        k=k,
+        block_size=params["similar_recipes"]["block_size"],
+        num_workers=params["similar_recipes"]["num_workers"] or os.cpu_count() or 1,
+        full=full,
+        vector_name=vector_name,
+    )
+    # Swap the directories so that the retrieval service never reads a partially written graph
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    # A new version of the collection makes the retrieval service load the new graph
+    bump_collection_version(get_version_path(retriver_db_name, vector_store_backend))
+    LOGGER.info("Built the similar recipes graph", directory=directory, **stats)
+
+
+if __name__ == "__main__":
+    similar_recipes_entrypoint()
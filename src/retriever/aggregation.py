@@ -0,0 +1,75 @@
+"""Recipe level results: chunk hits grouped by recipe, pooled scores and the full recipes read in bulk."""
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.indexing.ingestion import read_json_file
+
+# Functions pooling the scores of the chunks of a recipe into the score of the recipe
+POOLING_FUNCTIONS = {"max": max, "sum": sum}
+
+
+def aggregate_recipes(chunks: list[dict], k: int, pooling: str = "max") -> list[dict]:
+    """Group the chunk hits by recipe and keep the k recipes with the highest pooled score.
+
+    Args:
+        chunks (list[dict]): page content, meta-data and score of the chunk hits, best first
+        k (int): number of recipes
+        pooling (str, optional): max scores a recipe with its best chunk, sum adds the scores of its chunks, which
+            favors recipes matching the query in several fields. Defaults to "max".
+
+    Returns:
+        list[dict]: dataset name, recipe id, pooled score, number of chunk hits and best chunk of the top k recipes
+    """
+    if pooling not in POOLING_FUNCTIONS:
+        raise ValueError(f"Unknown score pooling {pooling}, expected one of {list(POOLING_FUNCTIONS)}")
+    groups: dict[tuple, list[dict]] = {}
+    for chunk in chunks:
+        key = (chunk["metadata"].get("dataset_name"), chunk["metadata"].get("recipe_id"))
+        groups.setdefault(key, []).append(chunk)
+    pool = POOLING_FUNCTIONS[pooling]
+    scores = {key: pool(chunk["score"] for chunk in group) for key, group in groups.items()}
+    # Partial heap selection of the top k groups, ties keep the rank of the best chunk of the recipes
+    top = heapq.nlargest(k, groups, key=scores.get)
+    return [
+        {
+            "dataset_name": dataset_name,
+            "recipe_id": recipe_id,
+            "score": scores[(dataset_name, recipe_id)],
+            "num_chunks": len(groups[(dataset_name, recipe_id)]),
+            "best_chunk": groups[(dataset_name, recipe_id)][0],
+        }
+        for dataset_name, recipe_id in top
+    ]
+
+
+class RecipeReader:
+    """Read the scraped json files of the recipes returned by a search with a thread pool kept across requests."""
+
+    def __init__(self, scraped_data_root: str, num_workers: int = 8):
+        """
+        Args:
+            scraped_data_root (str): directory with the recipes of each scraped dataset
+            num_workers (int, optional): number of threads reading the files. Defaults to 8.
+        """
+        self.scraped_data_root = scraped_data_root
+        self.executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="recipe-reader")
+
+    def get_path(self, dataset_name: str, recipe_id: str) -> str:
+        """Scraped json file of a recipe"""
+        return os.path.join(self.scraped_data_root, dataset_name, "recipes", f"{recipe_id}.json")
+
+    def read(self, dataset_name: str, recipe_id: str) -> Optional[dict]:
+        """Full details of a recipe, None if its file does not exist anymore"""
+        try:
+            return read_json_file(self.get_path(dataset_name, recipe_id))
+        except FileNotFoundError:
+            return None
+
+    def read_many(self, keys: list[tuple[str, str]]) -> list[Optional[dict]]:
+        """Full details of the recipes of (dataset name, recipe id) keys, read concurrently in a single batch"""
+        return list(self.executor.map(lambda key: self.read(*key), keys))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
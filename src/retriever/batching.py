@@ -0,0 +1,116 @@
+"""Collect concurrent requests into micro-batches processed by a single call of a batch function."""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+class BatchingStats:
+    """Number of items and batches processed by a micro-batcher."""
+
+    def __init__(self):
+        self.num_items = 0
+        self.num_batches = 0
+        self.batch_seconds = 0.0
+
+    @property
+    def mean_batch_size(self) -> float:
+        """Average number of items in a batch"""
+        return round(self.num_items / max(self.num_batches, 1), 2)
+
+    def as_dict(self) -> dict:
+        """Stats as a dictionary to add in the logs or the metrics endpoint"""
+        return {
+            "num_items": self.num_items,
+            "num_batches": self.num_batches,
+            "mean_batch_size": self.mean_batch_size,
+            "mean_batch_ms": round(1000 * self.batch_seconds / max(self.num_batches, 1), 3),
+        }
+
+
+class MicroBatcher:
+    """Run a batch function on items submitted concurrently from many threads.
+
+    A worker thread waits for the first item, then keeps collecting items until the batch holds max_batch_size items
+    or max_wait_ms passed since the first one, and calls the batch function once for the whole batch. Under load the
+    batches fill up immediately, when idle a single item waits at most max_wait_ms.
+    """
+
+    def __init__(self, batch_function: Callable[[list], list], max_batch_size: int, max_wait_ms: float):
+        """
+        Args:
+            batch_function (Callable[[list], list]): function returning one output per input item, in order
+            max_batch_size (int): maximum number of items in a batch
+            max_wait_ms (float): maximum time the first item of a batch waits for more items
+        """
+        self.batch_function = batch_function
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self.stats = BatchingStats()
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Add an item to the next batch and return a future with its output"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The micro-batcher is closed")
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Output of the batch function for a single item, blocking until its batch is processed"""
+        return self.submit(item).result()
+
+    def _collect_batch(self) -> list[tuple[Any, Future]]:
+        """Block until a first item arrives and collect more items until the batch is full or the wait is over"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(block=timeout > 0, timeout=max(timeout, 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, batch: list[tuple[Any, Future]]) -> None:
+        """Call the batch function once and resolve the future of every item in the batch"""
+        start = time.perf_counter()
+        try:
+            outputs = self.batch_function([item for item, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        self.stats.batch_seconds += time.perf_counter() - start
+        self.stats.num_batches += 1
+        self.stats.num_items += len(batch)
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            # An item without a future is the sentinel put by close after the last submitted item
+            stop = any(future is None for _, future in batch)
+            batch = [(item, future) for item, future in batch if future is not None]
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if len(batch) > 0:
+                self._process(batch)
+            if stop:
+                return
+
+    def close(self) -> None:
+        """Stop the worker thread after the items already submitted"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put((None, None))
+        self._worker.join()
@@ -0,0 +1,195 @@
+"""Bounded caches of the retriever: query text to embedding and semantic query to search results."""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import numpy as np
+
+# Marker of a missing cache entry, None can be a cached value
+MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace insensitive form of a query used as the cache key"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class CacheStats:
+    """Hits, misses and evictions of a cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of the lookups served from the cache"""
+        return round(self.hits / max(self.hits + self.misses, 1), 4)
+
+    def as_dict(self) -> dict:
+        """Stats as a dictionary to add in the logs or the metrics endpoint"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl_seconds after they are written."""
+
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_size (int): maximum number of entries, the least recently used entry is evicted beyond it
+            ttl_seconds (float): lifetime of an entry
+            clock (Callable[[], float], optional): time source in seconds. Defaults to time.monotonic.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Cached value of a key, MISSING if it is not cached or expired"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache a value, evicting the least recently used entries beyond max_size"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self.entries[key] = (self.clock() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all the entries, e.g., when the collection changed"""
+        with self._lock:
+            self.entries.clear()
+            self.stats.invalidations += 1
+
+
+class EmbeddingBucketer:
+    """Map query embeddings to buckets with random hyperplanes (SimHash).
+
+    Queries whose embeddings point in almost the same direction, e.g., "paneer curry" and "Paneer curry!", fall in the
+    same bucket and share the cached search results. More bits give smaller buckets.
+    """
+
+    def __init__(self, dim: int, num_bits: int = 64, seed: int = 0):
+        """
+        Args:
+            dim (int): dimension of the embeddings
+            num_bits (int, optional): number of hyperplanes. Defaults to 64.
+            seed (int, optional): random seed of the hyperplanes. Defaults to 0.
+        """
+        self.planes = np.random.default_rng(seed).standard_normal((num_bits, dim)).astype(np.float32)
+
+    def __call__(self, embedding: list[float]) -> bytes:
+        """Bucket of an embedding as the packed signs of its projections on the hyperplanes"""
+        return np.packbits(self.planes @ np.asarray(embedding, dtype=np.float32) > 0).tobytes()
+
+
+class RetrieverCache:
+    """Query embedding cache and semantic result cache of the retrieval service.
+
+    The results of the keyword matches answered by the BM25 index alone are cached by query text, since they are
+    found without embedding the query. The service drops all the caches when the indexer writes a new version of the
+    collection, and the result keys include the version searched, so that the results put by requests still running
+    on a previous version never answer the requests of the new one.
+    """
+
+    def __init__(
+        self,
+        embedding_cache_size: int,
+        result_cache_size: int,
+        ttl_seconds: float,
+        bucket_bits: int,
+    ):
+        """
+        Args:
+            embedding_cache_size (int): maximum number of cached query embeddings
+            result_cache_size (int): maximum number of cached search results
+            ttl_seconds (float): lifetime of the cached embeddings and results
+            bucket_bits (int): number of SimHash bits of the embedding buckets keying the result cache
+        """
+        self.embeddings = TTLCache(embedding_cache_size, ttl_seconds)
+        self.results = TTLCache(result_cache_size, ttl_seconds)
+        self.keyword_results = TTLCache(result_cache_size, ttl_seconds)
+        self.bucket_bits = bucket_bits
+        # A bucketer per vector name, the embeddings of the models have different dimensions
+        self._bucketers: dict[Optional[str], EmbeddingBucketer] = {}
+
+    def clear(self) -> None:
+        """Drop the cached embeddings and results, e.g., when the collection changed"""
+        self.embeddings.clear()
+        self.results.clear()
+        self.keyword_results.clear()
+
+    def get_embedding(self, query: str, vector_name: Optional[str] = None) -> Any:
+        """Cached embedding of a query by the model of a vector name, MISSING if it is not cached"""
+        return self.embeddings.get((vector_name, normalize_query(query)))
+
+    def put_embedding(self, query: str, embedding: list[float], vector_name: Optional[str] = None) -> None:
+        """Cache the embedding of a query by the model of a vector name"""
+        self.embeddings.put((vector_name, normalize_query(query)), embedding)
+
+    def get_result_key(
+        self,
+        embedding: list[float],
+        filter: Optional[dict],
+        k: int,
+        vector_name: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> tuple:
+        """Key of the result cache from the vector name, the embedding bucket, the filter, the number of results and
+        the version of the collection"""
+        bucketer = self._bucketers.get(vector_name)
+        if bucketer is None:
+            bucketer = self._bucketers[vector_name] = EmbeddingBucketer(len(embedding), self.bucket_bits)
+        return version, vector_name, bucketer(embedding), json.dumps(filter, sort_keys=True), k
+
+    def get_keyword_result_key(
+        self, query: str, filter: Optional[dict], k: int, version: Optional[str] = None
+    ) -> tuple:
+        """Key of the keyword result cache from the query text, the filter, the number of results and the version of
+        the collection"""
+        return version, normalize_query(query), json.dumps(filter, sort_keys=True), k
+
+    def metrics(self) -> dict:
+        """Hit rates and sizes of the caches"""
+        return {
+            "embedding_cache": {"size": len(self.embeddings), **self.embeddings.stats.as_dict()},
+            "result_cache": {"size": len(self.results), **self.results.stats.as_dict()},
+            "keyword_result_cache": {"size": len(self.keyword_results), **self.keyword_results.stats.as_dict()},
+        }
@@ -0,0 +1,46 @@
+"""Hybrid retrieval fusing the BM25 and dense search results with reciprocal rank fusion."""
+from langchain.schema import Document
+
+
+def get_chunk_key(document: Document) -> tuple:
+    """Identity of a chunk shared by the BM25 index and the vector store"""
+    return document.metadata.get("dataset_name"), document.metadata.get("recipe_id"), document.page_content
+
+
+def reciprocal_rank_fusion(ranked_lists: list[list[Document]], rrf_k: int = 60, k: int = 4) -> list[tuple]:
+    """Fuse ranked lists of chunks by summing 1 / (rrf_k + rank) over the lists where a chunk appears.
+
+    Args:
+        ranked_lists (list[list[Document]]): results of each retriever, best first
+        rrf_k (int, optional): rank offset, higher values flatten the contribution of the top ranks. Defaults to 60.
+        k (int, optional): number of fused results. Defaults to 4.
+
+    Returns:
+        list[tuple[Document, float]]: chunks with the highest fused score and the score
+    """
+    scores, documents = {}, {}
+    for ranked_list in ranked_lists:
+        for rank, document in enumerate(ranked_list, start=1):
+            key = get_chunk_key(document)
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    top = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [(documents[key], scores[key]) for key in top]
+
+
+def is_keyword_match(sparse_results: list[tuple[Document, float, float]], num_terms: int, k: int, max_terms: int):
+    """Whether a short keyword query is answered by the BM25 results alone.
+
+    Args:
+        sparse_results (list[tuple[Document, float, float]]): BM25 results with the fraction of the query terms each
+            chunk contains
+        num_terms (int): number of terms of the query
+        k (int): number of requested results
+        max_terms (int): longest query treated as a keyword query
+
+    Returns:
+        bool: True if the query has at most max_terms terms and at least k chunks contain all of them
+    """
+    if num_terms == 0 or num_terms > max_terms or len(sparse_results) < k:
+        return False
+    return all(coverage == 1.0 for _, _, coverage in sparse_results[:k])
@@ -0,0 +1,160 @@
+"""Optional second stage of the retriever rescoring the top candidates with a cross-encoder."""
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder
+
+from src.retriever.cache import MISSING, TTLCache, normalize_query
+
+
+class LatencyStats:
+    """Percentiles of the latencies of the most recent calls of a stage."""
+
+    def __init__(self, window: int = 10_000):
+        """
+        Args:
+            window (int, optional): number of most recent latencies kept. Defaults to 10_000.
+        """
+        self.latencies = deque(maxlen=window)
+        self.num_calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        """Record the latency of a call"""
+        with self._lock:
+            self.latencies.append(seconds)
+            self.num_calls += 1
+
+    def as_dict(self) -> dict:
+        """Stats as a dictionary to add in the logs or the metrics endpoint"""
+        with self._lock:
+            latencies = np.asarray(self.latencies, dtype=np.float64) * 1000
+        if len(latencies) == 0:
+            return {"num_calls": self.num_calls, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return {"num_calls": self.num_calls, "p50_ms": round(float(p50), 3), "p99_ms": round(float(p99), 3)}
+
+
+def get_cross_encoder(model_name: str) -> CrossEncoder:
+    """Instantiate a cross-encoder, saved under DATA_ROOT/reranker_models on first use like the embedding models"""
+    model_path = os.path.join(os.getenv("DATA_ROOT"), "reranker_models", model_name)
+    if not os.path.exists(model_path):
+        os.makedirs(model_path)
+        CrossEncoder(model_name).save(model_path)
+    return CrossEncoder(model_path, device="cuda" if torch.cuda.is_available() else "cpu")
+
+
+class CrossEncoderReranker:
+    """Rerank the best first-stage results of a query with a cross-encoder scoring (query, chunk) pairs.
+
+    Only the top_n candidates within max_score_gap of the best first-stage score are scored, the pairs missing from
+    the score cache are scored by a single batched call of the model. Candidates which are not scored keep their
+    first-stage order after the reranked ones.
+
+    The scores of the reranked results are the cross-encoder logits mapped to (0, 1) by a sigmoid. The results which
+    are not reranked get scores strictly between 0 and the lowest reranked score, decreasing with their first-stage
+    rank, so the scores of all the results are on one scale for the recipe pooling.
+    """
+
+    def __init__(
+        self,
+        model: CrossEncoder,
+        top_n: int,
+        max_score_gap: float,
+        batch_size: int = 32,
+        cache_size: int = 50_000,
+        ttl_seconds: float = 3600,
+    ):
+        """
+        Args:
+            model (CrossEncoder): cross-encoder scoring (query, text) pairs
+            top_n (int): maximum number of candidates reranked per query
+            max_score_gap (float): candidates whose first-stage score is lower than the best one by more than this
+                fraction of it are not reranked
+            batch_size (int, optional): batch size of the model. Defaults to 32.
+            cache_size (int, optional): maximum number of cached (query, chunk) scores. Defaults to 50_000.
+            ttl_seconds (float, optional): lifetime of a cached score. Defaults to 3600.
+        """
+        self.model = model
+        self.top_n = top_n
+        self.max_score_gap = max_score_gap
+        self.batch_size = batch_size
+        self.scores = TTLCache(cache_size, ttl_seconds)
+        self.latency = LatencyStats()
+        self.num_scored_pairs = 0
+
+    def select_candidates(self, results: list[dict]) -> int:
+        """Number of leading results reranked: at most top_n, cut at the first score too far below the best one"""
+        candidates = results[: self.top_n]
+        if len(candidates) == 0:
+            return 0
+        min_score = candidates[0]["score"] - self.max_score_gap * abs(candidates[0]["score"])
+        return next((idx for idx, result in enumerate(candidates) if result["score"] < min_score), len(candidates))
+
+    def rerank(self, query: str, results: list[dict], k: Optional[int] = None) -> list[dict]:
+        """Reorder first-stage results by their cross-encoder score.
+
+        Args:
+            query (str): query text
+            results (list[dict]): page content, meta-data and score of the first-stage results, best first
+            k (Optional[int], optional): number of results to return. Defaults to None, i.e., all of them.
+
+        Returns:
+            list[dict]: results with the rescaled cross-encoder score, or a score below all of them for the results
+                which are not reranked, as score and the first-stage score as first_stage_score
+        """
+        start = time.perf_counter()
+        num_candidates = self.select_candidates(results)
+        query_key = normalize_query(query)
+        keys = [
+            (
+                query_key,
+                result["metadata"].get("dataset_name"),
+                result["metadata"].get("recipe_id"),
+                result["page_content"],
+            )
+            for result in results[:num_candidates]
+        ]
+        scores = [self.scores.get(key) for key in keys]
+        missing = [idx for idx, score in enumerate(scores) if score is MISSING]
+        if len(missing) > 0:
+            pairs = [(query, results[idx]["page_content"]) for idx in missing]
+            predictions = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for idx, score in zip(missing, np.asarray(predictions, dtype=np.float64).tolist()):
+                scores[idx] = score
+                self.scores.put(keys[idx], score)
+            self.num_scored_pairs += len(missing)
+        reranked = [
+            {**result, "score": float(1 / (1 + np.exp(-score))), "first_stage_score": result["score"]}
+            for result, score in zip(results[:num_candidates], scores)
+        ]
+        reranked.sort(key=lambda result: result["score"], reverse=True)
+        tail = results[num_candidates:]
+        if len(reranked) > 0:
+            # Scores below the lowest reranked one, in the first-stage order of the results
+            min_score = reranked[-1]["score"]
+            reranked.extend(
+                {
+                    **result,
+                    "score": min_score * (len(tail) - idx) / (len(tail) + 1),
+                    "first_stage_score": result["score"],
+                }
+                for idx, result in enumerate(tail)
+            )
+        else:
+            reranked.extend({**result, "first_stage_score": result["score"]} for result in tail)
+        self.latency.add(time.perf_counter() - start)
+        return reranked[:k]
+
+    def metrics(self) -> dict:
+        """Latency added by the rerank stage, number of pairs scored by the model and score cache hit rate"""
+        return {
+            "latency": self.latency.as_dict(),
+            "num_scored_pairs": self.num_scored_pairs,
+            "score_cache": {"size": len(self.scores), **self.scores.stats.as_dict()},
+        }
@@ -0,0 +1,730 @@
+"""Long-lived retrieval service answering recipe queries over a local HTTP/JSON API."""
+import functools
+import json
+import os
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Optional
+
+import click
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain_community.vectorstores import Qdrant
+from langchain_core.vectorstores import VectorStore
+
+from src.common.logger import get_logger
+from src.indexer import get_embedding_model, get_named_embedding_models, get_vector_store, params
+from src.indexing.bm25 import BM25Index, get_sparse_index_path, tokenize
+from src.indexing.collection_schema import get_qdrant_filter
+from src.indexing.collection_version import CollectionVersionWatcher, get_version_path
+from src.indexing.compression import get_qdrant_search_params
+from src.indexing.ingredient_index import IngredientIndex, get_ingredient_index_path, get_ingredient_index_version_path
+from src.indexing.local_vector_store import LocalVectorStore
+from src.indexing.named_vectors import NamedVectorStore
+from src.indexing.similar_recipes import SimilarRecipes, get_similar_recipes_path
+from src.retriever.aggregation import RecipeReader, aggregate_recipes
+from src.retriever.batching import MicroBatcher
+from src.retriever.cache import MISSING, RetrieverCache
+from src.retriever.hybrid import is_keyword_match, reciprocal_rank_fusion
+from src.retriever.rerank import CrossEncoderReranker, get_cross_encoder
+
+LOGGER = get_logger(__file__)
+# Maximum size of a request body in bytes
+MAX_REQUEST_BYTES = 1 << 20
+
+
+def format_results(results: Iterable[tuple[Document, float]]) -> list[dict]:
+    """Json serializable search results"""
+    return [
+        {"page_content": document.page_content, "metadata": document.metadata, "score": score}
+        for document, score in results
+    ]
+
+
+def get_int_field(request: dict, key: str, minimum: int) -> Optional[int]:
+    """Optional integer field of a request, a ValueError if it is not an integer of at least minimum"""
+    value = request.get(key)
+    if value is None:
+        return None
+    # json true and false are parsed into booleans, which are integers in python
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise ValueError(f"{key} must be an integer of at least {minimum}")
+    return value
+
+
+def close_vector_store(vector_store: VectorStore) -> None:
+    """Close the files of a local vector store or the client of a Qdrant vector store"""
+    stores = vector_store.stores.values() if isinstance(vector_store, NamedVectorStore) else [vector_store]
+    for store in stores:
+        if isinstance(store, LocalVectorStore):
+            store.close()
+        elif isinstance(store, Qdrant):
+            # The stores of the named vectors of a Qdrant collection share their client, closing it again is a no-op
+            store.client.close()
+
+
+class ServedStores:
+    """Vector store and BM25 index of a version of the collection, shared by the requests searching them.
+
+    Stores replaced by a newer version are closed by the last request searching them, or right away if there is none.
+    """
+
+    def __init__(self, vector_store: VectorStore, sparse_index: Optional[BM25Index], version: Optional[str] = None):
+        """
+        Args:
+            vector_store (VectorStore): collection with the chunk embeddings
+            sparse_index (Optional[BM25Index]): BM25 index of the chunks
+            version (Optional[str], optional): version of the collection, part of the keys of the cached results.
+                Defaults to None.
+        """
+        self.vector_store = vector_store
+        self.sparse_index = sparse_index
+        self.version = version
+        self.num_requests = 0
+        self.retired = False
+
+    def close(self) -> None:
+        """Close the vector store and the BM25 index"""
+        close_vector_store(self.vector_store)
+        if self.sparse_index is not None:
+            self.sparse_index.close()
+
+
+class RetrievalService:
+    """Embedding model and vector store loaded once and shared by all the requests.
+
+    Queries received concurrently are embedded together by a single call of the model through a micro-batcher, the
+    vector search then runs in the thread of each request. With named vectors, every query names the vector searched,
+    the first one by default, and is embedded by the micro-batcher of the model of the vector.
+
+    When the indexer writes a new version of the collection, the vector store and the BM25 index are reopened by the
+    first request that sees it and the caches are dropped. The requests already running finish on the previous
+    stores, which are closed when the last of them is done.
+    """
+
+    def __init__(
+        self,
+        embeddings_model: Embeddings | dict[str, Embeddings],
+        vector_store: VectorStore,
+        max_batch_size: int,
+        max_wait_ms: float,
+        default_k: int,
+        search_kwargs: Optional[dict] = None,
+        cache: Optional[RetrieverCache] = None,
+        sparse_index: Optional[BM25Index] = None,
+        hybrid_params: Optional[dict] = None,
+        pantry_index: Optional[IngredientIndex] = None,
+        recipe_reader: Optional[RecipeReader] = None,
+        recipe_params: Optional[dict] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
+        similar_recipes: Optional[SimilarRecipes] = None,
+        version_watcher: Optional[CollectionVersionWatcher] = None,
+        reopen_stores: Optional[Callable[[], tuple[VectorStore, Optional[BM25Index]]]] = None,
+        load_similar_recipes: Optional[Callable[[], Optional[SimilarRecipes]]] = None,
+        pantry_watcher: Optional[CollectionVersionWatcher] = None,
+        load_pantry_index: Optional[Callable[[], Optional[IngredientIndex]]] = None,
+    ):
+        """
+        Args:
+            embeddings_model (Embeddings | dict[str, Embeddings]): model used to embed the queries, or the model of
+                each vector name of a NamedVectorStore
+            vector_store (VectorStore): collection with the chunk embeddings
+            max_batch_size (int): maximum number of queries embedded together
+            max_wait_ms (float): maximum time a query waits for other queries to fill its batch
+            default_k (int): number of chunks returned when a request does not set k
+            search_kwargs (Optional[dict], optional): extra arguments of the vector search, e.g., Qdrant search
+                params. Defaults to None.
+            cache (Optional[RetrieverCache], optional): caches of the query embeddings and search results.
+                Defaults to None.
+            sparse_index (Optional[BM25Index], optional): BM25 index of the chunks fused with the dense results.
+                Defaults to None, i.e., dense search only.
+            hybrid_params (Optional[dict], optional): rrf_k, num_candidates and skip_dense_max_terms of the hybrid
+                search. Defaults to None.
+            pantry_index (Optional[IngredientIndex], optional): ingredient index answering the pantry searches.
+                Defaults to None.
+            recipe_reader (Optional[RecipeReader], optional): reader of the full recipes returned by the recipe search.
+                Defaults to None, i.e., recipes are returned with their best chunk only.
+            recipe_params (Optional[dict], optional): pooling and overfetch of the recipe search. Defaults to None.
+            reranker (Optional[CrossEncoderReranker], optional): cross-encoder reranking the first-stage results.
+                Defaults to None.
+            similar_recipes (Optional[SimilarRecipes], optional): precomputed similar recipes of every recipe.
+                Defaults to None.
+            version_watcher (Optional[CollectionVersionWatcher], optional): watcher of the version of the collection
+                written by the indexer. Defaults to None, i.e., the stores and caches are never refreshed.
+            reopen_stores (Optional[Callable[[], tuple[VectorStore, Optional[BM25Index]]]], optional): opens the
+                vector store and the BM25 index again when the version changes. Defaults to None, i.e., only the
+                caches are dropped, e.g., for a Qdrant server, which serves the new points without reopening.
+            load_similar_recipes (Optional[Callable[[], Optional[SimilarRecipes]]], optional): loads the similar
+                recipes graph again when the version changes. Defaults to None, i.e., the graph is never reloaded.
+            pantry_watcher (Optional[CollectionVersionWatcher], optional): watcher of the version of the ingredient
+                index, which is built independently of the collection. Defaults to None.
+            load_pantry_index (Optional[Callable[[], Optional[IngredientIndex]]], optional): loads the ingredient index
+                again when its version changes. Defaults to None, i.e., the index is never reloaded.
+        """
+        self.embeddings_model = embeddings_model
+        self.default_k = default_k
+        self.search_kwargs = search_kwargs or {}
+        self.cache = cache
+        self._stores = ServedStores(
+            vector_store, sparse_index, version_watcher.version if version_watcher is not None else None
+        )
+        self.hybrid_params = hybrid_params or {"rrf_k": 60, "num_candidates": 50, "skip_dense_max_terms": 3}
+        self.num_dense_skipped = 0
+        self.pantry_index = pantry_index
+        self.recipe_reader = recipe_reader
+        self.recipe_params = recipe_params or {"pooling": "max", "overfetch": 4}
+        self.reranker = reranker
+        self.similar_recipes = similar_recipes
+        self.version_watcher = version_watcher
+        self.reopen_stores = reopen_stores
+        self.load_similar_recipes = load_similar_recipes
+        self.pantry_watcher = pantry_watcher
+        self.load_pantry_index = load_pantry_index
+        named_models = embeddings_model if isinstance(embeddings_model, dict) else {None: embeddings_model}
+        self.batchers = {
+            name: MicroBatcher(model.embed_documents, max_batch_size, max_wait_ms)
+            for name, model in named_models.items()
+        }
+        self.num_queries = 0
+        self._lock = threading.Lock()
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """Vector store of the current version of the collection"""
+        return self._stores.vector_store
+
+    @property
+    def sparse_index(self) -> Optional[BM25Index]:
+        """BM25 index of the current version of the collection"""
+        return self._stores.sparse_index
+
+    def check_version(self) -> None:
+        """Reopen the stores and drop the caches if the indexer wrote a new version of the collection"""
+        if self.version_watcher is None or not self.version_watcher.check():
+            return
+        version = self.version_watcher.version
+        if self.reopen_stores is not None:
+            stores = ServedStores(*self.reopen_stores(), version=version)
+            with self._lock:
+                previous, self._stores = self._stores, stores
+                previous.retired = True
+                unused = previous.num_requests == 0
+            if unused:
+                previous.close()
+        else:
+            # Same stores serving the new version, the results cached from now on are keyed by the new version
+            with self._lock:
+                self._stores = ServedStores(self._stores.vector_store, self._stores.sparse_index, version=version)
+        if self.load_similar_recipes is not None:
+            # The similar recipes entrypoint also writes a new version once it swapped in the rebuilt graph
+            self.similar_recipes = self.load_similar_recipes()
+        if self.cache is not None:
+            # Requests still running on the previous version cache their results under its version, which is never
+            # looked up again
+            self.cache.clear()
+        LOGGER.info("Refreshed the collection", version=self.version_watcher.version)
+
+    def acquire_stores(self) -> ServedStores:
+        """Stores of the current version of the collection, held by a request until release_stores"""
+        with self._lock:
+            stores = self._stores
+            stores.num_requests += 1
+            return stores
+
+    def release_stores(self, stores: ServedStores) -> None:
+        """Release the stores held by a request, closing them if a newer version replaced them"""
+        with self._lock:
+            stores.num_requests -= 1
+            unused = stores.retired and stores.num_requests == 0
+        if unused:
+            stores.close()
+
+    def get_vector_store(
+        self, vector: Optional[str] = None, vector_store: Optional[VectorStore] = None
+    ) -> tuple[Optional[str], VectorStore]:
+        """Name of the vector searched by a query and the store searching it, the default vector if it is None.
+
+        Args:
+            vector (Optional[str], optional): name of the vector. Defaults to None, i.e., the default vector.
+            vector_store (Optional[VectorStore], optional): vector store of the collection. Defaults to None, i.e.,
+                the current one.
+
+        Returns:
+            tuple[Optional[str], VectorStore]: name of the vector and store of the vector
+        """
+        vector_store = vector_store or self.vector_store
+        if isinstance(vector_store, NamedVectorStore):
+            vector = vector or vector_store.default_vector
+            return vector, vector_store.get_store(vector)
+        if vector is not None:
+            raise ValueError("The collection has a single unnamed vector, a query cannot name a vector")
+        return None, vector_store
+
+    def embed_query(self, query: str, vector: Optional[str] = None) -> list[float]:
+        """Embedding of a query computed in a micro-batch with the concurrent queries of the same vector"""
+        return self.batchers[vector](query)
+
+    def search(
+        self, query: str, k: Optional[int] = None, filter: Optional[dict] = None, vector: Optional[str] = None
+    ) -> list[dict]:
+        """Chunks most similar to a query.
+
+        Args:
+            query (str): query text
+            k (Optional[int], optional): number of chunks. Defaults to None, i.e., default_k.
+            filter (Optional[dict], optional): accepted meta-data values, {key: value, list of values or range}, e.g.,
+                {"difficulty": "easy", "servings": 4, "total_time_minutes": {"lte": 30}}. Defaults to None.
+            vector (Optional[str], optional): name of the vector searched in a collection with named vectors.
+                Defaults to None, i.e., the first vector.
+
+        Returns:
+            list[dict]: page content, meta-data and score of the chunks, the cosine similarity for dense results, the
+                BM25 score for keyword matches and the reciprocal rank fusion score for hybrid results
+        """
+        k = k or self.default_k
+        self.check_version()
+        # The stores of a request stay the same, and open, even if they are reopened during the request
+        stores = self.acquire_stores()
+        try:
+            return self._search(stores, query, k, filter, vector)
+        finally:
+            self.release_stores(stores)
+
+    def _search(
+        self, stores: ServedStores, query: str, k: int, filter: Optional[dict], vector: Optional[str]
+    ) -> list[dict]:
+        vector, vector_store = self.get_vector_store(vector, stores.vector_store)
+        sparse_index = stores.sparse_index
+        with self._lock:
+            self.num_queries += 1
+        embedding = MISSING
+        result_key = None
+        num_terms = len(set(tokenize(query)))
+        # Only short queries can be answered by the BM25 index alone, the others never hit the keyword result cache
+        keyword_query = sparse_index is not None and 0 < num_terms <= self.hybrid_params["skip_dense_max_terms"]
+        if self.cache is not None:
+            # The caches are looked up before any search: the keyword matches by query text, the other results by the
+            # bucket of the query embedding when it is cached
+            keyword_result_key = self.cache.get_keyword_result_key(query, filter, k, stores.version)
+            if keyword_query:
+                results = self.cache.keyword_results.get(keyword_result_key)
+                if results is not MISSING:
+                    return results
+            embedding = self.cache.get_embedding(query, vector)
+            if embedding is not MISSING:
+                result_key = self.cache.get_result_key(embedding, filter, k, vector, stores.version)
+                results = self.cache.results.get(result_key)
+                if results is not MISSING:
+                    return self.rerank(query, results, k)
+        num_candidates = max(k, self.hybrid_params["num_candidates"])
+        # The rerank stage reorders the top_n first-stage results before keeping k of them
+        first_stage_k = k if self.reranker is None else max(k, self.reranker.top_n)
+        sparse_results = []
+        if sparse_index is not None:
+            sparse_results = sparse_index.search(query, k=num_candidates, filter=filter)
+            if is_keyword_match(sparse_results, num_terms, k, self.hybrid_params["skip_dense_max_terms"]):
+                # Every top chunk contains all the terms of a short keyword query, the dense search cannot add much
+                with self._lock:
+                    self.num_dense_skipped += 1
+                results = self.rerank(
+                    query, format_results((document, score) for document, score, _ in sparse_results[:first_stage_k]), k
+                )
+                if self.cache is not None:
+                    # Keyed by the query text, the reranked results answer the same query only
+                    self.cache.keyword_results.put(keyword_result_key, results)
+                return results
+
+        if embedding is MISSING:
+            embedding = self.embed_query(query, vector)
+        if self.cache is not None and result_key is None:
+            # Another query of the same bucket may have been answered
+            self.cache.put_embedding(query, embedding, vector)
+            result_key = self.cache.get_result_key(embedding, filter, k, vector, stores.version)
+            results = self.cache.results.get(result_key)
+            if results is not MISSING:
+                return self.rerank(query, results, k)
+        dense_results = vector_store.similarity_search_with_score_by_vector(
+            embedding,
+            k=num_candidates if sparse_index is not None else first_stage_k,
+            filter=get_qdrant_filter(filter) if isinstance(vector_store, Qdrant) else filter,
+            **self.search_kwargs,
+        )
+        if sparse_index is not None:
+            dense_results = reciprocal_rank_fusion(
+                [[document for document, _ in dense_results], [document for document, _, _ in sparse_results]],
+                rrf_k=self.hybrid_params["rrf_k"],
+                k=first_stage_k,
+            )
+        results = format_results(dense_results)
+        if self.cache is not None:
+            # The first-stage results are shared by the queries of a bucket, each query reranks them itself
+            self.cache.results.put(result_key, results)
+        return self.rerank(query, results, k)
+
+    def rerank(self, query: str, results: list[dict], k: int) -> list[dict]:
+        """Results of the rerank stage from the first-stage results, the first-stage results without a reranker"""
+        if self.reranker is None:
+            return results
+        return self.reranker.rerank(query, results, k)
+
+    def search_recipes(
+        self, query: str, k: Optional[int] = None, filter: Optional[dict] = None, vector: Optional[str] = None
+    ) -> list[dict]:
+        """Distinct recipes most similar to a query.
+
+        A single search fetches overfetch chunks per requested recipe, the chunks are grouped by recipe and the top k
+        recipes by pooled score are read from the disk together. Fewer than k recipes are returned when the chunks
+        belong to fewer recipes, instead of searching again.
+
+        Args:
+            query (str): query text
+            k (Optional[int], optional): number of recipes. Defaults to None, i.e., default_k.
+            filter (Optional[dict], optional): accepted meta-data values, see search. Defaults to None.
+            vector (Optional[str], optional): name of the vector searched, see search. Defaults to None.
+
+        Returns:
+            list[dict]: dataset name, recipe id, pooled score, number of chunk hits, best chunk and full recipe
+        """
+        k = k or self.default_k
+        chunks = self.search(query, k=k * self.recipe_params["overfetch"], filter=filter, vector=vector)
+        recipes = aggregate_recipes(chunks, k, pooling=self.recipe_params["pooling"])
+        if self.recipe_reader is not None:
+            details = self.recipe_reader.read_many(
+                [(recipe["dataset_name"], recipe["recipe_id"]) for recipe in recipes]
+            )
+            for recipe, recipe_details in zip(recipes, details):
+                recipe["recipe"] = recipe_details
+        return recipes
+
+    def similar(self, dataset_name: str, recipe_id: str, k: Optional[int] = None) -> list[dict]:
+        """Recipes similar to a recipe from the precomputed graph, see SimilarRecipes.similar"""
+        self.check_version()
+        similar_recipes = self.similar_recipes
+        if similar_recipes is None:
+            raise ValueError("The similar recipes are not available, build the similar recipes graph first")
+        return similar_recipes.similar(dataset_name, recipe_id, k=k or self.default_k)
+
+    def pantry_search(self, ingredients: list[str], k: Optional[int] = None, max_missing: Optional[int] = None):
+        """Recipes that can be cooked with the ingredients of a pantry, see IngredientIndex.search"""
+        if self.pantry_watcher is not None and self.load_pantry_index is not None and self.pantry_watcher.check():
+            self.pantry_index = self.load_pantry_index()
+            LOGGER.info("Reloaded the ingredient index", version=self.pantry_watcher.version)
+        pantry_index = self.pantry_index
+        if pantry_index is None:
+            raise ValueError("The pantry search is not available, build the ingredient index first")
+        return pantry_index.search(ingredients, k=k or params["pantry"]["top_k"], max_missing=max_missing)
+
+    def metrics(self) -> dict:
+        """Number of queries served, micro-batching stats, cache hit rates and latency added by the rerank stage"""
+        metrics = {"num_queries": self.num_queries}
+        if isinstance(self.vector_store, NamedVectorStore):
+            metrics["embedding_batches"] = {name: batcher.stats.as_dict() for name, batcher in self.batchers.items()}
+        else:
+            metrics["embedding_batches"] = self.batchers[None].stats.as_dict()
+        if self.sparse_index is not None:
+            metrics["num_dense_skipped"] = self.num_dense_skipped
+        if self.cache is not None:
+            metrics["cache"] = self.cache.metrics()
+        if self.version_watcher is not None:
+            metrics["collection_version"] = self.version_watcher.version
+        if self.reranker is not None:
+            metrics["rerank"] = self.reranker.metrics()
+        return metrics
+
+    def close(self) -> None:
+        """Stop the micro-batchers and close the vector store"""
+        for batcher in self.batchers.values():
+            batcher.close()
+        self._stores.close()
+        if self.recipe_reader is not None:
+            self.recipe_reader.close()
+
+
+class RetrievalRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of the retrieval service.
+
+    - GET /health: status of the service
+    - GET /metrics: number of queries served, micro-batching stats, cache hit rates and rerank latency
+    - POST /search: {"query": str, "k": int, "filter": {key: value, [values] or {"gte": x, "lte": y}},
+        "vector": str} -> {"results": [...], "latency_ms": float}, vector names the vector of a collection with
+        named vectors
+    - POST /recipes: same request as /search -> {"recipes": [...], "latency_ms": float}, k distinct recipes
+    - POST /similar: {"dataset_name": str, "recipe_id": str, "k": int} -> {"recipes": [...], "latency_ms": float}
+    - POST /pantry: {"ingredients": [str], "k": int, "max_missing": int} -> {"recipes": [...],
+        "unknown_ingredients": [...], "latency_ms": float}
+    """
+
+    server: "RetrievalServer"
+
+    def send_json(self, status: HTTPStatus, body: dict) -> None:
+        """Send a json response"""
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_json(self) -> dict:
+        """Parse the json body of a request"""
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_REQUEST_BYTES:
+            raise ValueError(f"Request body is larger than {MAX_REQUEST_BYTES} bytes")
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a json object")
+        return body
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self.send_json(HTTPStatus.OK, {"status": "ok"})
+        elif self.path == "/metrics":
+            self.send_json(HTTPStatus.OK, self.server.service.metrics())
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path not in ("/search", "/recipes", "/similar", "/pantry"):
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            request = self.read_json()
+            k = get_int_field(request, "k", minimum=1)
+            if self.path == "/similar":
+                dataset_name, recipe_id = request.get("dataset_name"), request.get("recipe_id")
+                if not isinstance(dataset_name, str) or not isinstance(recipe_id, str):
+                    raise ValueError("dataset_name and recipe_id must be strings")
+                response = {"recipes": self.server.service.similar(dataset_name, recipe_id, k=k)}
+            elif self.path == "/pantry":
+                ingredients = request.get("ingredients")
+                if not isinstance(ingredients, list) or not all(isinstance(item, str) for item in ingredients):
+                    raise ValueError("ingredients must be a list of strings")
+                # No missing ingredient is a valid limit, the recipes cooked with the pantry alone
+                max_missing = get_int_field(request, "max_missing", minimum=0)
+                response = self.server.service.pantry_search(ingredients, k=k, max_missing=max_missing)
+            else:
+                query, vector = request.get("query"), request.get("vector")
+                if not isinstance(query, str) or len(query.strip()) == 0:
+                    raise ValueError("query must be a non-empty string")
+                if vector is not None and not isinstance(vector, str):
+                    raise ValueError("vector must be a string")
+                if self.path == "/recipes":
+                    recipes = self.server.service.search_recipes(
+                        query, k=k, filter=request.get("filter"), vector=vector
+                    )
+                    response = {"recipes": recipes}
+                else:
+                    results = self.server.service.search(query, k=k, filter=request.get("filter"), vector=vector)
+                    response = {"results": results}
+        except ValueError as error:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": f"Invalid request: {error}"})
+            return
+        except Exception:
+            LOGGER.exception("Could not process a search request")
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Could not process the search request"})
+            return
+        response["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        self.send_json(HTTPStatus.OK, response)
+
+    def log_message(self, format: str, *args) -> None:
+        # Access logs are too verbose for the structured logs
+        pass
+
+
+class RetrievalServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the retrieval service shared by the request handlers"""
+
+    daemon_threads = True
+    # Concurrent clients connecting in a burst would be reset with the default backlog of 5
+    request_queue_size = 1024
+
+    def __init__(self, address: tuple[str, int], service: RetrievalService):
+        super().__init__(address, RetrievalRequestHandler)
+        self.service = service
+
+
+def get_search_kwargs(backend: str) -> dict:
+    """Extra arguments of the vector search of a backend from params.yaml"""
+    config = params["vector_store"]
+    if backend == "local":
+        return {"ef": config["hnsw"]["ef_search"]}
+    search_params = get_qdrant_search_params(config["compression"], hnsw_ef=config["hnsw"]["ef_search"])
+    return {"search_params": search_params} if search_params is not None else {}
+
+
+@click.command()
+@click.option(
+    "--embedding_model_name",
+    default=params["embedding_model"]["model_name"],
+    show_default=True,
+    type=str,
+    help="Model tag of hugging face model to get sentence embeddings",
+)
+@click.option(
+    "--vector_names",
+    default=[vector["name"] for vector in params["embedding_model"]["vectors"]],
+    show_default=True,
+    multiple=True,
+    type=str,
+    help="Names of embedding_model.vectors in params.yaml searched in a collection with named vectors, the first one "
+    "by default, embedding_model_name is ignored. None searches the unnamed vector embedded by embedding_model_name",
+)
+@click.option(
+    "--retriver_db_name",
+    default=params["embedding_model"]["retriver_db_name"],
+    show_default=True,
+    type=str,
+    help="Collections name for the embeddings db",
+)
+@click.option(
+    "--vector_store_backend",
+    default=params["vector_store"]["backend"],
+    show_default=True,
+    type=click.Choice(["qdrant", "local"]),
+    help="qdrant searches the Qdrant server, local the embedded memory-mapped vector store",
+)
+@click.option("--host", default=params["retriever"]["host"], show_default=True, type=str, help="Host of the API")
+@click.option("--port", default=params["retriever"]["port"], show_default=True, type=int, help="Port of the API")
+@click.option(
+    "--max_batch_size",
+    default=params["retriever"]["max_batch_size"],
+    show_default=True,
+    type=int,
+    help="Maximum number of concurrent queries embedded together",
+)
+@click.option(
+    "--max_wait_ms",
+    default=params["retriever"]["max_wait_ms"],
+    show_default=True,
+    type=float,
+    help="Maximum time in milliseconds a query waits for other queries to fill its batch",
+)
+def run_service(
+    embedding_model_name: str,
+    vector_names: list[str],
+    retriver_db_name: str,
+    vector_store_backend: str,
+    host: str,
+    port: int,
+    max_batch_size: int,
+    max_wait_ms: float,
+):
+    """Entrypoint of the retrieval service.
+
+    Args:
+        embedding_model_name (str): Model tag of hugging face model to get sentence embeddings
+        vector_names (list[str]): Names of the models of embedding_model.vectors searched as named vectors
+        retriver_db_name (str): Collections name for the embeddings db
+        vector_store_backend (str): Vector db with the embeddings, qdrant or local
+        host (str): Host of the API
+        port (int): Port of the API
+        max_batch_size (int): Maximum number of concurrent queries embedded together
+        max_wait_ms (float): Maximum time in milliseconds a query waits for other queries to fill its batch
+    """
+    if len(vector_names) > 0:
+        embedding_model = get_named_embedding_models(vector_names)
+    else:
+        embedding_model = get_embedding_model(embedding_model_name)
+    hybrid_params = params["retriever"]["hybrid"]
+
+    def open_stores() -> tuple[VectorStore, Optional[BM25Index]]:
+        """Open the vector store and the BM25 index of the current version of the collection"""
+        vector_store = get_vector_store(
+            backend=vector_store_backend,
+            embeddings_model=embedding_model,
+            retriver_db_name=retriver_db_name,
+            read_only=True,
+        )
+        sparse_index = None
+        if hybrid_params["enabled"]:
+            sparse_params = params["vector_store"]["sparse_index"]
+            sparse_index = BM25Index(
+                get_sparse_index_path(retriver_db_name, vector_store_backend),
+                k1=sparse_params["k1"],
+                b=sparse_params["b"],
+            )
+            if sparse_index.num_docs == 0:
+                LOGGER.warning("The BM25 index is empty, serving dense search only", collection=retriver_db_name)
+                sparse_index = None
+        return vector_store, sparse_index
+
+    vector_store, sparse_index = open_stores()
+    cache_params = params["retriever"]["cache"]
+    cache = None
+    if cache_params["enabled"]:
+        cache = RetrieverCache(
+            embedding_cache_size=cache_params["embedding_cache_size"],
+            result_cache_size=cache_params["result_cache_size"],
+            ttl_seconds=cache_params["ttl_seconds"],
+            bucket_bits=cache_params["bucket_bits"],
+        )
+    version_watcher = CollectionVersionWatcher(
+        get_version_path(retriver_db_name, vector_store_backend), check_seconds=cache_params["version_check_seconds"]
+    )
+    load_pantry_index = functools.partial(
+        IngredientIndex.load, get_ingredient_index_path(), staples=params["pantry"]["staples"]
+    )
+    pantry_index = load_pantry_index()
+    if pantry_index is None:
+        LOGGER.warning("The ingredient index does not exist, the pantry search is disabled until it is built")
+    load_similar_recipes = functools.partial(
+        SimilarRecipes.load, get_similar_recipes_path(retriver_db_name, vector_store_backend)
+    )
+    similar_recipes = load_similar_recipes()
+    if similar_recipes is None:
+        LOGGER.warning("The similar recipes graph does not exist, the similar recipes are disabled until it is built")
+    rerank_params = params["retriever"]["rerank"]
+    reranker = None
+    if rerank_params["enabled"]:
+        reranker = CrossEncoderReranker(
+            get_cross_encoder(rerank_params["model_name"]),
+            top_n=rerank_params["top_n"],
+            max_score_gap=rerank_params["max_score_gap"],
+            batch_size=rerank_params["batch_size"],
+            cache_size=rerank_params["cache_size"],
+            ttl_seconds=rerank_params["ttl_seconds"],
+        )
+    recipe_params = params["retriever"]["recipes"]
+    recipe_reader = None
+    if os.getenv("SCRAPED_DATA_ROOT") is not None:
+        recipe_reader = RecipeReader(os.getenv("SCRAPED_DATA_ROOT"), num_workers=recipe_params["num_reader_threads"])
+    service = RetrievalService(
+        embeddings_model=embedding_model,
+        vector_store=vector_store,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        default_k=params["retriever"]["top_k"],
+        search_kwargs=get_search_kwargs(vector_store_backend),
+        cache=cache,
+        sparse_index=sparse_index,
+        hybrid_params=hybrid_params,
+        pantry_index=pantry_index,
+        recipe_reader=recipe_reader,
+        recipe_params=recipe_params,
+        reranker=reranker,
+        similar_recipes=similar_recipes,
+        version_watcher=version_watcher,
+        # The Qdrant server serves the points of the new versions through the same client
+        reopen_stores=open_stores if vector_store_backend == "local" or hybrid_params["enabled"] else None,
+        load_similar_recipes=load_similar_recipes,
+        pantry_watcher=CollectionVersionWatcher(
+            get_ingredient_index_version_path(), check_seconds=cache_params["version_check_seconds"]
+        ),
+        load_pantry_index=load_pantry_index,
+    )
+    server = RetrievalServer((host, port), service)
+    LOGGER.info("Started the retrieval service", host=host, port=port, collection=retriver_db_name)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        LOGGER.info("Stopping the retrieval service")
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    run_service()
@@ -1,24 +1,30 @@
-import json
 import os
 import re
 import time
 import uuid
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import click
 import requests
 from bs4 import BeautifulSoup
 
+from src.common.profiling import PROFILERS, start_profiling
+from src.common.recipe import Recipe
+from src.common.tracing import span, traced
 from src.common.utils import clean_string
 from src.scraper.constants import headers
+from src.scraper.failures import get_extraction_failures
 from src.scraper.utils import initialize_scraper, save_recipe_image
 
 website_tag = "archanaskitchen"
 BASE_WEBSITE_URL = "https://www.archanaskitchen.com"
 
 LOGGER, DATA_DIR_RECIPES, DATA_DIR_IMAGES = initialize_scraper(website_tag)
+FAILURES = get_extraction_failures(LOGGER, website_tag)
 
 
+@traced
 def get_recipe_links_on_single_page(x: int) -> Tuple[str, List[str]]:
     """Get links of all the recipes on a single page
 
@@ -47,16 +53,18 @@ def get_recipe_links_on_single_page(x: int) -> Tuple[str, List[str]]:
     return url, recipe_urls
 
 
+@traced
 def get_recipe_name(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Get the recipe name"""
     try:
         name = clean_string(recipe_details.find("h1", class_="recipe-title").text)
     except Exception as e:
-        LOGGER.error("Could not find recipe name", recipe_url=recipe_url)
+        FAILURES.record("name", recipe_url)
         raise e
     return name
 
 
+@traced
 def get_recipe_description(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Get the recipe description"""
     try:
@@ -66,21 +74,23 @@ def get_recipe_description(recipe_details: BeautifulSoup, recipe_url: str) -> st
                 description.append(clean_string(item.text))
 
     except Exception as e:
-        LOGGER.error("Could not find recipe description", recipe_url=recipe_url)
+        FAILURES.record("description", recipe_url)
         raise e
     return "\n".join(description[:-1])
 
 
+@traced
 def get_recipe_ingredient_list(recipe_details: BeautifulSoup, recipe_url: str) -> List[str]:
     """Get the list of ingredients"""
     try:
         ingredients = [clean_string(item.text) for item in recipe_details.find_all("span", class_="ingredient_name")]
     except Exception as e:
-        LOGGER.error("Could not find recipe ingredient list", recipe_url=recipe_url)
+        FAILURES.record("ingredient_list", recipe_url)
         raise e
     return ingredients
 
 
+@traced
 def get_recipe_cooking_steps(recipe_details: BeautifulSoup, recipe_url: str) -> Dict[str, List[str]]:
     """Get the recipe description"""
     parsed_recipe_steps = {}
@@ -99,21 +109,23 @@ def get_recipe_cooking_steps(recipe_details: BeautifulSoup, recipe_url: str) ->
             parsed_recipe_steps[key] = value
 
     except Exception as e:
-        LOGGER.info("Could not find ingredient quantities", recipe_url=recipe_url)
+        FAILURES.record("cooking_steps", recipe_url)
         raise e
     return parsed_recipe_steps
 
 
+@traced
 def get_recipe_cusine(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Get the recipe cusine"""
     try:
         cusine = clean_string(recipe_details.find("span", attrs={"itemprop": "recipeCuisine"}).text)
     except Exception:
-        LOGGER.info("Could not find recipe cusine", recipe_url=recipe_url)
+        FAILURES.record("cusine", recipe_url)
         cusine = ""
     return cusine
 
 
+@traced
 def get_recipe_diet(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Get the recipe diet, e.g., veg, vegan etc"""
     try:
@@ -121,28 +133,31 @@ def get_recipe_diet(recipe_details: BeautifulSoup, recipe_url: str) -> str:
             recipe_details.find("div", class_="col-12 diet").find("span", attrs={"itemprop": "keywords"}).text
         )
     except Exception:
-        LOGGER.info("Could not find recipe diet", recipe_url=recipe_url)
+        FAILURES.record("diet", recipe_url)
         diet = ""
     return diet
 
 
+@traced
 def get_recipe_servings(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     "Get the number of servings based on which the ingredients are marked"
     try:
         servings = clean_string(recipe_details.find("span", attrs={"itemprop": "recipeYield"}).text)
         servings = re.search(re.compile(r"\d+"), servings).group()
     except Exception:
-        LOGGER.info("Could not find number of servigs", recipe_url=recipe_url)
+        FAILURES.record("servings", recipe_url)
         servings = ""
     return servings
 
 
+@traced
 def get_recipe_cooking_difficulty(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Difficulty level in cooking"""
     difficulty = ""
     return difficulty
 
 
+@traced
 def get_recipe_cooking_time(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Total time estimate for cooking"""
     try:
@@ -151,11 +166,12 @@ def get_recipe_cooking_time(recipe_details: BeautifulSoup, recipe_url: str) -> s
         total_time = total_time.replace(" M", " minutes")
         total_time = total_time.replace(" H", " hour")
     except Exception:
-        LOGGER.info("Could not find total cooking time", recipe_url=recipe_url)
+        FAILURES.record("cooking_time", recipe_url)
         total_time = ""
     return total_time
 
 
+@traced
 def get_recipe_ingredient_quantities(recipe_details: BeautifulSoup, recipe_url: str) -> Dict[str, List[str]]:
     """Detailed quantity of ingredients"""
     parsed_ingredients = defaultdict(list)
@@ -176,10 +192,11 @@ def get_recipe_ingredient_quantities(recipe_details: BeautifulSoup, recipe_url:
             parsed_ingredients[tag].append(content)
 
     except Exception:
-        LOGGER.info("Could not find ingredient quantities", recipe_url=recipe_url)
+        FAILURES.record("ingredient_quantities", recipe_url)
     return dict(parsed_ingredients)
 
 
+@traced
 def get_image_url(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     "Url of a image showing the dish"
     try:
@@ -187,11 +204,12 @@ def get_image_url(recipe_details: BeautifulSoup, recipe_url: str) -> str:
         source_image_url = BASE_WEBSITE_URL + source_image_url
 
     except Exception:
-        LOGGER.info("Could not find image_url", recipe_url=recipe_url)
+        FAILURES.record("image_url", recipe_url)
         source_image_url = ""
     return source_image_url
 
 
+@traced
 def fetch_recipe_details(recipe_url: str, recipe_id: str) -> bool:
     """Fetch details of each recipe
 
@@ -202,10 +220,12 @@ def fetch_recipe_details(recipe_url: str, recipe_id: str) -> bool:
     Returns:
         bool, represents if the call is successful or not.
     """
-    r = requests.get(recipe_url, headers=headers)
+    with span("requests.get", url=recipe_url):
+        r = requests.get(recipe_url, headers=headers)
 
     try:
-        recipe_details = BeautifulSoup(r.content, features="lxml")
+        with span("BeautifulSoup"):
+            recipe_details = BeautifulSoup(r.content, features="lxml")
 
         # Get the recipe name
         name = get_recipe_name(recipe_details, recipe_url)
@@ -248,37 +268,57 @@ def fetch_recipe_details(recipe_url: str, recipe_id: str) -> bool:
             logger=LOGGER,
         )
 
-        # Create json blob to save the recipe data
-        recipe = {
-            "recipe_id": recipe_id,
-            "name": name,
-            "description": description,
-            "ingredients": ingredients,
-            "cusine": cusine,
-            "diet": diet,
-            "servings": servings,
-            "difficulty": difficulty,
-            "total_time": total_time,
-            "ingredient_quantity": parsed_ingredients,
-            "recipe_steps": parsed_recipe_steps,
-            "source_image_url": source_image_url,
-            "source_recipe_url": recipe_url,
-            "image_avalable": image_download_status,
-        }
-
-        with open(os.path.join(DATA_DIR_RECIPES, f"{recipe_id}.json"), "w") as outfile:
-            json.dump(recipe, outfile)
+        # Validate the recipe data and save it as a json file
+        recipe = Recipe(
+            recipe_id=recipe_id,
+            name=name,
+            description=description,
+            ingredients=ingredients,
+            cuisine=cusine,
+            diet=diet,
+            servings=servings,
+            difficulty=difficulty,
+            total_time=total_time,
+            ingredient_quantity=parsed_ingredients,
+            recipe_steps=parsed_recipe_steps,
+            source_image_url=source_image_url,
+            source_recipe_url=recipe_url,
+            image_available=image_download_status,
+        )
+
+        with span("json.dump"):
+            recipe.save(os.path.join(DATA_DIR_RECIPES, f"{recipe_id}.json"))
 
         return True
 
     except Exception:
-        LOGGER.info("Could not process a recipe url", recipe_url=recipe_url)
+        FAILURES.record("recipe", recipe_url)
 
         return False
 
 
-def run_scraper():
-    """Main function to run the scraper."""
+@click.command()
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Choice(PROFILERS),
+    help="Profile the crawl, deterministic records every call, sampling samples the stacks with a low overhead. The "
+    "results are saved under LOGS_ROOT/profiles and the hot functions printed at exit",
+)
+@click.option(
+    "--profile_memory",
+    is_flag=True,
+    default=False,
+    help="Save tracemalloc snapshots and print the lines allocating the memory held at the end of the crawl",
+)
+def run_scraper(profile: Optional[str], profile_memory: bool):
+    """Main function to run the scraper.
+
+    Args:
+        profile (Optional[str]): Profile the crawl with the deterministic or the sampling profiler
+        profile_memory (bool): Take tracemalloc snapshots at the start and the end of the crawl
+    """
+    start_profiling(website_tag, profile, memory=profile_memory)
     page_number = 1
     url, recipe_urls = get_recipe_links_on_single_page(page_number)
     total_calls = 0
@@ -0,0 +1,136 @@
+"""Aggregated logging of the fields the scrapers could not extract from the recipe pages."""
+import atexit
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import structlog
+
+from src.common.utils import load_yaml
+
+# Load all the modeling parameters
+params = load_yaml("params.yaml")
+
+
+class ExtractionFailures:
+    """Count the extraction failures of a site per field and log them as periodic summaries.
+
+    Instead of a log entry per failure, a summary with the number of failures of each field and a few example urls
+    sampled uniformly among them is logged every summary_interval_seconds. Every failure is still recorded in a
+    compact tab separated side file with a line per url listing its failed fields.
+    """
+
+    def __init__(
+        self,
+        logger: structlog.stdlib.BoundLogger,
+        website_tag: str,
+        failures_file: str,
+        summary_interval_seconds: float = 600,
+        num_examples: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            logger (structlog.stdlib.BoundLogger): logger of the scraper
+            website_tag (str): name of the scraped site
+            failures_file (str): tab separated file where the failed fields of every url are appended
+            summary_interval_seconds (float, optional): minimum time between two summaries. Defaults to 600.
+            num_examples (int, optional): number of example urls logged per field. Defaults to 3.
+            clock (Callable[[], float], optional): time source in seconds. Defaults to time.monotonic.
+        """
+        self.logger = logger
+        self.website_tag = website_tag
+        self.failures_file = failures_file
+        self.summary_interval_seconds = summary_interval_seconds
+        self.num_examples = num_examples
+        self.clock = clock
+        self.total_counts: dict[str, int] = {}
+        self.counts: dict[str, int] = {}
+        self.examples: dict[str, list[str]] = {}
+        self.last_summary = clock()
+        self.rng = random.Random(0)
+        self._url: Optional[str] = None
+        self._fields: list[str] = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(failures_file), exist_ok=True)
+        self._file = open(failures_file, "a", buffering=1 << 16)
+        atexit.register(self.close)
+
+    def record(self, field: str, recipe_url: str) -> None:
+        """Count a field which could not be extracted from a recipe page.
+
+        Args:
+            field (str): name of the field, e.g., cusine
+            recipe_url (str): url of the recipe page
+        """
+        with self._lock:
+            count = self.counts.get(field, 0) + 1
+            self.counts[field] = count
+            self.total_counts[field] = self.total_counts.get(field, 0) + 1
+            # Reservoir sampling keeps every failure of the window as an example with the same probability
+            examples = self.examples.setdefault(field, [])
+            if len(examples) < self.num_examples:
+                examples.append(recipe_url)
+            elif (idx := self.rng.randrange(count)) < self.num_examples:
+                examples[idx] = recipe_url
+            if recipe_url != self._url:
+                self._write_url()
+                self._url = recipe_url
+            self._fields.append(field)
+            due = self.clock() - self.last_summary >= self.summary_interval_seconds
+        if due:
+            self.log_summary()
+
+    def _write_url(self) -> None:
+        """Append the failed fields of the current url to the side file"""
+        if self._url is not None:
+            self._file.write(f"{self._url}\t{','.join(self._fields)}\n")
+        self._url, self._fields = None, []
+
+    def log_summary(self) -> None:
+        """Log the failures counted since the previous summary and start a new window.
+
+        The side file is flushed with the urls completed so far, the url in progress is kept until a failure of
+        another url or the close so that its fields are written on a single line.
+        """
+        with self._lock:
+            counts, examples = self.counts, self.examples
+            self.counts, self.examples = {}, {}
+            self.last_summary = self.clock()
+            self._file.flush()
+        if len(counts) == 0:
+            return
+        self.logger.info(
+            "Could not extract recipe fields",
+            site=self.website_tag,
+            failures=counts,
+            total_failures=dict(self.total_counts),
+            examples=examples,
+            failures_file=self.failures_file,
+        )
+
+    def close(self) -> None:
+        """Log the last summary and close the side file"""
+        if self._file.closed:
+            return
+        self.log_summary()
+        with self._lock:
+            self._write_url()
+            self._file.close()
+
+
+def get_extraction_failures(logger: structlog.stdlib.BoundLogger, website_tag: str) -> ExtractionFailures:
+    """Extraction failures of a scraper, recorded under LOGS_ROOT/scraper next to its logs"""
+    config = params["scraper"]["failures"]
+    failures_file = os.path.join(
+        os.getenv("LOGS_ROOT", os.path.join(os.getcwd(), "logs")), "scraper", f"{website_tag}_failures.tsv"
+    )
+    return ExtractionFailures(
+        logger,
+        website_tag,
+        failures_file,
+        summary_interval_seconds=config["summary_interval_seconds"],
+        num_examples=config["num_examples"],
+    )
@@ -1,22 +1,28 @@
-import json
 import os
 import time
 import uuid
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import click
 import requests
 from bs4 import BeautifulSoup
 
+from src.common.profiling import PROFILERS, start_profiling
+from src.common.recipe import Recipe
+from src.common.tracing import span, traced
 from src.common.utils import clean_string
 from src.scraper.constants import headers
+from src.scraper.failures import get_extraction_failures
 from src.scraper.utils import initialize_scraper, save_recipe_image
 
 website_tag = "thecocktailproject"
 BASE_WEBSITE_URL = "https://www.thecocktailproject.com"
 
 LOGGER, DATA_DIR_RECIPES, DATA_DIR_IMAGES = initialize_scraper(website_tag)
+FAILURES = get_extraction_failures(LOGGER, website_tag)
 
 
+@traced
 def get_recipe_links_on_single_page(x: int) -> Tuple[str, List[str]]:
     """Get links of all the recipes on a single page
 
@@ -45,16 +51,18 @@ def get_recipe_links_on_single_page(x: int) -> Tuple[str, List[str]]:
     return url, recipe_urls
 
 
+@traced
 def get_recipe_name(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Get the recipe name"""
     try:
         name = clean_string(recipe_details.find("h1").text)
     except Exception as e:
-        LOGGER.error("Could not find recipe name", recipe_url=recipe_url)
+        FAILURES.record("name", recipe_url)
         raise e
     return name
 
 
+@traced
 def get_recipe_description(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Get the recipe description"""
     try:
@@ -63,11 +71,12 @@ def get_recipe_description(recipe_details: BeautifulSoup, recipe_url: str) -> st
             if len(item.text) > 2:
                 description.append(clean_string(item.text))
     except Exception:
-        LOGGER.error("Could not find recipe description", recipe_url=recipe_url)
+        FAILURES.record("description", recipe_url)
         description = ""
     return "\n".join(description)
 
 
+@traced
 def get_recipe_cooking_steps(recipe_details: BeautifulSoup, recipe_url: str) -> Dict[str, List[str]]:
     """Get the recipe description"""
     parsed_recipe_steps = {}
@@ -86,11 +95,12 @@ def get_recipe_cooking_steps(recipe_details: BeautifulSoup, recipe_url: str) ->
             parsed_recipe_steps[key] = value
 
     except Exception as e:
-        LOGGER.info("Could not find ingredient quantities", recipe_url=recipe_url)
+        FAILURES.record("cooking_steps", recipe_url)
         raise e
     return parsed_recipe_steps
 
 
+@traced
 def get_recipe_ingredient_list(recipe_details: BeautifulSoup, recipe_url: str) -> List[str]:
     """Get the list of ingredients"""
     try:
@@ -100,11 +110,12 @@ def get_recipe_ingredient_list(recipe_details: BeautifulSoup, recipe_url: str) -
         ]
 
     except Exception as e:
-        LOGGER.error("Could not find recipe ingredient list", recipe_url=recipe_url)
+        FAILURES.record("ingredient_list", recipe_url)
         raise e
     return ingredients
 
 
+@traced
 def get_recipe_cooking_difficulty(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Difficulty level in cooking"""
     try:
@@ -134,11 +145,12 @@ def get_recipe_cooking_difficulty(recipe_details: BeautifulSoup, recipe_url: str
                 ][0]
 
     except Exception:
-        LOGGER.info("Could not find cooking difficulty", recipe_url=recipe_url)
+        FAILURES.record("cooking_difficulty", recipe_url)
         difficulty = ""
     return difficulty
 
 
+@traced
 def get_recipe_flavor(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     """Flavor of the recipe"""
     try:
@@ -169,11 +181,12 @@ def get_recipe_flavor(recipe_details: BeautifulSoup, recipe_url: str) -> str:
                 ][0]
 
     except Exception:
-        LOGGER.info("Could not find recipe flavor", recipe_url=recipe_url)
+        FAILURES.record("flavor", recipe_url)
         flavor = ""
     return flavor
 
 
+@traced
 def get_recipe_ingredient_quantities(recipe_details: BeautifulSoup, recipe_url: str) -> Dict[str, List[str]]:
     """Detailed quantity of ingredients"""
     parsed_ingredients = {}
@@ -201,10 +214,11 @@ def get_recipe_ingredient_quantities(recipe_details: BeautifulSoup, recipe_url:
 
         parsed_ingredients["group_0"] = ingredients_list
     except Exception:
-        LOGGER.info("Could not find ingredient quantities", recipe_url=recipe_url)
+        FAILURES.record("ingredient_quantities", recipe_url)
     return parsed_ingredients
 
 
+@traced
 def get_image_url(recipe_details: BeautifulSoup, recipe_url: str) -> str:
     "Url of a image showing the dish"
     try:
@@ -215,11 +229,12 @@ def get_image_url(recipe_details: BeautifulSoup, recipe_url: str) -> str:
         source_image_url = BASE_WEBSITE_URL + source_image_url.get("src")
 
     except Exception:
-        LOGGER.info("Could not find image_url", recipe_url=recipe_url)
+        FAILURES.record("image_url", recipe_url)
         source_image_url = ""
     return source_image_url
 
 
+@traced
 def fetch_recipe_details(recipe_url: str, recipe_id: str) -> bool:
     """Fetch details of each recipe
 
@@ -230,10 +245,12 @@ def fetch_recipe_details(recipe_url: str, recipe_id: str) -> bool:
     Returns:
         bool, represents if the call is successful or not.
     """
-    r = requests.get(recipe_url, headers=headers)
+    with span("requests.get", url=recipe_url):
+        r = requests.get(recipe_url, headers=headers)
 
     try:
-        recipe_details = BeautifulSoup(r.content, features="lxml")
+        with span("BeautifulSoup"):
+            recipe_details = BeautifulSoup(r.content, features="lxml")
 
         # Get the recipe name
         name = get_recipe_name(recipe_details, recipe_url)
@@ -277,37 +294,57 @@ def fetch_recipe_details(recipe_url: str, recipe_id: str) -> bool:
             logger=LOGGER,
         )
 
-        # Create json blob to save the recipe data
-        recipe = {
-            "recipe_id": recipe_id,
-            "name": name,
-            "description": description,
-            "ingredients": ingredients,
-            "cusine": cusine,
-            "diet": diet,
-            "servings": servings,
-            "difficulty": difficulty,
-            "total_time": total_time,
-            "ingredient_quantity": parsed_ingredients,
-            "recipe_steps": parsed_recipe_steps,
-            "source_image_url": source_image_url,
-            "source_recipe_url": recipe_url,
-            "image_avalable": image_download_status,
-        }
-
-        with open(os.path.join(DATA_DIR_RECIPES, f"{recipe_id}.json"), "w") as outfile:
-            json.dump(recipe, outfile)
+        # Validate the recipe data and save it as a json file
+        recipe = Recipe(
+            recipe_id=recipe_id,
+            name=name,
+            description=description,
+            ingredients=ingredients,
+            cuisine=cusine,
+            diet=diet,
+            servings=servings,
+            difficulty=difficulty,
+            total_time=total_time,
+            ingredient_quantity=parsed_ingredients,
+            recipe_steps=parsed_recipe_steps,
+            source_image_url=source_image_url,
+            source_recipe_url=recipe_url,
+            image_available=image_download_status,
+        )
+
+        with span("json.dump"):
+            recipe.save(os.path.join(DATA_DIR_RECIPES, f"{recipe_id}.json"))
 
         return True
 
     except Exception:
-        LOGGER.info("Could not process a recipe url", recipe_url=recipe_url)
+        FAILURES.record("recipe", recipe_url)
 
         return False
 
 
-def run_scraper():
-    """Main function to run the scraper."""
+@click.command()
+@click.option(
+    "--profile",
+    default=None,
+    type=click.Choice(PROFILERS),
+    help="Profile the crawl, deterministic records every call, sampling samples the stacks with a low overhead. The "
+    "results are saved under LOGS_ROOT/profiles and the hot functions printed at exit",
+)
+@click.option(
+    "--profile_memory",
+    is_flag=True,
+    default=False,
+    help="Save tracemalloc snapshots and print the lines allocating the memory held at the end of the crawl",
+)
+def run_scraper(profile: Optional[str], profile_memory: bool):
+    """Main function to run the scraper.
+
+    Args:
+        profile (Optional[str]): Profile the crawl with the deterministic or the sampling profiler
+        profile_memory (bool): Take tracemalloc snapshots at the start and the end of the crawl
+    """
+    start_profiling(website_tag, profile, memory=profile_memory)
     page_number = 0
     url, recipe_urls = get_recipe_links_on_single_page(page_number)
     total_calls = 0
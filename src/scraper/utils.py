@@ -5,12 +5,16 @@ import shutil
 import requests
 import structlog
 
-from src.common.logger import get_logger
+from src.common.logger import get_logger, is_enabled
+from src.common.tracing import get_run_path, start_tracing, traced
 from src.scraper.constants import headers
 
 
 def initialize_scraper(website_tag):
     logger = get_logger(logger_name=website_tag, log_file=f"scraper/{website_tag}")
+    if is_enabled("TRACE", default=False):
+        # The trace is exported when the scraper exits
+        start_tracing(get_run_path("traces", website_tag, "json"))
     data_dir = os.path.join(
         os.getenv("SCRAPED_DATA_ROOT"),
         website_tag,
@@ -23,6 +27,7 @@ def initialize_scraper(website_tag):
     return logger, data_dir_recipes, data_dir_images
 
 
+@traced
 def save_recipe_image(source_image_url: str, local_image_url: str, logger: structlog.stdlib.BoundLogger) -> bool:
     """Save the image from source url on web to a destination local url
 
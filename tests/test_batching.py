@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.retriever.batching import MicroBatcher
+
+
+def test_outputs_match_the_inputs():
+    batch_sizes = []
+
+    def square(items: list) -> list:
+        batch_sizes.append(len(items))
+        return [item * item for item in items]
+
+    batcher = MicroBatcher(square, max_batch_size=8, max_wait_ms=20)
+    with ThreadPoolExecutor(16) as executor:
+        outputs = list(executor.map(batcher, range(100)))
+    batcher.close()
+    assert outputs == [item * item for item in range(100)]
+    assert max(batch_sizes) <= 8
+    assert batcher.stats.num_items == 100
+    assert batcher.stats.num_batches == len(batch_sizes)
+
+
+def test_queued_items_share_a_batch():
+    started, release = threading.Event(), threading.Event()
+    batch_sizes = []
+
+    def identity(items: list) -> list:
+        # The first batch blocks the worker while the other items queue up
+        started.set()
+        release.wait()
+        batch_sizes.append(len(items))
+        return items
+
+    batcher = MicroBatcher(identity, max_batch_size=16, max_wait_ms=0)
+    first = batcher.submit(0)
+    started.wait()
+    futures = [batcher.submit(item) for item in range(1, 9)]
+    release.set()
+    assert [future.result() for future in [first] + futures] == list(range(9))
+    batcher.close()
+    assert batch_sizes == [1, 8]
+
+
+def test_errors_are_raised_by_every_item_of_the_batch():
+    def fail(items: list) -> list:
+        raise ValueError("batch failed")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=1)
+    futures = [batcher.submit(item) for item in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    batcher.close()
+
+
+def test_closed_batcher_rejects_items():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=4, max_wait_ms=1)
+    future = batcher.submit("last")
+    batcher.close()
+    assert future.result() == "last"
+    with pytest.raises(RuntimeError):
+        batcher.submit("late")
+    batcher.close()
@@ -0,0 +1,94 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from src.indexing.bm25 import BM25Index, BM25SegmentWriter, tokenize
+
+WORDS = ["paneer", "tikka", "masala", "saffron", "rice", "lentil", "spinach", "mango", "lassi", "cashew"]
+DIETS = ["Vegetarian", "Vegan", "Eggetarian"]
+
+
+@pytest.fixture(scope="module")
+def documents() -> list[Document]:
+    rng = np.random.default_rng(0)
+    return [
+        Document(
+            page_content=" ".join(rng.choice(WORDS, rng.integers(3, 12))),
+            metadata={"dataset_name": f"dataset_{idx % 2}", "recipe_id": str(idx), "diet": DIETS[idx % 3]},
+        )
+        for idx in range(300)
+    ]
+
+
+@pytest.fixture(scope="module")
+def index_dir(tmp_path_factory, documents) -> str:
+    directory = str(tmp_path_factory.mktemp("bm25"))
+    # One segment per dataset, the scores use the statistics of both
+    for dataset_name in ["dataset_0", "dataset_1"]:
+        writer = BM25SegmentWriter(os.path.join(directory, dataset_name))
+        dataset_documents = [document for document in documents if document.metadata["dataset_name"] == dataset_name]
+        writer.add_documents(dataset_documents[:50])
+        writer.add_documents(dataset_documents[50:])
+        writer.close()
+    return directory
+
+
+def brute_force_scores(documents: list[Document], query: str, k1: float = 1.2, b: float = 0.75) -> dict:
+    tokens = [tokenize(document.page_content) for document in documents]
+    avg_length = np.mean([len(doc_tokens) for doc_tokens in tokens])
+    scores = {}
+    for document, doc_tokens in zip(documents, tokens):
+        counts = Counter(doc_tokens)
+        score = 0.0
+        for term in dict.fromkeys(tokenize(query)):
+            doc_freq = sum(term in other for other in tokens)
+            idf = np.log(1 + (len(documents) - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = k1 * (1 - b + b * len(doc_tokens) / avg_length)
+            score += idf * counts[term] * (k1 + 1) / (counts[term] + norm)
+        if score > 0:
+            scores[document.metadata["recipe_id"]] = score
+    return scores
+
+
+@pytest.mark.parametrize("query", ["saffron", "paneer tikka", "mango lassi with cashew"])
+def test_scores_against_brute_force(index_dir, documents, query):
+    index = BM25Index(index_dir)
+    expected = brute_force_scores(documents, query)
+    results = index.search(query, k=10)
+    assert len(results) == 10
+    for document, score, _ in results:
+        assert score == pytest.approx(expected[document.metadata["recipe_id"]], rel=1e-4)
+    assert results[-1][1] >= sorted(expected.values(), reverse=True)[9] - 1e-4
+    index.close()
+
+
+def test_coverage_counts_the_query_terms(index_dir):
+    index = BM25Index(index_dir)
+    for document, _, coverage in index.search("paneer saffron", k=20):
+        terms = set(tokenize(document.page_content))
+        assert coverage == (("paneer" in terms) + ("saffron" in terms)) / 2
+    index.close()
+
+
+@pytest.mark.parametrize(
+    "filter", [{"diet": "Vegan"}, {"diet": ["Vegan", "Eggetarian"]}, {"dataset_name": "dataset_1"}]
+)
+def test_filtered_search(index_dir, filter):
+    index = BM25Index(index_dir)
+    results = index.search("saffron rice", k=10, filter=filter)
+    assert len(results) == 10
+    for document, _, _ in results:
+        for field, condition in filter.items():
+            assert document.metadata[field] in (condition if isinstance(condition, list) else [condition])
+    index.close()
+
+
+def test_unknown_terms_and_empty_index(tmp_path, index_dir):
+    index = BM25Index(index_dir)
+    assert index.search("the and of", k=5) == []
+    assert index.search("chocolate", k=5) == []
+    index.close()
+    assert BM25Index(str(tmp_path)).search("saffron", k=5) == []
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from src.retriever.cache import MISSING, EmbeddingBucketer, RetrieverCache, TTLCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl_seconds=5, clock=clock)
+    cache.put("key", None)
+    clock.now = 4.9
+    assert cache.get("key") is None
+    clock.now = 5.0
+    assert cache.get("key") is MISSING
+    assert len(cache) == 0
+    assert cache.stats.as_dict() == {
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+        "evictions": 0,
+        "expirations": 1,
+        "invalidations": 0,
+    }
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats.evictions == 1
+
+
+def test_clear_and_disabled_cache():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.clear()
+    assert cache.get("a") is MISSING
+    assert cache.stats.invalidations == 1
+    disabled = TTLCache(max_size=0, ttl_seconds=60)
+    disabled.put("a", 1)
+    assert len(disabled) == 0
+
+
+def test_normalize_query():
+    assert normalize_query("  Paneer\tTikka  Masala ") == "paneer tikka masala"
+
+
+def test_bucketer_groups_close_embeddings():
+    rng = np.random.default_rng(0)
+    embedding = rng.standard_normal(64)
+    bucketer = EmbeddingBucketer(64, num_bits=16)
+    assert bucketer(embedding) == bucketer(embedding * 2)
+    assert bucketer(embedding) != bucketer(-embedding)
+
+
+def test_result_keys_depend_on_the_version_and_the_query():
+    cache = RetrieverCache(embedding_cache_size=10, result_cache_size=10, ttl_seconds=60, bucket_bits=16)
+    embedding = np.random.default_rng(0).standard_normal(32).tolist()
+    key = cache.get_result_key(embedding, {"diet": "Vegan"}, 4, version="1")
+    assert key == cache.get_result_key(embedding, {"diet": "Vegan"}, 4, version="1")
+    assert key != cache.get_result_key(embedding, {"diet": "Vegan"}, 4, version="2")
+    assert key != cache.get_result_key(embedding, None, 4, version="1")
+    keyword_key = cache.get_keyword_result_key("Paneer  tikka", None, 4, version="1")
+    assert keyword_key == cache.get_keyword_result_key("paneer tikka", None, 4, version="1")
+    assert keyword_key != cache.get_keyword_result_key("paneer tikka", None, 4, version="2")
+
+
+def test_retriever_cache_clear():
+    cache = RetrieverCache(embedding_cache_size=10, result_cache_size=10, ttl_seconds=60, bucket_bits=16)
+    cache.put_embedding("Paneer Tikka", [1.0, 0.0])
+    assert cache.get_embedding("paneer tikka") == [1.0, 0.0]
+    assert cache.get_embedding("paneer tikka", vector_name="other") is MISSING
+    cache.results.put("key", ["result"])
+    cache.clear()
+    assert cache.get_embedding("paneer tikka") is MISSING
+    assert cache.results.get("key") is MISSING
+    assert cache.metrics()["result_cache"]["invalidations"] == 1
+
+
+@pytest.mark.parametrize("max_size", [1, 3])
+def test_size_never_exceeds_max_size(max_size):
+    cache = TTLCache(max_size=max_size, ttl_seconds=60)
+    for idx in range(10):
+        cache.put(idx, idx)
+    assert len(cache) == max_size
+    assert cache.stats.evictions == 10 - max_size
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+import src.indexer as indexer
+from src.benchmarks.utils import write_synthetic_dataset
+from src.indexing.bm25 import BM25Index
+from src.indexing.checkpoint import IndexingCheckpoint, get_point_ids
+from src.indexing.local_vector_store import LocalVectorStore
+
+NUM_RECIPES = 230
+
+
+@pytest.fixture
+def scraped_data_root(tmp_path, monkeypatch) -> str:
+    directory = str(tmp_path / "scraped")
+    write_synthetic_dataset(os.path.join(directory, "synthetic", "recipes"), NUM_RECIPES)
+    monkeypatch.setenv("SCRAPED_DATA_ROOT", directory)
+    # Small batches so that an interruption leaves files to resume from
+    monkeypatch.setattr(indexer, "DOC_CHUNK_SIZE", 50)
+    return directory
+
+
+def make_store(path: str) -> LocalVectorStore:
+    return LocalVectorStore(path, "recipes", embeddings=DeterministicFakeEmbedding(size=8), read_only=False)
+
+
+def get_points(vector_store: LocalVectorStore) -> dict:
+    points = {}
+    for row in range(vector_store.count):
+        payload = vector_store.read_payload(row)
+        points[payload["id"]] = (payload["page_content"], payload["metadata"]["recipe_id"])
+    return points
+
+
+def test_point_ids_are_deterministic():
+    documents = [
+        Document(page_content=text, metadata={"dataset_name": "dataset", "recipe_id": recipe_id})
+        for text, recipe_id in [("a", "1"), ("b", "1"), ("a", "2")]
+    ]
+    point_ids = get_point_ids(documents)
+    assert point_ids == get_point_ids(documents)
+    assert len(set(point_ids)) == 3
+    assert get_point_ids(documents[2:]) == point_ids[2:]
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint" / "checkpoint.json")
+    checkpoint = IndexingCheckpoint.load(path)
+    assert checkpoint.get_file_offset("synthetic") == 0
+    assert checkpoint.write_manifest("synthetic", (f"{idx}.json" for idx in range(3))) == 3
+    checkpoint.commit_batch("synthetic", file_offset=2, point_ids=["a", "b"])
+
+    checkpoint = IndexingCheckpoint.load(path)
+    assert (checkpoint.get_file_offset("synthetic"), checkpoint.get_file_offset("other")) == (2, 0)
+    assert (checkpoint.last_point_id, checkpoint.num_points) == ("b", 2)
+    assert list(checkpoint.iter_manifest("synthetic")) == ["0.json", "1.json", "2.json"]
+
+    checkpoint.complete_dataset("synthetic")
+    checkpoint = IndexingCheckpoint.load(path)
+    assert checkpoint.is_completed("synthetic")
+    assert not checkpoint.has_manifest("synthetic")
+    checkpoint.clear()
+    assert not os.path.exists(path)
+
+
+def test_resumed_run_matches_an_uninterrupted_run(tmp_path, scraped_data_root, monkeypatch):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=0)
+    full_store = make_store(str(tmp_path / "full"))
+    full_checkpoint = IndexingCheckpoint.load(str(tmp_path / "full_checkpoint" / "checkpoint.json"))
+    indexer.load_dataset(
+        "synthetic", full_store, splitter, checkpoint=full_checkpoint, sparse_index_dir=str(tmp_path / "full_bm25")
+    )
+
+    load_documents_to_db = indexer.load_documents_to_db
+    num_calls = 0
+
+    def interrupt(**kwargs):
+        nonlocal num_calls
+        num_calls += 1
+        if num_calls == 3:
+            raise KeyboardInterrupt
+        return load_documents_to_db(**kwargs)
+
+    checkpoint_path = str(tmp_path / "checkpoint" / "checkpoint.json")
+    store = make_store(str(tmp_path / "resumed"))
+    monkeypatch.setattr(indexer, "load_documents_to_db", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        indexer.load_dataset("synthetic", store, splitter, checkpoint=IndexingCheckpoint.load(checkpoint_path))
+    monkeypatch.setattr(indexer, "load_documents_to_db", load_documents_to_db)
+    store.close()
+
+    checkpoint = IndexingCheckpoint.load(checkpoint_path)
+    assert checkpoint.get_file_offset("synthetic") == 100
+    assert checkpoint.has_manifest("synthetic")
+    store = make_store(str(tmp_path / "resumed"))
+    indexer.load_dataset("synthetic", store, splitter, checkpoint=checkpoint, sparse_index_dir=str(tmp_path / "bm25"))
+
+    assert checkpoint.is_completed("synthetic")
+    assert not checkpoint.has_manifest("synthetic")
+    assert store.count == full_store.count
+    assert get_points(store) == get_points(full_store)
+    assert BM25Index(str(tmp_path / "bm25")).num_docs == BM25Index(str(tmp_path / "full_bm25")).num_docs
+
+    # A completed dataset is skipped by the next run
+    indexer.load_dataset("synthetic", store, splitter, checkpoint=checkpoint)
+    assert store.count == full_store.count
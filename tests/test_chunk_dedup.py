@@ -0,0 +1,46 @@
+import numpy as np
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from src.indexing.chunk_dedup import DeduplicatingEmbeddings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    num_texts: int = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.num_texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_duplicate_texts_are_embedded_once():
+    model = CountingEmbeddings(size=8)
+    embeddings = DeduplicatingEmbeddings(model, max_cached_texts=10)
+    texts = ["Add salt to taste.", "Serve hot.", "Add salt to taste."]
+    vectors = embeddings.embed_documents(texts)
+    # Vectors are cached as float32
+    assert np.allclose(vectors, model.embed_documents(texts), atol=1e-6)
+    assert vectors[0] == vectors[2]
+    assert model.num_texts == 2 + 3
+    assert (embeddings.stats.num_texts, embeddings.stats.num_embedded) == (3, 2)
+
+
+def test_cache_across_calls_is_bounded():
+    model = CountingEmbeddings(size=8)
+    embeddings = DeduplicatingEmbeddings(model, max_cached_texts=2)
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a", "c"])
+    assert model.num_texts == 3
+    # "b" was the least recently used text
+    embeddings.embed_documents(["b"])
+    assert model.num_texts == 4
+    assert len(embeddings.cache) == 2
+    stats = embeddings.reset_stats()
+    assert (stats.num_texts, stats.num_embedded) == (5, 4)
+    assert embeddings.stats.num_texts == 0
+
+
+def test_queries_are_not_deduplicated():
+    model = CountingEmbeddings(size=8)
+    embeddings = DeduplicatingEmbeddings(model, max_cached_texts=2)
+    assert embeddings.embed_query("paneer") == model.embed_query("paneer")
+    assert embeddings.stats.num_texts == 0
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from src.indexing.compression import VectorCodec, normalize, truncate
+
+
+@pytest.fixture
+def vectors() -> np.ndarray:
+    return normalize(np.random.default_rng(0).standard_normal((100, 64)).astype(np.float32))
+
+
+def test_normalize_gives_unit_vectors(vectors):
+    assert np.allclose(np.linalg.norm(normalize(vectors * 3), axis=1), 1.0, atol=1e-5)
+
+
+def test_truncate_renormalizes_the_leading_dimensions(vectors):
+    truncated = truncate(vectors, 16)
+    assert truncated.shape == (100, 16)
+    assert np.allclose(np.linalg.norm(truncated, axis=1), 1.0, atol=1e-5)
+    assert truncate(vectors, None) is vectors
+
+
+@pytest.mark.parametrize("dtype, max_error", [("float32", 0.0), ("float16", 1e-3), ("int8", 1e-2)])
+def test_round_trip(vectors, dtype, max_error):
+    codec = VectorCodec(dtype)
+    codes, scales = codec.encode(vectors)
+    assert (scales is not None) == codec.has_scales
+    assert np.abs(codec.decode(codes, scales) - vectors).max() <= max_error
+
+
+@pytest.mark.parametrize("dtype, nbytes", [("float32", 256), ("float16", 128), ("int8", 68)])
+def test_bytes_per_vector(dtype, nbytes):
+    assert VectorCodec(dtype).bytes_per_vector(64) == nbytes
+
+
+def test_int8_keeps_the_ranking(vectors):
+    codec = VectorCodec("int8")
+    decoded = codec.decode(*codec.encode(vectors))
+    query = vectors[0]
+    assert np.array_equal(np.argsort(-(vectors @ query))[:10], np.argsort(-(decoded @ query))[:10])
+
+
+def test_unsupported_dtype():
+    with pytest.raises(ValueError):
+        VectorCodec("int4")
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from src.indexing.hnsw import HNSWGraph, HnswlibGraph, hnswlib, open_graph
+
+NUM_VECTORS = 600
+DIM = 16
+K = 10
+
+
+@pytest.fixture(scope="module")
+def vectors() -> np.ndarray:
+    vectors = np.random.default_rng(0).standard_normal((NUM_VECTORS, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_graph(graph_class, directory: str, vectors: np.ndarray):
+    graph = graph_class(str(directory), get_vectors=lambda nodes: vectors[nodes], m=8, ef_construct=64, read_only=False)
+    graph.insert_batch(np.arange(len(vectors)))
+    graph.flush()
+    return graph_class(str(directory), get_vectors=lambda nodes: vectors[nodes], read_only=True)
+
+
+def recall(graph, vectors: np.ndarray, allowed=None) -> float:
+    queries = vectors[:50]
+    scores = queries @ vectors.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    found = 0
+    for query, row in zip(queries, scores):
+        expected = set(np.argsort(-row)[:K].tolist())
+        found += len(expected & {node for _, node in graph.search(query, K, ef=64, allowed=allowed)})
+    return found / (K * len(queries))
+
+
+@pytest.mark.parametrize(
+    "graph_class",
+    [
+        HNSWGraph,
+        pytest.param(HnswlibGraph, marks=pytest.mark.skipif(hnswlib is None, reason="hnswlib is not installed")),
+    ],
+)
+def test_recall_against_brute_force(tmp_path, vectors, graph_class):
+    graph = build_graph(graph_class, tmp_path, vectors)
+    assert graph.count == NUM_VECTORS
+    assert recall(graph, vectors) >= 0.95
+
+
+@pytest.mark.parametrize(
+    "graph_class",
+    [
+        HNSWGraph,
+        pytest.param(HnswlibGraph, marks=pytest.mark.skipif(hnswlib is None, reason="hnswlib is not installed")),
+    ],
+)
+def test_filtered_search_returns_allowed_nodes(tmp_path, vectors, graph_class):
+    graph = build_graph(graph_class, tmp_path, vectors)
+    allowed = np.arange(NUM_VECTORS) % 5 == 0
+    for query in vectors[:20]:
+        results = graph.search(query, K, ef=64, allowed=allowed)
+        assert len(results) == K
+        assert all(allowed[node] for _, node in results)
+    assert recall(graph, vectors, allowed) >= 0.9
+
+
+def test_search_results_sorted_by_similarity(tmp_path, vectors):
+    graph = build_graph(HNSWGraph, tmp_path, vectors)
+    similarities = [similarity for similarity, _ in graph.search(vectors[0], K, ef=64)]
+    assert similarities == sorted(similarities, reverse=True)
+    assert similarities[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_empty_graph_has_no_results(tmp_path, vectors):
+    graph = HNSWGraph(str(tmp_path), get_vectors=lambda nodes: vectors[nodes], read_only=False)
+    assert graph.search(vectors[0], K, ef=64) == []
+
+
+def test_open_graph_keeps_the_backend_of_a_saved_graph(tmp_path, vectors):
+    build_graph(HNSWGraph, tmp_path, vectors)
+    graph = open_graph(str(tmp_path), get_vectors=lambda nodes: vectors[nodes])
+    assert isinstance(graph, HNSWGraph)
+    assert graph.count == NUM_VECTORS
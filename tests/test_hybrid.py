@@ -0,0 +1,35 @@
+import pytest
+from langchain.schema import Document
+
+from src.retriever.hybrid import is_keyword_match, reciprocal_rank_fusion
+
+
+def make_document(recipe_id: str) -> Document:
+    return Document(page_content=f"chunk of {recipe_id}", metadata={"dataset_name": "dataset", "recipe_id": recipe_id})
+
+
+def test_reciprocal_rank_fusion_sums_the_ranks():
+    dense = [make_document(recipe_id) for recipe_id in ["a", "b", "c"]]
+    sparse = [make_document(recipe_id) for recipe_id in ["c", "a", "d"]]
+    fused = reciprocal_rank_fusion([dense, sparse], rrf_k=60, k=4)
+    assert [document.metadata["recipe_id"] for document, _ in fused] == ["a", "c", "b", "d"]
+    scores = dict((document.metadata["recipe_id"], score) for document, score in fused)
+    assert scores["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores["d"] == pytest.approx(1 / 63)
+
+
+def test_reciprocal_rank_fusion_keeps_k_results():
+    ranked_list = [make_document(str(idx)) for idx in range(10)]
+    assert len(reciprocal_rank_fusion([ranked_list, ranked_list[::-1]], k=3)) == 3
+    assert reciprocal_rank_fusion([[], []], k=3) == []
+
+
+def test_is_keyword_match():
+    results = [(make_document(str(idx)), 1.0, 1.0) for idx in range(4)]
+    assert is_keyword_match(results, num_terms=2, k=4, max_terms=3)
+    # Too many terms, too few results or a result missing a term
+    assert not is_keyword_match(results, num_terms=4, k=4, max_terms=3)
+    assert not is_keyword_match(results[:3], num_terms=2, k=4, max_terms=3)
+    assert not is_keyword_match(results[:3] + [(make_document("3"), 1.0, 0.5)], num_terms=2, k=4, max_terms=3)
+    assert not is_keyword_match([], num_terms=0, k=0, max_terms=3)
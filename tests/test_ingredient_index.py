@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.benchmarks.utils import SYNTHETIC_INGREDIENTS, make_synthetic_recipe
+from src.indexing.ingredient_index import IngredientIndex, build_ingredient_index, normalize_ingredient
+
+NUM_RECIPES = 517
+
+
+@pytest.fixture(scope="module")
+def recipes() -> list[tuple[str, dict]]:
+    rng = np.random.default_rng(0)
+    return [("synthetic", make_synthetic_recipe(f"recipe_{idx}", rng)) for idx in range(NUM_RECIPES)]
+
+
+@pytest.fixture(scope="module")
+def index_dir(tmp_path_factory, recipes) -> str:
+    directory = str(tmp_path_factory.mktemp("pantry"))
+    assert build_ingredient_index(iter(recipes), directory) == NUM_RECIPES
+    return directory
+
+
+def brute_force(recipes: list[tuple[str, dict]], pantry: set[str], max_missing: int) -> dict:
+    """(missing, matched) of the recipes using at least one pantry ingredient"""
+    counts = {}
+    for _, recipe in recipes:
+        ingredients = {normalize_ingredient(name) for name in recipe["ingredients"]} - {""}
+        matched = len(ingredients & pantry)
+        if matched > 0 and len(ingredients) - matched <= max_missing:
+            counts[recipe["recipe_id"]] = (len(ingredients) - matched, matched)
+    return counts
+
+
+@pytest.mark.parametrize(
+    "ingredients, max_missing",
+    [(["Onion"], None), (SYNTHETIC_INGREDIENTS[:5], None), (SYNTHETIC_INGREDIENTS[:12], 3), (SYNTHETIC_INGREDIENTS, 0)],
+)
+def test_search_against_brute_force(index_dir, recipes, ingredients, max_missing):
+    index = IngredientIndex(index_dir)
+    pantry = {normalize_ingredient(name) for name in ingredients}
+    expected = brute_force(recipes, pantry, max_missing if max_missing is not None else 1000)
+    results = index.search(ingredients, k=20, max_missing=max_missing)["recipes"]
+    assert len(results) == min(20, len(expected))
+    assert [(result["missing"], result["matched"]) for result in results] == sorted(
+        expected.values(), key=lambda counts: (counts[0], -counts[1])
+    )[:20]
+    for result in results:
+        assert expected[result["recipe_id"]] == (result["missing"], result["matched"])
+        assert len(result["missing_ingredients"]) == result["missing"]
+        assert not pantry & set(result["missing_ingredients"])
+
+
+def test_staples_count_as_pantry_ingredients(index_dir, recipes):
+    staple = normalize_ingredient(recipes[0][1]["ingredients"][0])
+    without_staples = IngredientIndex(index_dir).search(["not an ingredient"], k=5)
+    assert without_staples == {"recipes": [], "unknown_ingredients": ["not an ingredient"]}
+    with_staples = IngredientIndex(index_dir, staples=[staple]).search(["not an ingredient"], k=5)
+    assert len(with_staples["recipes"]) == 5
+    assert all(result["matched"] == 1 for result in with_staples["recipes"])
+
+
+def test_normalize_ingredient():
+    assert normalize_ingredient("Tomatoes (finely chopped)") == "tomato"
+    assert normalize_ingredient("Ghee or Oil") == "ghee"
+    assert normalize_ingredient("2 cups Basmati Rice") == "basmati rice"
+    assert normalize_ingredient("Salt to taste") == "salt"
+    assert normalize_ingredient("Hummus") == "hummus"
+
+
+def test_missing_index(tmp_path):
+    assert IngredientIndex.load(str(tmp_path)) is None
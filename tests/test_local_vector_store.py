@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from src.indexing.local_vector_store import LocalVectorStore
+
+NUM_VECTORS = 1000
+DIM = 32
+K = 10
+
+
+@pytest.fixture(scope="module")
+def vectors() -> np.ndarray:
+    # Decaying variances keep most of the similarity in the leading dimensions, as truncation expects
+    scales = np.exp(-np.arange(DIM) / 8)
+    vectors = (np.random.default_rng(0).standard_normal((NUM_VECTORS, DIM)) * scales).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def get_payload(row: int) -> dict:
+    return {
+        "page_content": f"chunk {row}",
+        "metadata": {"diet": "veg" if row % 3 == 0 else "non-veg", "time": row % 100},
+    }
+
+
+def build_store(path: str, vectors: np.ndarray, **kwargs) -> LocalVectorStore:
+    store = LocalVectorStore(
+        str(path), "recipes", read_only=False, payload_indexes=["diet"], range_indexes=["time"], **kwargs
+    )
+    for start in range(0, len(vectors), 256):
+        end = min(start + 256, len(vectors))
+        rows = range(start, end)
+        store.add_vectors(vectors[start:end], [get_payload(row) for row in rows], [str(row) for row in rows])
+    store.close()
+    return LocalVectorStore(str(path), "recipes")
+
+
+def recall(store: LocalVectorStore, vectors: np.ndarray, filter=None, mask=None) -> float:
+    found = 0
+    for query in vectors[:30]:
+        scores = vectors @ query
+        if mask is not None:
+            scores[~mask] = -np.inf
+        expected = set(np.argsort(-scores)[:K].tolist())
+        found += len(expected & {int(point_id) for point_id, _, _ in store.search_by_vector(query, K, filter=filter)})
+    return found / (K * 30)
+
+
+@pytest.mark.parametrize("dtype, truncate_dim", [("float32", None), ("float16", None), ("int8", None), ("float32", 16)])
+def test_recall_against_brute_force(tmp_path, vectors, dtype, truncate_dim):
+    store = build_store(tmp_path, vectors, dtype=dtype, truncate_dim=truncate_dim)
+    assert store.count == NUM_VECTORS
+    assert recall(store, vectors) >= 0.9
+
+
+def test_filtered_search(tmp_path, vectors):
+    store = build_store(tmp_path, vectors)
+    filter = {"diet": "veg", "time": {"lte": 50}}
+    mask = np.asarray([row % 3 == 0 and row % 100 <= 50 for row in range(NUM_VECTORS)])
+    for query in vectors[:10]:
+        results = store.search_by_vector(query, K, filter=filter)
+        assert len(results) == K
+        assert all(payload["metadata"]["diet"] == "veg" for _, payload, _ in results)
+        assert all(payload["metadata"]["time"] <= 50 for _, payload, _ in results)
+    assert recall(store, vectors, filter, mask) >= 0.9
+
+
+def test_add_vectors_replaces_existing_ids(tmp_path, vectors):
+    store = build_store(tmp_path, vectors)
+    store.close()
+    store = LocalVectorStore(str(tmp_path), "recipes", read_only=False)
+    store.add_vectors(vectors[:1], [{"page_content": "updated", "metadata": {"diet": "vegan", "time": 5}}], ["1"])
+    assert store.count == NUM_VECTORS
+    (point_id, payload, score), *_ = store.search_by_vector(vectors[0], 1, filter={"diet": "vegan"})
+    assert (point_id, payload["page_content"]) == ("1", "updated")
+    assert score == pytest.approx(1.0, abs=1e-3)
+    assert store.search_by_vector(vectors[0], 1, filter={"diet": "veg"})[0][0] != "1"
+    store.close()
+
+
+def test_reopening_keeps_the_points(tmp_path, vectors):
+    store = build_store(tmp_path, vectors)
+    point_id, payload, score = store.search_by_vector(vectors[7], 1)[0]
+    assert (point_id, payload["page_content"]) == ("7", "chunk 7")
+    assert score == pytest.approx(1.0, abs=1e-3)
+
+
+def test_missing_collection_in_read_only_mode(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LocalVectorStore(str(tmp_path), "missing")
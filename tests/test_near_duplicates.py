@@ -0,0 +1,69 @@
+import copy
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from src.benchmarks.utils import make_synthetic_recipe
+from src.indexing.near_duplicates import MinHasher, NearDuplicates, build_near_duplicates, find_clusters, get_shingles
+
+
+@pytest.fixture(scope="module")
+def recipes() -> list[tuple[str, dict]]:
+    rng = np.random.default_rng(0)
+    return [("original", make_synthetic_recipe(f"recipe_{idx}", rng)) for idx in range(500)]
+
+
+def make_near_duplicate(recipe: dict) -> dict:
+    """Copy of a recipe re-published with a slightly different name and one ingredient less"""
+    duplicate = copy.deepcopy(recipe)
+    duplicate["recipe_id"] = f"copy_of_{recipe['recipe_id']}"
+    duplicate["name"] = f"{recipe['name']} Recipe"
+    if len(duplicate["ingredients"]) > 8:
+        duplicate["ingredients"] = duplicate["ingredients"][:-1]
+    return duplicate
+
+
+def test_signatures_estimate_the_jaccard_similarity():
+    first, second = set(range(0, 300)), set(range(100, 400))
+    signatures = MinHasher(num_perm=512).signatures([first, second, set()])
+    assert np.mean(signatures[0] == signatures[1]) == pytest.approx(0.5, abs=0.08)
+    assert np.array_equal(signatures, MinHasher(num_perm=512).signatures([first, second, set()]))
+    # An empty set never matches another set
+    assert find_clusters(MinHasher(num_perm=16).signatures([set(), set()]), bands=4, threshold=0.5) == []
+
+
+def test_clusters_of_known_near_duplicates(recipes):
+    duplicated = list(range(0, 500, 10))
+    duplicates = [("copies", make_near_duplicate(recipes[idx][1])) for idx in duplicated]
+    clusters = build_near_duplicates(recipes + duplicates, num_perm=128, bands=32, threshold=0.6)
+    assert clusters["num_recipes"] == 550
+    near_duplicates = NearDuplicates(clusters["clusters"])
+    for idx in duplicated:
+        recipe_id = recipes[idx][1]["recipe_id"]
+        # The earlier recipe is the canonical one
+        assert near_duplicates.get_canonical("copies", f"copy_of_{recipe_id}") == ("original", recipe_id)
+        assert near_duplicates.get_canonical("original", recipe_id) is None
+    assert len(near_duplicates.canonical) <= len(duplicated) + 5
+
+
+def test_distinct_recipes_are_not_clustered(recipes):
+    assert all(len(get_shingles(recipe)) > 0 for _, recipe in recipes)
+    clusters = build_near_duplicates(recipes[:100], num_perm=128, bands=16, threshold=0.9)
+    assert clusters == {"num_recipes": 100, "clusters": []}
+    assert build_near_duplicates([], num_perm=128, bands=16, threshold=0.9) == {"num_recipes": 0, "clusters": []}
+
+
+def test_filter_documents():
+    near_duplicates = NearDuplicates([[["original", "1"], ["copies", "2"], ["copies", "3"]]])
+    documents = [
+        Document(page_content="chunk", metadata={"dataset_name": dataset_name, "recipe_id": recipe_id})
+        for dataset_name, recipe_id in [("original", "1"), ("copies", "2"), ("copies", "4")]
+    ]
+    kept = near_duplicates.filter_documents(documents)
+    assert [document.metadata["recipe_id"] for document in kept] == ["1", "4"]
+
+
+def test_bands_must_divide_the_signature_length():
+    with pytest.raises(ValueError):
+        find_clusters(np.zeros((2, 128), dtype=np.uint32), bands=3, threshold=0.5)
@@ -0,0 +1,87 @@
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from src.indexing.collection_version import CollectionVersionWatcher, bump_collection_version
+from src.indexing.local_vector_store import LocalVectorStore
+from src.retriever.cache import MISSING, RetrieverCache
+from src.retriever.service import RetrievalService
+
+TEXTS = ["paneer tikka masala", "saffron rice", "mango lassi", "spinach dal", "cashew curry"]
+
+
+@pytest.fixture
+def collection_path(tmp_path) -> str:
+    vector_store = LocalVectorStore(
+        str(tmp_path), "recipes", embeddings=DeterministicFakeEmbedding(size=8), read_only=False
+    )
+    vector_store.add_texts(TEXTS, [{"dataset_name": "d", "recipe_id": str(idx)} for idx in range(len(TEXTS))])
+    vector_store.close()
+    return str(tmp_path)
+
+
+@pytest.fixture
+def version_path(tmp_path) -> str:
+    path = str(tmp_path / "versions" / "recipes.json")
+    bump_collection_version(path)
+    return path
+
+
+def open_store(collection_path: str) -> LocalVectorStore:
+    return LocalVectorStore(collection_path, "recipes", embeddings=DeterministicFakeEmbedding(size=8))
+
+
+def make_service(collection_path: str, version_path: str, cache=None) -> RetrievalService:
+    return RetrievalService(
+        DeterministicFakeEmbedding(size=8),
+        open_store(collection_path),
+        max_batch_size=4,
+        max_wait_ms=1,
+        default_k=2,
+        cache=cache,
+        version_watcher=CollectionVersionWatcher(version_path, check_seconds=0),
+        reopen_stores=lambda: (open_store(collection_path), None),
+    )
+
+
+def is_closed(vector_store: LocalVectorStore) -> bool:
+    return vector_store._payload_reader is None
+
+
+def test_replaced_stores_are_closed_by_the_last_request(collection_path, version_path):
+    service = make_service(collection_path, version_path)
+    held = service.acquire_stores()
+    bump_collection_version(version_path)
+    assert len(service.search("saffron rice")) == 2
+    # A request still running on the previous version keeps its stores open
+    assert service.vector_store is not held.vector_store
+    assert held.retired and not is_closed(held.vector_store)
+    assert len(held.vector_store.search_by_vector(DeterministicFakeEmbedding(size=8).embed_query("rice"), 1)) == 1
+    service.release_stores(held)
+    assert is_closed(held.vector_store)
+
+    # Stores without running requests are closed when they are replaced
+    previous = service.vector_store
+    bump_collection_version(version_path)
+    service.search("mango lassi")
+    assert is_closed(previous)
+    service.close()
+
+
+def test_cached_results_are_keyed_by_the_version(collection_path, version_path):
+    cache = RetrieverCache(embedding_cache_size=10, result_cache_size=10, ttl_seconds=60, bucket_bits=16)
+    service = make_service(collection_path, version_path, cache)
+    results = service.search("saffron rice")
+    assert service.search("Saffron  Rice") == results
+    assert cache.results.stats.hits == 1
+
+    # A new version drops the cache and the results of the previous version are never served
+    held = service.acquire_stores()
+    bump_collection_version(version_path)
+    service.search("saffron rice")
+    assert cache.results.stats.invalidations == 1
+    assert cache.results.stats.hits == 1
+    embedding = cache.get_embedding("saffron rice")
+    assert cache.results.get(cache.get_result_key(embedding, None, 2, version=held.version)) is MISSING
+    assert cache.results.get(cache.get_result_key(embedding, None, 2, version=service._stores.version)) is not MISSING
+    service.release_stores(held)
+    service.close()
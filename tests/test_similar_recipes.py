@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src.indexing.local_vector_store import LocalVectorStore
+from src.indexing.similar_recipes import SimilarRecipes, build_similar_recipes, get_recipe_vectors
+
+DIM = 16
+K = 5
+
+
+def add_recipes(vector_store: LocalVectorStore, recipe_ids: list[int], rng: np.random.Generator) -> None:
+    """Add two chunks per recipe"""
+    vectors = rng.standard_normal((2 * len(recipe_ids), DIM)).astype(np.float32)
+    payloads, ids = [], []
+    for recipe_id in recipe_ids:
+        for chunk in range(2):
+            payloads.append(
+                {"page_content": f"chunk {chunk}", "metadata": {"dataset_name": "d", "recipe_id": str(recipe_id)}}
+            )
+            ids.append(f"{recipe_id}/{chunk}")
+    vector_store.add_vectors(vectors, payloads, ids)
+    vector_store.flush()
+
+
+def get_neighbors(graph: SimilarRecipes) -> dict:
+    """Neighbor recipe ids and rounded scores of every recipe"""
+    return {
+        recipe_id: [
+            (neighbor["recipe_id"], round(neighbor["score"], 4)) for neighbor in graph.similar(dataset_name, recipe_id)
+        ]
+        for dataset_name, recipe_id in graph.recipes
+    }
+
+
+@pytest.fixture
+def vector_store(tmp_path) -> LocalVectorStore:
+    vector_store = LocalVectorStore(str(tmp_path), "recipes", read_only=False, dtype="float32")
+    add_recipes(vector_store, list(range(200)), np.random.default_rng(0))
+    return vector_store
+
+
+def test_neighbors_against_brute_force(tmp_path, vector_store):
+    build_similar_recipes(vector_store, str(tmp_path / "similar"), K, block_size=64, num_workers=2)
+    graph = SimilarRecipes.load(str(tmp_path / "similar"))
+    keys, vectors = get_recipe_vectors(vector_store)
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    for row, (dataset_name, recipe_id) in enumerate(keys):
+        expected = [
+            (keys[neighbor][1], round(float(scores[row, neighbor]), 4)) for neighbor in np.argsort(-scores[row])[:K]
+        ]
+        neighbors = [
+            (neighbor["recipe_id"], round(neighbor["score"], 4)) for neighbor in graph.similar(dataset_name, recipe_id)
+        ]
+        assert neighbors == expected
+
+
+def test_incremental_update_equals_full_rebuild(tmp_path, vector_store):
+    directory = str(tmp_path / "similar")
+    build_similar_recipes(vector_store, directory, K, block_size=64, num_workers=2)
+    rng = np.random.default_rng(1)
+    # New recipes and a recipe whose chunks changed
+    add_recipes(vector_store, list(range(200, 230)) + [7], rng)
+
+    stats = build_similar_recipes(vector_store, directory, K, block_size=64, num_workers=2)
+    assert stats["num_recipes"] == 230
+    assert 0 < stats["num_recomputed"] < 230
+    assert stats["num_recomputed"] + stats["num_merged"] == 230
+    build_similar_recipes(vector_store, str(tmp_path / "full"), K, block_size=64, num_workers=2, full=True)
+    assert get_neighbors(SimilarRecipes.load(directory)) == get_neighbors(SimilarRecipes.load(str(tmp_path / "full")))
+
+
+def test_unknown_recipe_and_missing_graph(tmp_path, vector_store):
+    assert SimilarRecipes.load(str(tmp_path / "similar")) is None
+    build_similar_recipes(vector_store, str(tmp_path / "similar"), K, block_size=64, num_workers=1)
+    graph = SimilarRecipes.load(str(tmp_path / "similar"))
+    assert len(graph.similar("d", "0", k=2)) == 2
+    with pytest.raises(ValueError):
+        graph.similar("d", "unknown")